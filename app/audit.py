@@ -0,0 +1,162 @@
+from database import AsyncSessionLocal
+from config import settings
+from datetime import datetime, timezone
+import asyncio
+import logging
+import orjson
+import time
+
+
+## ACCESS AUDIT
+# Reads of patient data are audited without a write per request: record() appends the event
+# to an in-memory queue and returns, a background task COPYs the queue into audit_log in
+# batches of AUDIT_BATCH_SIZE events or every AUDIT_FLUSH_MS, whichever comes first.
+# stop() has the task hand over the batch it is building, then writes out everything still
+# queued (up to AUDIT_DRAIN_SECONDS). Events are never waited on: a full queue rejects them,
+# a failed flush or a drain that runs out of time drops them. Both are counted, so after stop()
+# enqueued == flushed + dropped; see /audit/stats.
+AUDIT_BATCH_SIZE = settings.audit_batch_size
+AUDIT_FLUSH_SECONDS = settings.audit_flush_ms / 1000
+AUDIT_QUEUE_MAX = settings.audit_queue_max
+AUDIT_DRAIN_SECONDS = settings.audit_drain_seconds
+
+AUDIT_COLUMNS = ('occurred_at', 'user_id', 'user_type', 'action', 'entity_id', 'detail')
+
+logger = logging.getLogger(__name__)
+
+
+class AuditQueue:
+    def __init__(self, batch_size, flush_seconds, max_queue):
+        self.batch_size = batch_size
+        self.flush_seconds = flush_seconds
+        self.queue = asyncio.Queue(maxsize=max_queue)
+        # Events taken off the queue and not yet written, the collector fills it, flush empties it
+        self.holding = []
+        self.task = None
+        self.closing = None
+        self.closed = False
+        self.enqueued = 0
+        self.rejected = 0
+        self.flushed = 0
+        self.dropped = 0
+        self.flush_errors = 0
+        self.last_flush_ms = None
+
+    def record(self, user, action, entity_id=None, **detail):
+        if self.closed:
+            self.rejected += 1
+            return
+        event = (
+            datetime.now(timezone.utc), user.user_id, user.user_type, action,
+            None if entity_id is None else str(entity_id),
+            orjson.dumps(detail).decode() if detail else None,
+        )
+        try:
+            self.queue.put_nowait(event)
+            self.enqueued += 1
+        except asyncio.QueueFull:
+            self.rejected += 1
+
+    async def _get(self, timeout):
+        # Next event, or None once `timeout` seconds (None: no limit) pass or stop() is called
+        if not self.queue.empty():
+            return self.queue.get_nowait()
+        getter = asyncio.ensure_future(self.queue.get())
+        done, _ = await asyncio.wait({getter, self.closing}, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+        if getter in done:
+            return getter.result()
+        # Queue.get only takes the item after it resumes, cancelling it loses nothing
+        getter.cancel()
+        return None
+
+    async def _collect(self):
+        # Waits for a first event, then takes more until the batch is full or the time is up
+        event = await self._get(None)
+        if event is None:
+            return
+        self.holding.append(event)
+        deadline = time.monotonic() + self.flush_seconds
+        while len(self.holding) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return
+            event = await self._get(remaining)
+            if event is None:
+                return
+            self.holding.append(event)
+
+    async def flush(self, batch):
+        started = time.perf_counter()
+        try:
+            async with AsyncSessionLocal() as db:
+                connection = await (await db.connection()).get_raw_connection()
+                await connection.driver_connection.copy_records_to_table(
+                    'audit_log', records=batch, columns=AUDIT_COLUMNS,
+                )
+                await db.commit()
+            self.flushed += len(batch)
+        except Exception:
+            self.flush_errors += 1
+            self.dropped += len(batch)
+            logger.exception("audit flush failed, %d events dropped", len(batch))
+        self.last_flush_ms = (time.perf_counter() - started) * 1000
+
+    async def _flush_holding(self):
+        # A flush cancelled half way leaves `holding` set, stop() counts it as dropped
+        await self.flush(self.holding)
+        self.holding = []
+
+    async def _run(self):
+        while not self.closing.done():
+            await self._collect()
+            if self.holding:
+                await self._flush_holding()
+
+    def start(self):
+        if self.task is None:
+            self.closed = False
+            self.closing = asyncio.get_running_loop().create_future()
+            self.task = asyncio.create_task(self._run())
+
+    async def _drain(self):
+        if self.task is not None:
+            await self.task
+        while not self.queue.empty():
+            self.holding = [self.queue.get_nowait() for _ in range(min(self.batch_size, self.queue.qsize()))]
+            await self._flush_holding()
+
+    async def stop(self):
+        # The collector returns the batch it holds and the task ends, then the queue is drained.
+        # Events still arriving meanwhile are drained too, after stop() they are rejected.
+        if self.closing is not None and not self.closing.done():
+            self.closing.set_result(None)
+        try:
+            await asyncio.wait_for(self._drain(), AUDIT_DRAIN_SECONDS)
+        except asyncio.TimeoutError:
+            logger.error("audit drain did not finish in %ss", AUDIT_DRAIN_SECONDS)
+        self.closed = True
+        self.task = None
+
+        lost = self.holding + [self.queue.get_nowait() for _ in range(self.queue.qsize())]
+        self.holding = []
+        if lost:
+            self.dropped += len(lost)
+            logger.error("%d audit events dropped at shutdown", len(lost))
+
+    def stats(self):
+        return {
+            "queue_depth": self.queue.qsize() + len(self.holding),
+            "queue_max": self.queue.maxsize,
+            "enqueued": self.enqueued,
+            "rejected": self.rejected,
+            "flushed": self.flushed,
+            "dropped": self.dropped,
+            "flush_errors": self.flush_errors,
+            "last_flush_ms": self.last_flush_ms,
+        }
+
+audit_log = AuditQueue(AUDIT_BATCH_SIZE, AUDIT_FLUSH_SECONDS, AUDIT_QUEUE_MAX)
+
+
+def record(user, action, entity_id=None, **detail):
+    audit_log.record(user, action, entity_id, **detail)
@@ -0,0 +1,53 @@
+from sqlalchemy import func, select
+from database import AsyncSessionLocal
+from models import User
+from jwt import encode
+from config import settings
+import dependencies
+import argparse
+import asyncio
+import statistics
+import time
+
+
+## AUTH OVERHEAD BENCHMARK
+# Times get_current_user in process for one existing user, N calls per AUTH_MODE, and reports
+# the cost per request. 'db' queries the user table every call, 'cache' hits the identity cache.
+#   python auth_benchmark.py --email admin@example.com --calls 5000
+AUTH_MODES = ('db', 'cache', 'claims')
+
+
+async def measure(db, authorization, calls):
+    latencies = []
+    for _ in range(calls):
+        started = time.perf_counter()
+        await dependencies.get_current_user(authorization, db)
+        latencies.append((time.perf_counter() - started) * 1_000_000)
+    return latencies
+
+async def main(args):
+    async with AsyncSessionLocal() as db:
+        user = (await db.scalars(select(User).where(func.lower(User.user_email) == func.lower(args.email)))).first()
+        if user is None:
+            raise SystemExit(f"no user {args.email}")
+        token = encode({"sub": user.user_email, "uid": str(user.user_id), "utype": user.user_type},
+                       settings.secret_key, algorithm=settings.algorithm)
+        authorization = f"Bearer {token}"
+
+        for mode in args.modes:
+            dependencies.AUTH_MODE = mode
+            dependencies.identity_cache.entries.clear()
+            await measure(db, authorization, min(100, args.calls))
+            latencies = sorted(await measure(db, authorization, args.calls))
+            p99 = latencies[min(len(latencies) - 1, int(0.99 * len(latencies)))]
+            print(f"{mode:7} {args.calls} calls  mean {statistics.fmean(latencies):8.1f}us  "
+                  f"p50 {statistics.median(latencies):8.1f}us  p99 {p99:8.1f}us")
+    print(f"identity cache: {dependencies.identity_cache.stats()}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="get_current_user cost per request by AUTH_MODE")
+    parser.add_argument('--email', required=True)
+    parser.add_argument('--calls', type=int, default=5000)
+    parser.add_argument('--modes', nargs='+', choices=AUTH_MODES, default=['db', 'cache'])
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,257 @@
+from fastapi import HTTPException
+from pydantic import BaseModel, BeforeValidator, EmailStr, ValidationError, constr, model_validator
+from sqlalchemy import text
+from starlette.concurrency import run_in_threadpool
+from database import AsyncSessionLocal
+from hashing import get_password_hashes
+import patient_summary
+import change_log
+from datetime import date, datetime
+from itertools import islice
+from typing import Annotated, Optional, Union
+import argparse
+import asyncio
+import csv
+import io
+import orjson
+import uuid
+
+
+## BULK PATIENT IMPORT
+# CSV (header row) or NDJSON, one patient with its user per row. Rows are validated and hashed
+# in batches, COPY'd into a temp staging table and merged into "user"/patient with a handful of
+# set-based statements, all in one transaction. Bad rows are reported, the rest is imported.
+#   python bulk_import.py patients.csv
+IMPORT_BATCH_SIZE = 5000
+IMPORT_ERROR_LIMIT = 1000
+IMPORT_FORMATS = ('csv', 'ndjson')
+
+# Same meaning as the /patient/new form: digits are a unix timestamp, otherwise an ISO date
+Dob = Annotated[
+    Union[datetime, date],
+    BeforeValidator(lambda value: datetime.fromtimestamp(int(value)) if str(value).isdigit() else value),
+]
+
+# national_id, phone_num and relative_phone are integer columns: digits only, within int4
+INT4_MAX = 2**31 - 1
+
+def _int4_digits(value):
+    value = str(value).strip()
+    if not (value.isascii() and value.isdigit()):
+        raise ValueError("must contain digits only")
+    if int(value) > INT4_MAX:
+        raise ValueError(f"must be at most {INT4_MAX}")
+    return value
+
+Digits = Annotated[str, BeforeValidator(_int4_digits)]
+
+STAGING_COLUMNS = (
+    'row_no', 'user_id', 'user_name', 'user_email', 'password', 'patient_id', 'name', 'dob',
+    'national_id', 'sex', 'phone_num', 'address', 'alias', 'relative_phone', 'insurance_id',
+)
+
+
+class PatientImportRow(BaseModel):
+    email: EmailStr
+    user_name: constr(max_length=25)
+    password: Optional[str] = None
+    # Already bcrypt-hashed passwords (e.g. from another system) skip hashing
+    password_hash: Optional[str] = None
+    name: str
+    dob: Dob
+    national_id: Optional[Digits] = None
+    sex: Optional[bool] = None
+    phone_num: Digits
+    address: Optional[str] = None
+    alias: Optional[str] = None
+    relative_phone: Optional[Digits] = None
+    insurance_id: Optional[uuid.UUID] = None
+
+    @model_validator(mode='after')
+    def check_password(self):
+        if self.password_hash is not None:
+            if not self.password_hash.startswith(('$2a$', '$2b$', '$2y$')):
+                raise ValueError("password_hash must be a bcrypt hash")
+        elif not self.password:
+            raise ValueError("password or password_hash is required")
+        return self
+
+
+class ImportLog:
+    def __init__(self):
+        self.received = 0
+        self.imported = 0
+        self.failed = 0
+        self.errors = []
+
+    def error(self, row_no, message):
+        self.failed += 1
+        if len(self.errors) < IMPORT_ERROR_LIMIT:
+            self.errors.append({"row": row_no, "error": message})
+
+    def as_dict(self):
+        return {
+            "received": self.received,
+            "imported": self.imported,
+            "failed": self.failed,
+            "errors": sorted(self.errors, key=lambda error: error["row"]),
+        }
+
+
+def detect_format(filename, requested=None):
+    fmt = requested or ('ndjson' if (filename or '').endswith(('.ndjson', '.jsonl')) else 'csv')
+    if fmt not in IMPORT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"Unsupported import format {fmt}, use one of {IMPORT_FORMATS}")
+    return fmt
+
+def read_rows(source, fmt):
+    # source is a binary file, yields (row number, dict or parse error), row numbers start at 1
+    reader = io.TextIOWrapper(source, encoding='utf-8-sig', newline='')
+    if fmt == 'csv':
+        for row_no, row in enumerate(csv.DictReader(reader), start=1):
+            yield row_no, {key: value for key, value in row.items() if value != ''}
+        return
+    row_no = 0
+    for line in reader:
+        if not line.strip():
+            continue
+        row_no += 1
+        try:
+            yield row_no, orjson.loads(line)
+        except orjson.JSONDecodeError as e:
+            yield row_no, e
+
+def validate_batch(batch, report):
+    valid = []
+    for row_no, row in batch:
+        if isinstance(row, Exception):
+            report.error(row_no, f"Invalid JSON: {row}")
+            continue
+        try:
+            valid.append((row_no, PatientImportRow.model_validate(row)))
+        except ValidationError as e:
+            report.error(row_no, "; ".join(f"{'.'.join(map(str, err['loc'])) or 'row'}: {err['msg']}" for err in e.errors()))
+    return valid
+
+def staging_csv(rows, password_hashes):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for (row_no, row), password_hash in zip(rows, password_hashes):
+        writer.writerow([
+            row_no, uuid.uuid4(), row.user_name, row.email, password_hash, uuid.uuid4(), row.name,
+            row.dob.isoformat(), row.national_id, row.sex, row.phone_num, row.address, row.alias,
+            row.relative_phone, row.insurance_id,
+        ])
+    return io.BytesIO(buffer.getvalue().encode())
+
+
+async def _stage(db):
+    # Staging columns take their types from the live tables, so COPY parses values exactly
+    # the way an INSERT into "user"/patient would
+    await db.execute(text("""
+        CREATE TEMP TABLE import_patient ON COMMIT DROP AS
+        SELECT 0 AS row_no, u.user_id, u.user_name, u.user_email, u.password,
+               p.patient_id, p.name, p.dob, p.national_id, p.sex, p.phone_num,
+               p.address, p.alias, p.relative_phone, p.insurance_id
+        FROM "user" u CROSS JOIN patient p
+        WITH NO DATA
+    """))
+
+async def _copy_batch(db, rows, password_hashes, report):
+    source = await run_in_threadpool(staging_csv, rows, password_hashes)
+    connection = await (await db.connection()).get_raw_connection()
+    try:
+        async with db.begin_nested():
+            await connection.driver_connection.copy_to_table(
+                'import_patient', source=source, columns=STAGING_COLUMNS, format='csv',
+            )
+    except Exception as e:
+        # Rows are validated against the column types first, this only catches the unexpected.
+        # It fails the whole COPY, so the batch is reported instead of aborting the import
+        for row_no, _ in rows:
+            report.error(row_no, f"Batch rejected by the database: {e}")
+
+async def _reject(db, report, sql, message):
+    for row_no in (await db.execute(text(sql))).scalars().all():
+        report.error(row_no, message)
+
+async def _merge(db, report):
+    await db.execute(text("CREATE INDEX ON import_patient (lower(user_email))"))
+    await db.execute(text("ANALYZE import_patient"))
+
+    await _reject(db, report, """
+        DELETE FROM import_patient s USING import_patient f
+        WHERE lower(s.user_email) = lower(f.user_email) AND s.row_no > f.row_no
+        RETURNING s.row_no
+    """, "Email appears earlier in the file")
+    await _reject(db, report, """
+        DELETE FROM import_patient s USING "user" u
+        WHERE lower(u.user_email) = lower(s.user_email)
+        RETURNING s.row_no
+    """, "Email already registered")
+    await _reject(db, report, """
+        DELETE FROM import_patient s
+        WHERE s.insurance_id IS NOT NULL
+          AND NOT EXISTS (SELECT 1 FROM insurance i WHERE i.insurance_id = s.insurance_id)
+        RETURNING s.row_no
+    """, "Insurance not found")
+
+    # ON CONFLICT covers an email registered concurrently since the check above
+    imported = (await db.execute(text("""
+        WITH new_user AS (
+            INSERT INTO "user" (user_id, user_name, user_email, password, user_type)
+            SELECT user_id, user_name, user_email, password, 4 FROM import_patient
+            ON CONFLICT DO NOTHING
+            RETURNING user_id
+        )
+        INSERT INTO patient (patient_id, user_id, name, dob, national_id, sex, phone_num,
+                             address, alias, relative_phone, insurance_id)
+        SELECT s.patient_id, s.user_id, s.name, s.dob, s.national_id, s.sex, s.phone_num,
+               s.address, s.alias, s.relative_phone, s.insurance_id
+        FROM import_patient s JOIN new_user USING (user_id)
+        RETURNING patient_id
+    """))).scalars().all()
+    report.imported = len(imported)
+    await patient_summary.refresh_patients(db, imported)
+    await change_log.record_many(db, 'patient', 'insert', [
+        {'entity_id': patient_id, 'patient_id': patient_id} for patient_id in imported
+    ])
+
+    await _reject(db, report, """
+        SELECT s.row_no FROM import_patient s
+        WHERE NOT EXISTS (SELECT 1 FROM patient p WHERE p.patient_id = s.patient_id)
+    """, "Email already registered")
+
+async def import_patients(db, source, fmt):
+    report = ImportLog()
+    rows = read_rows(source, fmt)
+    await _stage(db)
+
+    while batch := await run_in_threadpool(lambda: list(islice(rows, IMPORT_BATCH_SIZE))):
+        report.received += len(batch)
+        valid = await run_in_threadpool(validate_batch, batch, report)
+        if not valid:
+            continue
+
+        to_hash = [row.password for _, row in valid if row.password_hash is None]
+        hashed = iter(await get_password_hashes(to_hash))
+        password_hashes = [row.password_hash or next(hashed) for _, row in valid]
+        await _copy_batch(db, valid, password_hashes, report)
+
+    await _merge(db, report)
+    await db.commit()
+    return report.as_dict()
+
+
+async def _main(args):
+    with open(args.path, 'rb') as source:
+        async with AsyncSessionLocal() as db:
+            report = await import_patients(db, source, detect_format(args.path, args.format))
+    print(orjson.dumps(report, option=orjson.OPT_INDENT_2).decode())
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Bulk import patients from CSV or NDJSON")
+    parser.add_argument('path')
+    parser.add_argument('--format', choices=IMPORT_FORMATS)
+    asyncio.run(_main(parser.parse_args()))
@@ -0,0 +1,129 @@
+from fastapi import HTTPException
+from sqlalchemy import select, text
+from models import ChangeLog, ClinicalEntry, LabReport, MedicalNote, MedicalRecord, Patient
+from pagination import decode_cursor, encode_cursor
+import schema
+
+
+## CHANGE LOG
+# Append-only log of EMR inserts and updates for incremental sync (GET /changes). Each write
+# endpoint calls record()/record_many() right before its commit, so the log row commits or
+# rolls back with the change itself. Rows are numbered by a sequence, and the sequence value
+# is taken under a transaction-level advisory lock held until commit. That makes commit order
+# equal seq order, so a reader never sees seq N+1 before N and a cursor can never skip a change.
+# The lock only covers the log insert and the commit, the writes before it run in parallel.
+#
+# Logging a change also bumps the version of what contains it: the medical_record for notes,
+# entries and lab reports, the patient for patient changes and new records. GET /patient/{id}
+# and GET /emr/{id} derive their ETags from these versions.
+CHANGE_LOG_LOCK = 0x63686c67
+CHANGE_FEED_CURSOR = 'changes'
+CHANGE_FEED_LIMIT_MAX = 1000
+
+# entity name -> (model, primary key, response schema)
+ENTITIES = {
+    'patient': (Patient, Patient.patient_id, schema.Patient),
+    'medical_record': (MedicalRecord, MedicalRecord.record_id, schema.MedicalRecord),
+    'medical_note': (MedicalNote, MedicalNote.note_id, schema.MedicalNote),
+    'clinical_entry': (ClinicalEntry, ClinicalEntry.entry_id, schema.ClinicalEntry),
+    'lab_report': (LabReport, LabReport.report_id, schema.LabReport),
+}
+
+# Rows are locked in key order so concurrent bumps of overlapping sets cannot deadlock
+_BUMP_RECORDS = text("""
+    UPDATE medical_record SET version = version + 1
+    WHERE record_id IN (
+        SELECT record_id FROM medical_record WHERE record_id = ANY(CAST(:ids AS uuid[]))
+        ORDER BY record_id FOR NO KEY UPDATE
+    )
+""")
+_BUMP_PATIENTS = text("""
+    UPDATE patient SET version = version + 1
+    WHERE patient_id IN (
+        SELECT patient_id FROM patient WHERE patient_id = ANY(CAST(:ids AS uuid[]))
+        ORDER BY patient_id FOR NO KEY UPDATE
+    )
+""")
+
+# patient_id comes from the record when the caller only knows the record
+_INSERT = text("""
+    INSERT INTO change_log (entity, op, entity_id, record_id, patient_id)
+    SELECT :entity, :op, CAST(:entity_id AS uuid), CAST(:record_id AS uuid),
+           COALESCE(CAST(:patient_id AS uuid),
+                    (SELECT patient_id FROM medical_record WHERE record_id = CAST(:record_id AS uuid)))
+""")
+
+
+async def record_many(db, entity, op, changes):
+    # changes: dicts with entity_id and record_id and/or patient_id
+    if not changes:
+        return
+    # Pending ORM objects (autoflush is off) first, the insert may look their record up
+    await db.flush()
+
+    if entity in ('patient', 'medical_record'):
+        container, bump = 'patient_id', _BUMP_PATIENTS
+    else:
+        container, bump = 'record_id', _BUMP_RECORDS
+    ids = sorted({str(change[container]) for change in changes if change.get(container) is not None})
+    if ids:
+        await db.execute(bump, {'ids': ids})
+
+    await db.execute(text("SELECT pg_advisory_xact_lock(:key)"), {'key': CHANGE_LOG_LOCK})
+    await db.execute(_INSERT, [
+        {
+            'entity': entity, 'op': op, 'entity_id': str(change['entity_id']),
+            'record_id': None if change.get('record_id') is None else str(change['record_id']),
+            'patient_id': None if change.get('patient_id') is None else str(change['patient_id']),
+        }
+        for change in changes
+    ])
+
+async def record(db, entity, op, entity_id, record_id=None, patient_id=None):
+    await record_many(db, entity, op, [{'entity_id': entity_id, 'record_id': record_id, 'patient_id': patient_id}])
+
+
+async def read_changes(db, cursor, limit, entities=None, patient_ids=None):
+    # patient_ids limits the feed to those patients (patient users), None means everything
+    after = decode_cursor(cursor, CHANGE_FEED_CURSOR)[0] if cursor else 0
+    stmt = select(ChangeLog).where(ChangeLog.seq > after)
+    if entities:
+        stmt = stmt.where(ChangeLog.entity.in_(entities))
+    if patient_ids is not None:
+        stmt = stmt.where(ChangeLog.patient_id.in_(patient_ids))
+    changes = (await db.scalars(stmt.order_by(ChangeLog.seq).limit(limit + 1))).all()
+    has_more = len(changes) > limit
+    changes = changes[:limit]
+
+    # Current state of every changed row, one query per entity type
+    current = {}
+    for entity in {change.entity for change in changes}:
+        model, key, _ = ENTITIES[entity]
+        ids = {change.entity_id for change in changes if change.entity == entity}
+        for row in (await db.scalars(select(model).where(key.in_(ids)))).all():
+            current[(entity, getattr(row, key.key))] = row
+
+    items = []
+    for change in changes:
+        row = current.get((change.entity, change.entity_id))
+        items.append({
+            "seq": change.seq,
+            "entity": change.entity,
+            "op": change.op,
+            "entity_id": change.entity_id,
+            "patient_id": change.patient_id,
+            "changed_at": change.changed_at,
+            "data": None if row is None else ENTITIES[change.entity][2].model_validate(row),
+        })
+
+    last_seq = changes[-1].seq if changes else after
+    return {"items": items, "next_cursor": encode_cursor(CHANGE_FEED_CURSOR, [last_seq]), "has_more": has_more}
+
+def parse_entities(entity):
+    if not entity:
+        return None
+    entities = entity.split(',')
+    unknown = set(entities) - set(ENTITIES)
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown entities {sorted(unknown)}, use {sorted(ENTITIES)}")
+    return entities
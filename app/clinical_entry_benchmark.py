@@ -0,0 +1,79 @@
+import aiohttp
+import argparse
+import asyncio
+import random
+import time
+
+
+## CLINICAL ENTRY INGEST BENCHMARK
+# Posts N vitals entries one at a time through POST /emr/new-clinical-entry (with some
+# concurrency, like a ward of monitors) and then as one POST /emr/clinical-entries array,
+# and reports entries per second for both.
+#   python clinical_entry_benchmark.py --token <staff token> --record-id <id> --staff-id <id>
+
+
+def vitals(rng):
+    return {
+        "height": rng.randint(150, 190),
+        "weight": rng.randint(45, 110),
+        "body_temp": round(rng.uniform(36.0, 38.5), 1),
+        "systolic": rng.randint(95, 160),
+        "diastolic": rng.randint(60, 100),
+        "pulse": rng.randint(55, 120),
+    }
+
+async def post_single(session, base_url, form, semaphore):
+    async with semaphore:
+        async with session.post(f"{base_url}/emr/new-clinical-entry", data=form) as response:
+            await response.read()
+            return response.status
+
+async def run_single(session, args, entries):
+    semaphore = asyncio.Semaphore(args.concurrency)
+    started = time.perf_counter()
+    statuses = await asyncio.gather(*(
+        post_single(session, args.base_url, {key: str(value) for key, value in entry.items()}, semaphore)
+        for entry in entries
+    ))
+    elapsed = time.perf_counter() - started
+    return elapsed, sum(status != 200 for status in statuses)
+
+async def run_batch(session, args, entries):
+    started = time.perf_counter()
+    async with session.post(f"{args.base_url}/emr/clinical-entries", json=entries) as response:
+        body = await response.json()
+    elapsed = time.perf_counter() - started
+    if response.status != 200:
+        return elapsed, len(entries)
+    return elapsed, body["failed"]
+
+async def main(args):
+    rng = random.Random(0)
+    now = int(time.time())
+    entries = [
+        {"record_id": args.record_id, "staff_id": args.staff_id, "entry_date": now, **vitals(rng)}
+        for _ in range(args.entries)
+    ]
+
+    headers = {'Authorization': f"Bearer {args.token}"}
+    async with aiohttp.ClientSession(headers=headers, timeout=aiohttp.ClientTimeout(total=None)) as session:
+        results = []
+        if not args.skip_single:
+            results.append((f"single (concurrency {args.concurrency})", *await run_single(session, args, entries)))
+        results.append(("batch", *await run_batch(session, args, entries)))
+
+    for label, elapsed, failed in results:
+        print(f"{label:28} {args.entries} entries in {elapsed:7.2f}s  "
+              f"{args.entries / elapsed:9.0f} entries/s  {failed} failed")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Clinical entry ingest benchmark")
+    parser.add_argument('--base-url', default='http://localhost:8000')
+    parser.add_argument('--token', required=True)
+    parser.add_argument('--record-id', required=True)
+    parser.add_argument('--staff-id', required=True)
+    parser.add_argument('--entries', type=int, default=10000)
+    parser.add_argument('--concurrency', type=int, default=20)
+    parser.add_argument('--skip-single', action='store_true')
+    asyncio.run(main(parser.parse_args()))
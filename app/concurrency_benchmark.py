@@ -0,0 +1,65 @@
+import aiohttp
+import argparse
+import asyncio
+import statistics
+import time
+
+
+## CONCURRENCY BENCHMARK
+# Keeps C clients busy on one GET endpoint for a fixed time and reports throughput and
+# latency, for each requested concurrency. Run it against a server started from the commit
+# before the async database layer and again from this tree to compare the two:
+#   python concurrency_benchmark.py --token <admin token> --path /patient/<id> --clients 50 200
+
+
+async def client(session, url, deadline, latencies, errors):
+    while time.perf_counter() < deadline:
+        started = time.perf_counter()
+        try:
+            async with session.get(url) as response:
+                await response.read()
+                if response.status != 200:
+                    errors.append(response.status)
+                    continue
+        except aiohttp.ClientError as e:
+            errors.append(e.__class__.__name__)
+            continue
+        latencies.append((time.perf_counter() - started) * 1000)
+
+async def run(args, clients):
+    headers = {'Authorization': f"Bearer {args.token}"}
+    # One connection per client, the default pool (100) would cap the concurrency
+    connector = aiohttp.TCPConnector(limit=clients)
+    timeout = aiohttp.ClientTimeout(total=None)
+    latencies, errors = [], []
+    async with aiohttp.ClientSession(headers=headers, connector=connector, timeout=timeout) as session:
+        url = f"{args.base_url}{args.path}"
+        # Warm up the connection pools on both sides
+        await asyncio.gather(*(client(session, url, time.perf_counter() + 1, [], []) for _ in range(clients)))
+        started = time.perf_counter()
+        deadline = started + args.seconds
+        await asyncio.gather(*(client(session, url, deadline, latencies, errors) for _ in range(clients)))
+        elapsed = time.perf_counter() - started
+    return elapsed, latencies, errors
+
+async def main(args):
+    print(f"GET {args.path} for {args.seconds}s per run")
+    for clients in args.clients:
+        elapsed, latencies, errors = await run(args, clients)
+        if not latencies:
+            print(f"{clients:4} clients: no successful requests, {len(errors)} errors")
+            continue
+        ordered = sorted(latencies)
+        p99 = ordered[min(len(ordered) - 1, int(0.99 * len(ordered)))]
+        print(f"{clients:4} clients: {len(ordered) / elapsed:8.0f} req/s  p50 {statistics.median(ordered):7.1f}ms  "
+              f"p99 {p99:7.1f}ms  {len(errors)} errors")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Throughput at a fixed number of concurrent clients")
+    parser.add_argument('--base-url', default='http://localhost:8000')
+    parser.add_argument('--token', required=True)
+    parser.add_argument('--path', required=True)
+    parser.add_argument('--clients', type=int, nargs='+', default=[50, 200])
+    parser.add_argument('--seconds', type=float, default=20)
+    asyncio.run(main(parser.parse_args()))
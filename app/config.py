@@ -0,0 +1,74 @@
+from dataclasses import dataclass
+import os
+from dotenv import load_dotenv
+
+
+## SETTINGS
+# The only place that reads .env and the environment, every module imports `settings`
+@dataclass(frozen=True)
+class Settings:
+    database_url: str
+    db_pool_size: int
+    db_max_overflow: int
+    secret_key: str
+    algorithm: str
+    access_token_expire_hours: int
+    auth_mode: str
+    token_version_refresh_seconds: float
+    identity_cache_size: int
+    identity_cache_ttl_seconds: float
+    hash_pool_workers: int
+    hash_queue_limit: int
+    hash_timeout_seconds: float
+    stream_batch_size: int
+    asset_storage: str
+    attachment_storage: str
+    attachment_max_bytes: int
+    attachment_fsync: bool
+    startup_import_budget_ms: float
+    refdata_ttl_seconds: float
+    vitals_batch_size: int
+    vitals_flush_ms: float
+    vitals_max_pending: int
+    note_search_config: str
+    audit_batch_size: int
+    audit_flush_ms: float
+    audit_queue_max: int
+    audit_drain_seconds: float
+
+    @classmethod
+    def from_env(cls, env=os.environ):
+        return cls(
+            database_url=env['DATABASE_URL'],
+            db_pool_size=int(env.get('DB_POOL_SIZE', 20)),
+            db_max_overflow=int(env.get('DB_MAX_OVERFLOW', 10)),
+            secret_key=env['SECRET_KEY'],
+            algorithm=env['ALGORITHM'],
+            access_token_expire_hours=int(env['ACCESS_TOKEN_EXPIRE_HOURS']),
+            auth_mode=env.get('AUTH_MODE', 'db'),
+            token_version_refresh_seconds=float(env.get('TOKEN_VERSION_REFRESH_SECONDS', 30)),
+            identity_cache_size=int(env.get('IDENTITY_CACHE_SIZE', 10000)),
+            identity_cache_ttl_seconds=float(env.get('IDENTITY_CACHE_TTL_SECONDS', 60)),
+            hash_pool_workers=int(env.get('HASH_POOL_WORKERS', os.cpu_count() or 1)),
+            hash_queue_limit=int(env.get('HASH_QUEUE_LIMIT', 64)),
+            hash_timeout_seconds=float(env.get('HASH_TIMEOUT_SECONDS', 5)),
+            stream_batch_size=int(env.get('STREAM_BATCH_SIZE', 1000)),
+            asset_storage=env['ASSET_STORAGE'],
+            attachment_storage=env.get('ATTACHMENT_STORAGE', 'attachments'),
+            attachment_max_bytes=int(env.get('ATTACHMENT_MAX_BYTES', 512 * 1024 * 1024)),
+            attachment_fsync=env.get('ATTACHMENT_FSYNC', 'true').lower() in ('1', 'true', 'yes'),
+            startup_import_budget_ms=float(env.get('STARTUP_IMPORT_BUDGET_MS', 1500)),
+            refdata_ttl_seconds=float(env.get('REFDATA_TTL_SECONDS', 300)),
+            vitals_batch_size=int(env.get('VITALS_BATCH_SIZE', 500)),
+            vitals_flush_ms=float(env.get('VITALS_FLUSH_MS', 200)),
+            vitals_max_pending=int(env.get('VITALS_MAX_PENDING', 5000)),
+            note_search_config=env.get('NOTE_SEARCH_CONFIG', 'simple'),
+            audit_batch_size=int(env.get('AUDIT_BATCH_SIZE', 500)),
+            audit_flush_ms=float(env.get('AUDIT_FLUSH_MS', 1000)),
+            audit_queue_max=int(env.get('AUDIT_QUEUE_MAX', 50000)),
+            audit_drain_seconds=float(env.get('AUDIT_DRAIN_SECONDS', 10)),
+        )
+
+
+load_dotenv('.env')
+settings = Settings.from_env()
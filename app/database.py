@@ -1,10 +1,28 @@
 from sqlalchemy import create_engine
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlalchemy.orm import sessionmaker
-import os
-from dotenv import load_dotenv
+from config import settings
 
-load_dotenv('.env')
+## DATABASE URLS
+# DATABASE_URL may be given with either driver (postgresql://, postgresql+psycopg2://
+# or postgresql+asyncpg://). The API always talks to Postgres through asyncpg, the
+# blocking psycopg2 engine is kept for offline tooling (migrations, scripts).
+database_url = make_url(settings.database_url)
+ASYNC_DATABASE_URL = database_url.set(drivername='postgresql+asyncpg')
+SYNC_DATABASE_URL = database_url.set(drivername='postgresql+psycopg2')
 
-engine = create_engine(os.environ['DATABASE_URL'])
+## ASYNC ENGINE (used by the routers)
+async_engine = create_async_engine(
+    ASYNC_DATABASE_URL,
+    pool_size=settings.db_pool_size,
+    max_overflow=settings.db_max_overflow,
+    pool_pre_ping=True,
+)
+# expire_on_commit=False: handlers keep reading attributes after commit, and an
+# expired attribute would need implicit IO which AsyncSession does not allow
+AsyncSessionLocal = async_sessionmaker(bind=async_engine, autoflush=False, expire_on_commit=False)
+
+## SYNC ENGINE (offline tooling only, never use inside a request handler)
+engine = create_engine(SYNC_DATABASE_URL)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
- 
\ No newline at end of file
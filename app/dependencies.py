@@ -1,27 +1,37 @@
 from fastapi import Depends
-from database import SessionLocal
+from database import AsyncSessionLocal
+from config import settings
 from fastapi import FastAPI, Header, HTTPException
 from fastapi.security import APIKeyHeader
 from jwt import decode, InvalidTokenError
 from typing import Optional
-import os
-from dotenv import load_dotenv
+from dataclasses import dataclass
+from cachetools import TTLCache
+from sqlalchemy import func, select
+from sqlalchemy.dialects.postgresql import insert
+import asyncio
+import time
+import uuid
 from models import *
 
 app = FastAPI()
 
-load_dotenv('.env')
-
 # Secret key for decoding JWT
-SECRET_KEY = os.environ['SECRET_KEY']
-ALGORITHM = os.environ['ALGORITHM']
+SECRET_KEY = settings.secret_key
+ALGORITHM = settings.algorithm
 
-def get_db():
-    db = SessionLocal()
-    try:
+## AUTH MODE
+# 'db'     : every request loads the User row matching the token subject
+# 'claims' : the caller is rebuilt from the signed uid/utype claims without a query
+# 'cache'  : like 'db', but users are kept in an in-process TTL/LRU cache
+AUTH_MODE = settings.auth_mode
+TOKEN_VERSION_REFRESH_SECONDS = settings.token_version_refresh_seconds
+IDENTITY_CACHE_SIZE = settings.identity_cache_size
+IDENTITY_CACHE_TTL_SECONDS = settings.identity_cache_ttl_seconds
+
+async def get_db():
+    async with AsyncSessionLocal() as db:
         yield db
-    finally:
-        db.close()
 
 
 # X_API_KEY = APIKeyHeader(name='X-API-Key')
@@ -47,6 +57,94 @@ def get_db():
 #     except InvalidTokenError:
 #         raise HTTPException(status_code=401, detail="Invalid token")
 
+@dataclass(frozen=True)
+class Principal:
+    # Exposes the same attributes the routers read from User
+    user_id: uuid.UUID
+    user_email: str
+    user_type: int
+
+
+class TokenVersionTable:
+    # In-process copy of token_version. Only users whose tokens were revoked have a
+    # row, so the whole table is reloaded at most every TOKEN_VERSION_REFRESH_SECONDS.
+    def __init__(self, refresh_seconds):
+        self.refresh_seconds = refresh_seconds
+        self.versions = {}
+        self.loaded_at = None
+        self.lock = asyncio.Lock()
+
+    def is_stale(self):
+        return self.loaded_at is None or time.monotonic() - self.loaded_at > self.refresh_seconds
+
+    def expire(self):
+        self.loaded_at = None
+
+    async def current(self, db, user_id):
+        if self.is_stale():
+            async with self.lock:
+                if self.is_stale():
+                    rows = (await db.execute(select(TokenVersion.user_id, TokenVersion.version))).all()
+                    self.versions = {str(row_user_id): version for row_user_id, version in rows}
+                    self.loaded_at = time.monotonic()
+        return self.versions.get(str(user_id), 0)
+
+token_versions = TokenVersionTable(TOKEN_VERSION_REFRESH_SECONDS)
+
+
+class IdentityCache:
+    # Users keyed by email. Entries are frozen Principals, never ORM instances, so
+    # they are detached from any session and safe to share between requests.
+    def __init__(self, maxsize, ttl):
+        self.entries = TTLCache(maxsize=maxsize, ttl=ttl)
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, user_email):
+        principal = self.entries.get(user_email)
+        if principal is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return principal
+
+    def put(self, principal):
+        self.entries[principal.user_email] = principal
+
+    def invalidate(self, user_email):
+        self.entries.pop(user_email, None)
+
+    def stats(self):
+        return {
+            "size": len(self.entries),
+            "maxsize": self.entries.maxsize,
+            "ttl": self.entries.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+identity_cache = IdentityCache(IDENTITY_CACHE_SIZE, IDENTITY_CACHE_TTL_SECONDS)
+
+
+def invalidate_user(user_email):
+    # Call whenever a user row is created or changed
+    identity_cache.invalidate(user_email)
+
+
+async def get_token_version(db, user_id):
+    return await token_versions.current(db, user_id)
+
+async def revoke_tokens(db, user_id):
+    # Bumping the version invalidates every token issued to the user so far
+    stmt = insert(TokenVersion).values(user_id=user_id, version=1).on_conflict_do_update(
+        index_elements=[TokenVersion.user_id],
+        set_={'version': TokenVersion.version + 1},
+    )
+    await db.execute(stmt)
+    await db.commit()
+    token_versions.expire()
+
+
 async def get_current_user(authorization: str = Header(...), db=Depends(get_db)):
     if authorization is None or not authorization.startswith("Bearer "):
         raise HTTPException(status_code=401, detail="Authorization header with Bearer token required")
@@ -57,11 +155,29 @@ async def get_current_user(authorization: str = Header(...), db=Depends(get_db))
         payload = decode(token, SECRET_KEY, algorithms=ALGORITHM)
         user_email = payload.get("sub")
 
+        # Reject tokens issued before the user's tokens were revoked
+        if "ver" in payload and payload["ver"] < await token_versions.current(db, payload.get("uid")):
+            raise HTTPException(status_code=401, detail="Token revoked")
+
+        # Claims mode: trust the signed claims instead of querying the user table
+        if AUTH_MODE == 'claims' and "uid" in payload and "utype" in payload:
+            return Principal(user_id=uuid.UUID(payload["uid"]), user_email=user_email, user_type=payload["utype"])
+
+        if AUTH_MODE == 'cache':
+            principal = identity_cache.get(user_email)
+            if principal is not None:
+                return principal
+
         # Fetch user data from database or dictionary
-        user = db.query(User).filter(User.user_email == user_email).first()
+        user = (await db.scalars(select(User).where(func.lower(User.user_email) == func.lower(user_email)))).first()
         if user is None:
             raise HTTPException(status_code=401, detail="User not found")
 
+        if AUTH_MODE == 'cache':
+            principal = Principal(user_id=user.user_id, user_email=user.user_email, user_type=user.user_type)
+            identity_cache.put(principal)
+            return principal
+
         return user
     except InvalidTokenError:
         raise HTTPException(status_code=401, detail="Invalid token")
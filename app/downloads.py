@@ -0,0 +1,148 @@
+from fastapi import HTTPException, Request
+from starlette.concurrency import run_in_threadpool
+from starlette.responses import Response
+from storage import attachment_path, is_digest
+import mimetypes
+import os
+
+
+## ATTACHMENT DOWNLOADS
+# Single range requests, If-None-Match / If-Range on the ETag, and the ASGI zerocopy extension
+# (sendfile) when the server offers it. Otherwise the file is read in chunks in the threadpool.
+DOWNLOAD_CHUNK_SIZE = 256 * 1024
+REVALIDATE = 'private, no-cache'
+
+# Blobs are stored without their original name, so the type comes from the first bytes:
+# (offset, magic, media type), DICOM puts its marker after a 128 byte preamble
+_MAGIC = (
+    (0, b'%PDF', 'application/pdf'),
+    (0, b'\x89PNG', 'image/png'),
+    (0, b'\xff\xd8\xff', 'image/jpeg'),
+    (128, b'DICM', 'application/dicom'),
+)
+
+
+def _media_type(path, attachment):
+    if not is_digest(attachment):
+        return mimetypes.guess_type(attachment)[0] or 'application/octet-stream'
+    with open(path, 'rb') as f:
+        head = f.read(132)
+    for offset, magic, media_type in _MAGIC:
+        if head[offset:offset + len(magic)] == magic:
+            return media_type
+    return 'application/octet-stream'
+
+def _etag(attachment, stat):
+    # The digest names the content, legacy files fall back to mtime and size
+    if is_digest(attachment):
+        return f'"{attachment}"'
+    return f'W/"{int(stat.st_mtime)}-{stat.st_size}"'
+
+def if_none_match(request, etag):
+    # Weak comparison (RFC 9110 8.8.3.2): W/"x" matches "x"
+    header = request.headers.get('if-none-match')
+    if not header:
+        return False
+    if header.strip() == '*':
+        return True
+    opaque = lambda tag: tag.strip().removeprefix('W/')
+    return opaque(etag) in {opaque(tag) for tag in header.split(',')}
+
+def not_modified(etag):
+    # 304 for conditional GETs of JSON resources; no-cache makes clients revalidate every time
+    return Response(status_code=304, headers={'etag': etag, 'cache-control': REVALIDATE})
+
+def _parse_range(header, size):
+    # Returns (start, end) inclusive, None to send the whole file, or raises 416
+    unit, _, ranges = header.partition('=')
+    if unit.strip() != 'bytes' or ',' in ranges:
+        return None
+    start, _, end = ranges.strip().partition('-')
+    try:
+        if start == '':
+            length = int(end)
+            if length <= 0:
+                raise ValueError
+            return max(size - length, 0), size - 1
+        start = int(start)
+        end = int(end) if end else size - 1
+    except ValueError:
+        return None
+    if start >= size or end < start:
+        raise HTTPException(status_code=416, detail="Range not satisfiable", headers={'content-range': f'bytes */{size}'})
+    return start, min(end, size - 1)
+
+
+class AttachmentResponse(Response):
+    def __init__(self, path, status_code, headers, media_type, offset=0, count=0):
+        self.path = path
+        self.status_code = status_code
+        self.media_type = media_type
+        self.background = None
+        self.offset = offset
+        self.count = count
+        self.init_headers(headers)
+
+    async def __call__(self, scope, receive, send):
+        await send({'type': 'http.response.start', 'status': self.status_code, 'headers': self.raw_headers})
+        if self.count == 0 or scope['method'] == 'HEAD':
+            await send({'type': 'http.response.body', 'body': b''})
+            return
+
+        f = await run_in_threadpool(open, self.path, 'rb')
+        try:
+            if 'http.response.zerocopy' in (scope.get('extensions') or {}):
+                await send({'type': 'http.response.zerocopy', 'file': f, 'offset': self.offset, 'count': self.count})
+                return
+            await run_in_threadpool(f.seek, self.offset)
+            remaining = self.count
+            while remaining:
+                chunk = await run_in_threadpool(f.read, min(DOWNLOAD_CHUNK_SIZE, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                await send({'type': 'http.response.body', 'body': chunk, 'more_body': remaining > 0})
+            if remaining:
+                # File shrank under us, close the response rather than hang the client
+                await send({'type': 'http.response.body', 'body': b''})
+        finally:
+            await run_in_threadpool(f.close)
+
+
+async def attachment_response(request: Request, attachment):
+    if not attachment:
+        raise HTTPException(status_code=404, detail="No attachment")
+    path = attachment_path(attachment)
+    try:
+        stat = await run_in_threadpool(os.stat, path)
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="Attachment file missing")
+
+    size = stat.st_size
+    etag = _etag(attachment, stat)
+    headers = {
+        'etag': etag,
+        'accept-ranges': 'bytes',
+        'cache-control': REVALIDATE,
+    }
+
+    # If-None-Match wins over Range (RFC 9110 13.2.2)
+    if if_none_match(request, etag):
+        return AttachmentResponse(path, 304, headers, None)
+
+    media_type = await run_in_threadpool(_media_type, path, attachment)
+    byte_range = None
+    range_header = request.headers.get('range')
+    if_range = request.headers.get('if-range')
+    # If-Range needs a strong match, a weak (legacy) ETag always gets the full file
+    if range_header and (if_range is None or (if_range == etag and not etag.startswith('W/'))):
+        byte_range = _parse_range(range_header, size)
+
+    if byte_range is None:
+        headers['content-length'] = str(size)
+        return AttachmentResponse(path, 200, headers, media_type, 0, size)
+
+    start, end = byte_range
+    headers['content-range'] = f'bytes {start}-{end}/{size}'
+    headers['content-length'] = str(end - start + 1)
+    return AttachmentResponse(path, 206, headers, media_type, start, end - start + 1)
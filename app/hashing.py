@@ -0,0 +1,98 @@
+from concurrent.futures import ProcessPoolExecutor
+from fastapi import HTTPException
+from passlib.context import CryptContext
+from config import settings
+import asyncio
+
+## SET UP CRYPTO CONTEXT
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+
+## POOL SETTINGS
+# bcrypt is CPU bound (~250ms per call), so it runs in worker processes instead of
+# on the event loop. HASH_QUEUE_LIMIT caps running + waiting jobs, anything above
+# it is rejected with 503 rather than piling up behind a login storm.
+HASH_POOL_WORKERS = settings.hash_pool_workers
+HASH_QUEUE_LIMIT = settings.hash_queue_limit
+HASH_TIMEOUT_SECONDS = settings.hash_timeout_seconds
+
+_executor = None
+_in_flight = 0
+
+
+def _hash(password):
+    return pwd_context.hash(password)
+
+def _verify(plain_password, hashed_password):
+    return pwd_context.verify(plain_password, hashed_password)
+
+def _hash_many(passwords):
+    return [pwd_context.hash(password) for password in passwords]
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ProcessPoolExecutor(max_workers=HASH_POOL_WORKERS)
+    return _executor
+
+def _release():
+    global _in_flight
+    _in_flight -= 1
+
+def _release_from(loop):
+    # Done callbacks run on the pool's thread, the counter belongs to the event loop
+    try:
+        loop.call_soon_threadsafe(_release)
+    except RuntimeError:
+        pass  # loop already closed, the app is shutting down
+
+async def _run(fn, *args):
+    # A job holds its slot until it has left the pool. A caller that times out stops waiting,
+    # but the worker keeps hashing, so the slot is only freed by the job's done callback.
+    global _in_flight
+    if _in_flight >= HASH_QUEUE_LIMIT:
+        raise HTTPException(status_code=503, detail="Password service is busy, please retry")
+
+    loop = asyncio.get_running_loop()
+    _in_flight += 1
+    try:
+        job = get_executor().submit(fn, *args)
+    except BaseException:
+        _in_flight -= 1
+        raise
+    job.add_done_callback(lambda _: _release_from(loop))
+    try:
+        # Cancelling the wrapper cancels the job too if no worker has picked it up yet
+        return await asyncio.wait_for(asyncio.wrap_future(job), HASH_TIMEOUT_SECONDS)
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=503, detail="Password service timed out, please retry")
+
+async def get_password_hash(password):
+    return await _run(_hash, password)
+
+async def verify_password(plain_password, hashed_password):
+    return await _run(_verify, plain_password, hashed_password)
+
+async def get_password_hashes(passwords, chunk_size=8):
+    # Bulk imports. Small chunks with one worker left free, so logins and registrations
+    # still get through the pool while a large batch is being hashed. Each chunk is one job
+    # under the same queue limit and timeout as a single hash.
+    in_flight = asyncio.Semaphore(max(1, HASH_POOL_WORKERS - 1))
+
+    async def hash_chunk(chunk):
+        async with in_flight:
+            return await _run(_hash_many, chunk)
+
+    chunks = [passwords[i:i + chunk_size] for i in range(0, len(passwords), chunk_size)]
+    tasks = [asyncio.ensure_future(hash_chunk(chunk)) for chunk in chunks]
+    try:
+        results = await asyncio.gather(*tasks)
+    except BaseException:
+        # Do not keep feeding the pool for a batch that has already failed
+        for task in tasks:
+            task.cancel()
+        raise
+    return [password_hash for chunk in results for password_hash in chunk]
+
+def shutdown():
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,34 @@
+from fastapi import HTTPException
+from functools import lru_cache
+from pydantic import ValidationError, create_model
+import json
+
+
+## HISTORICAL VALIDATION
+# Doctor/staff `historical` is free-form JSON, validated by a model generated from its shape.
+# Generating a model is far more expensive than validating with one, and every generated class
+# stays alive, so models are memoized by field signature in a bounded LRU.
+HISTORICAL_MODEL_CACHE_SIZE = 256
+
+
+@lru_cache(maxsize=HISTORICAL_MODEL_CACHE_SIZE)
+def historical_model(signature):
+    # signature is ((field name, value type), ...) in document order
+    return create_model('HistoricalModel', **{key: (value_type, ...) for key, value_type in signature})
+
+def parse_historical(historical):
+    # Form value (JSON text) -> validated dict for the JSONB column
+    if not historical:
+        return {}
+    try:
+        data = json.loads(historical)
+    except json.JSONDecodeError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid JSON for historical field: {str(e)}")
+    if not isinstance(data, dict):
+        raise HTTPException(status_code=400, detail="Historical field must be a JSON object")
+
+    signature = tuple((key, type(value)) for key, value in data.items())
+    try:
+        return historical_model(signature)(**data).model_dump(mode='json')
+    except (ValidationError, NameError, TypeError, ValueError) as e:
+        raise HTTPException(status_code=400, detail=f"Invalid historical field: {str(e)}")
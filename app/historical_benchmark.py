@@ -0,0 +1,54 @@
+from pydantic import create_model
+from historical import parse_historical, historical_model
+import argparse
+import json
+import random
+import time
+
+
+## HISTORICAL VALIDATION BENCHMARK
+# Bulk staff onboarding as far as the `historical` field is concerned: N registrations whose
+# payloads come in a handful of shapes. Before = a new pydantic model per request (the old
+# register_staff code), after = parse_historical with memoized models. Password hashing and the
+# inserts are the same in both and left out.
+#   python historical_benchmark.py --requests 5000
+
+SHAPES = [
+    lambda i: {"education": "MD", "graduation_year": 2000 + i % 20, "certified": True},
+    lambda i: {"education": "RN", "previous_employer": f"Clinic {i}", "years": i % 30},
+    lambda i: {"specialties": ["cardiology", "internal"], "board_certified": i % 2 == 0},
+    lambda i: {"education": "MLT", "certifications": {"bls": True, "acls": i % 3 == 0}, "rating": 4.5},
+    lambda i: {},
+]
+
+
+def old_validate(historical):
+    data_dict = json.loads(historical) if historical else {}
+    dynamic_fields = {key: (type(value), ...) for key, value in data_dict.items()}
+    DynamicModel = create_model('DynamicModel', **dynamic_fields)
+    return DynamicModel(**data_dict).model_dump_json()
+
+def run(validate, payloads):
+    started = time.perf_counter()
+    for payload in payloads:
+        validate(payload)
+    return (time.perf_counter() - started) / len(payloads) * 1e6
+
+def main(args):
+    rng = random.Random(0)
+    payloads = [json.dumps(rng.choice(SHAPES)(i)) for i in range(args.requests)]
+
+    before_us = run(old_validate, payloads)
+    historical_model.cache_clear()
+    after_us = run(parse_historical, payloads)
+
+    print(f"{args.requests} registrations, {len(SHAPES)} payload shapes")
+    print(f"create_model per request:  {before_us:8.1f} us/request, {args.requests} model classes created")
+    print(f"memoized models:           {after_us:8.1f} us/request, {historical_model.cache_info().currsize} model classes created")
+    print(f"speedup: {before_us / after_us:.0f}x")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="historical field validation benchmark")
+    parser.add_argument('--requests', type=int, default=5000)
+    main(parser.parse_args())
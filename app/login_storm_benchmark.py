@@ -0,0 +1,70 @@
+import aiohttp
+import argparse
+import asyncio
+import statistics
+import time
+
+
+## LOGIN STORM BENCHMARK
+# Probes GET /auth/me on its own, then again while L clients log in back to back through
+# POST /oauth/client/token, and reports the probe latency for both phases. bcrypt runs in the
+# hashing pool, so /auth/me p99 should stay flat; logins past HASH_QUEUE_LIMIT get 503.
+#   python login_storm_benchmark.py --token <any token> --email <user> --password <password>
+
+
+async def probe(session, args, stop, latencies):
+    headers = {'Authorization': f"Bearer {args.token}"}
+    while not stop.is_set():
+        started = time.perf_counter()
+        async with session.get(f"{args.base_url}/auth/me", headers=headers) as response:
+            await response.read()
+        latencies.append((time.perf_counter() - started) * 1000)
+        await asyncio.sleep(0.01)
+
+async def login(session, args, stop, statuses):
+    form = {'username': args.email, 'password': args.password}
+    while not stop.is_set():
+        async with session.post(f"{args.base_url}/oauth/client/token", data=form) as response:
+            await response.read()
+            statuses.append(response.status)
+
+def report(label, latencies):
+    if not latencies:
+        print(f"{label}: no samples")
+        return
+    ordered = sorted(latencies)
+    pick = lambda q: ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+    print(f"{label}: n={len(ordered)} p50={statistics.median(ordered):.1f}ms "
+          f"p95={pick(0.95):.1f}ms p99={pick(0.99):.1f}ms max={ordered[-1]:.1f}ms")
+
+async def phase(session, args, logins):
+    latencies, statuses = [], []
+    stop = asyncio.Event()
+    tasks = [asyncio.create_task(probe(session, args, stop, latencies))]
+    tasks += [asyncio.create_task(login(session, args, stop, statuses)) for _ in range(logins)]
+    await asyncio.sleep(args.seconds)
+    stop.set()
+    await asyncio.gather(*tasks)
+    return latencies, statuses
+
+async def main(args):
+    connector = aiohttp.TCPConnector(limit=args.logins + 10)
+    async with aiohttp.ClientSession(connector=connector, timeout=aiohttp.ClientTimeout(total=None)) as session:
+        idle, _ = await phase(session, args, 0)
+        storm, statuses = await phase(session, args, args.logins)
+
+    report("/auth/me alone      ", idle)
+    report(f"/auth/me, {args.logins} logins", storm)
+    print(f"logins: {statuses.count(200)} ok, {statuses.count(503)} rejected (503), "
+          f"{len(statuses) - statuses.count(200) - statuses.count(503)} other")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="/auth/me latency during a login storm")
+    parser.add_argument('--base-url', default='http://localhost:8000')
+    parser.add_argument('--token', required=True)
+    parser.add_argument('--email', required=True)
+    parser.add_argument('--password', required=True)
+    parser.add_argument('--logins', type=int, default=100)
+    parser.add_argument('--seconds', type=float, default=20)
+    asyncio.run(main(parser.parse_args()))
@@ -1,21 +1,20 @@
-import uvicorn
 from fastapi import FastAPI
-from fastapi_sqlalchemy import DBSessionMiddleware, db
+from fastapi.responses import ORJSONResponse
 
 from schema import *
 import models
 from starlette.middleware.cors import CORSMiddleware
-import os
-from dotenv import load_dotenv
 from fastapi.staticfiles import StaticFiles
 
 from routers import auth, data_query, doctor_staff, admin
+from database import async_engine
+from config import settings
+import hashing
+import audit
 
-load_dotenv('.env')
 
-
-app = FastAPI() 
-app.mount('/static', StaticFiles(directory=os.environ['ASSET_STORAGE']), name="static")
+app = FastAPI(default_response_class=ORJSONResponse)
+app.mount('/static', StaticFiles(directory=settings.asset_storage), name="static")
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
@@ -24,6 +23,18 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+@app.on_event("startup")
+async def startup():
+    audit.audit_log.start()
+
+@app.on_event("shutdown")
+async def shutdown():
+    # Write out queued audit events first, they need the pool
+    await audit.audit_log.stop()
+    # Close pooled asyncpg connections so workers restart cleanly
+    await async_engine.dispose()
+    hashing.shutdown()
+
 @app.get("/")
 async def root():
     return {"message": "hello world"}
@@ -34,4 +45,6 @@ app.include_router(doctor_staff.router)
 app.include_router(admin.router)
 
 if __name__ == '__main__':
+    # Only needed to serve directly, workers started by uvicorn itself skip this import
+    import uvicorn
     uvicorn.run(app, host='0.0.0.0', port=8000)
\ No newline at end of file
@@ -0,0 +1,191 @@
+"""baseline schema from lobotomy.sql
+
+Databases restored from lobotomy.sql already have this schema and should
+only be stamped:  alembic stamp 0001
+
+Revision ID: 0001
+Revises:
+Create Date: 2024-06-10 00:00:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision = '0001'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'user',
+        sa.Column('user_id', postgresql.UUID(), nullable=False),
+        sa.Column('user_type', sa.Integer(), nullable=False),
+        sa.Column('user_name', sa.String(25), nullable=False),
+        sa.Column('user_email', sa.String(), nullable=False),
+        sa.Column('password', sa.String()),
+        sa.PrimaryKeyConstraint('user_id', name='user_pkey'),
+    )
+    op.create_table(
+        'insurance',
+        sa.Column('insurance_id', postgresql.UUID(), nullable=False),
+        sa.Column('insurance_name', sa.String(), nullable=False),
+        sa.PrimaryKeyConstraint('insurance_id', name='insurances_pkey'),
+    )
+    op.create_table(
+        'laboratory',
+        sa.Column('lab_id', postgresql.UUID(), nullable=False),
+        sa.Column('lab_name', sa.String(), nullable=False),
+        sa.Column('lab_desc', sa.String()),
+        sa.PrimaryKeyConstraint('lab_id', name='laboratory_pkey'),
+    )
+    op.create_table(
+        'polyclinic',
+        sa.Column('poly_id', postgresql.UUID(), nullable=False),
+        sa.Column('poly_name', sa.String(), nullable=False),
+        sa.Column('poly_desc', sa.String()),
+        sa.PrimaryKeyConstraint('poly_id', name='polyclinic_pkey'),
+    )
+    op.create_table(
+        'admin',
+        sa.Column('admin_id', postgresql.UUID(), nullable=False),
+        sa.Column('user_id', postgresql.UUID(), nullable=False),
+        sa.Column('name', sa.String(), nullable=False),
+        sa.Column('dob', sa.Date(), nullable=False),
+        sa.Column('national_id', sa.Integer(), nullable=False),
+        sa.Column('tax_number', sa.Integer(), nullable=False),
+        sa.Column('phone_num', sa.Integer()),
+        sa.Column('address', sa.String()),
+        sa.Column('sex', sa.Boolean()),
+        sa.PrimaryKeyConstraint('admin_id', name='admin_pkey'),
+        sa.ForeignKeyConstraint(['user_id'], ['user.user_id'], name='user_id', ondelete='CASCADE'),
+    )
+    op.create_table(
+        'patient',
+        sa.Column('patient_id', postgresql.UUID(), nullable=False),
+        sa.Column('user_id', postgresql.UUID(), nullable=False),
+        sa.Column('name', sa.String(), nullable=False),
+        sa.Column('dob', sa.Date(), nullable=False),
+        sa.Column('national_id', sa.Integer()),
+        sa.Column('phone_num', sa.Integer(), nullable=False),
+        sa.Column('address', sa.String()),
+        sa.Column('alias', sa.String()),
+        sa.Column('relative_phone', sa.Integer()),
+        sa.Column('insurance_id', postgresql.UUID()),
+        sa.Column('sex', sa.Boolean()),
+        sa.PrimaryKeyConstraint('patient_id', name='patient_pkey'),
+        sa.ForeignKeyConstraint(['user_id'], ['user.user_id'], name='user_id'),
+        sa.ForeignKeyConstraint(['insurance_id'], ['insurance.insurance_id'], name='insurance_id'),
+    )
+    for table, key in (('doctor', 'doctor_id'), ('medical_staff', 'staff_id')):
+        op.create_table(
+            table,
+            sa.Column(key, postgresql.UUID(), nullable=False),
+            sa.Column('user_id', postgresql.UUID(), nullable=False),
+            sa.Column('name', sa.String(), nullable=False),
+            sa.Column('dob', sa.Date(), nullable=False),
+            sa.Column('national_id', sa.Integer()),
+            sa.Column('phone_num', sa.Integer(), nullable=False),
+            sa.Column('address', sa.String()),
+            sa.Column('pob', sa.String(), nullable=False),
+            sa.Column('license_num', sa.String(), nullable=False),
+            sa.Column('tax_num', sa.Integer(), nullable=False),
+            sa.Column('historical', postgresql.JSONB(), nullable=False),
+            sa.Column('sex', sa.Boolean()),
+            sa.PrimaryKeyConstraint(key, name=f'{table}_pkey'),
+            sa.ForeignKeyConstraint(['user_id'], ['user.user_id'], name='user_id'),
+        )
+    op.create_table(
+        'doctor_poly',
+        sa.Column('doctor_id', postgresql.UUID(), nullable=False),
+        sa.Column('poly_id', postgresql.UUID(), nullable=False),
+        sa.PrimaryKeyConstraint('doctor_id', 'poly_id', name='doctor_poly_pkey'),
+        sa.ForeignKeyConstraint(['doctor_id'], ['doctor.doctor_id'], name='doctor_id'),
+        sa.ForeignKeyConstraint(['poly_id'], ['polyclinic.poly_id'], name='poly_id'),
+    )
+    op.create_table(
+        'staff_laboratory',
+        sa.Column('staff_id', postgresql.UUID(), nullable=False),
+        sa.Column('lab_id', postgresql.UUID(), nullable=False),
+        sa.PrimaryKeyConstraint('staff_id', 'lab_id', name='staff_laboratory_pkey'),
+        sa.ForeignKeyConstraint(['staff_id'], ['medical_staff.staff_id'], name='staff_id'),
+        sa.ForeignKeyConstraint(['lab_id'], ['laboratory.lab_id'], name='lab_id'),
+    )
+    op.create_table(
+        'patient_interest',
+        sa.Column('patient_id', postgresql.UUID(), nullable=False),
+        sa.Column('doctor_id', postgresql.UUID(), nullable=False),
+        sa.Column('staff_id', postgresql.UUID(), nullable=False),
+        sa.PrimaryKeyConstraint('patient_id', name='patient_interest_pkey'),
+        sa.ForeignKeyConstraint(['patient_id'], ['patient.patient_id'], name='patient_id'),
+        sa.ForeignKeyConstraint(['doctor_id'], ['doctor.doctor_id'], name='doctor_id'),
+        sa.ForeignKeyConstraint(['staff_id'], ['medical_staff.staff_id'], name='staff_id'),
+    )
+    op.create_table(
+        'medical_record',
+        sa.Column('record_id', postgresql.UUID(), nullable=False),
+        sa.Column('patient_id', postgresql.UUID(), nullable=False),
+        sa.Column('created_date', postgresql.TIME(timezone=True), nullable=False),
+        sa.Column('last_editted', postgresql.TIME(timezone=True), nullable=False),
+        sa.PrimaryKeyConstraint('record_id', name='medical_record_pkey'),
+        sa.ForeignKeyConstraint(['patient_id'], ['patient.patient_id'], name='patient_id'),
+    )
+    op.create_table(
+        'clinical_entry',
+        sa.Column('entry_id', postgresql.UUID(), nullable=False),
+        sa.Column('record_id', postgresql.UUID(), nullable=False),
+        sa.Column('entry_date', sa.Date(), nullable=False),
+        sa.Column('staff_id', postgresql.UUID(), nullable=False),
+        sa.Column('height', sa.Integer()),
+        sa.Column('weight', sa.Integer()),
+        sa.Column('body_temp', sa.Float()),
+        sa.Column('blood_type', sa.String(3)),
+        sa.Column('systolic', sa.Integer()),
+        sa.Column('diastolic', sa.Integer()),
+        sa.Column('pulse', sa.Integer()),
+        sa.Column('note', sa.String()),
+        sa.PrimaryKeyConstraint('entry_id', name='clinical_entry_pkey'),
+        sa.ForeignKeyConstraint(['record_id'], ['medical_record.record_id'], name='record_id'),
+        sa.ForeignKeyConstraint(['staff_id'], ['medical_staff.staff_id'], name='staff_id'),
+    )
+    op.create_table(
+        'medical_note',
+        sa.Column('note_id', postgresql.UUID(), nullable=False),
+        sa.Column('record_id', postgresql.UUID(), nullable=False),
+        sa.Column('note_date', sa.Date(), nullable=False),
+        sa.Column('note_content', sa.String(), nullable=False),
+        sa.Column('doctor_id', postgresql.UUID(), nullable=False),
+        sa.Column('poly_id', postgresql.UUID(), nullable=False),
+        sa.Column('attachment', sa.String()),
+        sa.Column('diagnosis', sa.String(), nullable=False),
+        sa.PrimaryKeyConstraint('note_id', name='medical_note_pkey'),
+        sa.ForeignKeyConstraint(['record_id'], ['medical_record.record_id'], name='record_id'),
+        sa.ForeignKeyConstraint(['doctor_id'], ['doctor.doctor_id'], name='doctor_id'),
+        sa.ForeignKeyConstraint(['poly_id'], ['polyclinic.poly_id'], name='poly_id'),
+    )
+    op.create_table(
+        'lab_report',
+        sa.Column('report_id', postgresql.UUID(), nullable=False),
+        sa.Column('record_id', postgresql.UUID(), nullable=False),
+        sa.Column('report_date', sa.Date(), nullable=False),
+        sa.Column('lab_note', sa.String(), nullable=False),
+        sa.Column('staff_id', postgresql.UUID(), nullable=False),
+        sa.Column('lab_id', postgresql.UUID(), nullable=False),
+        sa.Column('attachment', sa.String()),
+        sa.PrimaryKeyConstraint('report_id', name='lab_report_pkey'),
+        sa.ForeignKeyConstraint(['record_id'], ['medical_record.record_id'], name='record_id'),
+        sa.ForeignKeyConstraint(['staff_id'], ['medical_staff.staff_id'], name='staff_id'),
+        sa.ForeignKeyConstraint(['lab_id'], ['laboratory.lab_id'], name='lab_id'),
+    )
+
+
+def downgrade():
+    for table in (
+        'lab_report', 'medical_note', 'clinical_entry', 'medical_record',
+        'patient_interest', 'staff_laboratory', 'doctor_poly', 'medical_staff',
+        'doctor', 'patient', 'admin', 'polyclinic', 'laboratory', 'insurance', 'user',
+    ):
+        op.drop_table(table)
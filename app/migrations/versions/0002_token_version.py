@@ -0,0 +1,30 @@
+"""token_version table for claims-mode revocation
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2024-06-10 00:00:01
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision = '0002'
+down_revision = '0001'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'token_version',
+        sa.Column('user_id', postgresql.UUID(), nullable=False),
+        sa.Column('version', sa.Integer(), nullable=False, server_default='0'),
+        sa.PrimaryKeyConstraint('user_id'),
+        sa.ForeignKeyConstraint(['user_id'], ['user.user_id'], ondelete='CASCADE'),
+    )
+
+
+def downgrade():
+    op.drop_table('token_version')
@@ -0,0 +1,69 @@
+"""indexes on foreign keys, hot lookups and list sort keys
+
+Built with CREATE INDEX CONCURRENTLY so a live database keeps serving writes.
+ux_user_email_lower fails if two users already share an email up to case;
+merge those accounts before upgrading.
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2024-06-10 00:00:02
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '0003'
+down_revision = '0002'
+branch_labels = None
+depends_on = None
+
+FOREIGN_KEY_INDEXES = [
+    ('admin', ['user_id']),
+    ('patient', ['user_id']),
+    ('patient', ['insurance_id']),
+    ('doctor', ['user_id']),
+    ('medical_staff', ['user_id']),
+    ('doctor_poly', ['poly_id']),
+    ('staff_laboratory', ['lab_id']),
+    ('patient_interest', ['doctor_id']),
+    ('patient_interest', ['staff_id']),
+    ('medical_record', ['patient_id']),
+    ('clinical_entry', ['record_id']),
+    ('clinical_entry', ['staff_id']),
+    ('medical_note', ['record_id']),
+    ('medical_note', ['doctor_id']),
+    ('medical_note', ['poly_id']),
+    ('lab_report', ['record_id']),
+    ('lab_report', ['staff_id']),
+    ('lab_report', ['lab_id']),
+]
+
+# Keyset pagination orders by (sort column, primary key)
+SORT_KEY_INDEXES = [
+    ('patient', ['name', 'patient_id']),
+    ('medical_record', ['created_date', 'record_id']),
+    ('medical_record', ['last_editted', 'record_id']),
+]
+
+
+def index_name(table, columns):
+    return f"ix_{table}_{'_'.join(columns)}"
+
+
+def upgrade():
+    # CONCURRENTLY cannot run inside a transaction block
+    with op.get_context().autocommit_block():
+        for table, columns in FOREIGN_KEY_INDEXES + SORT_KEY_INDEXES:
+            op.create_index(index_name(table, columns), table, columns, postgresql_concurrently=True)
+        op.create_index(
+            'ux_user_email_lower', 'user', [sa.text('lower(user_email)')],
+            unique=True, postgresql_concurrently=True,
+        )
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        op.drop_index('ux_user_email_lower', table_name='user', postgresql_concurrently=True)
+        for table, columns in reversed(FOREIGN_KEY_INDEXES + SORT_KEY_INDEXES):
+            op.drop_index(index_name(table, columns), table_name=table, postgresql_concurrently=True)
@@ -0,0 +1,30 @@
+"""attachment_blob table for the content-addressed attachment store
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2024-06-10 00:00:03
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '0004'
+down_revision = '0003'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'attachment_blob',
+        sa.Column('digest', sa.String(64), nullable=False),
+        sa.Column('size', sa.BigInteger(), nullable=False),
+        sa.Column('ref_count', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('created_at', sa.DateTime(timezone=True), nullable=False, server_default=sa.func.now()),
+        sa.PrimaryKeyConstraint('digest'),
+    )
+
+
+def downgrade():
+    op.drop_table('attachment_blob')
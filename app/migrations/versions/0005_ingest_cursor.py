@@ -0,0 +1,29 @@
+"""ingest_cursor table for resumable vitals streaming
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2024-06-10 00:00:04
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '0005'
+down_revision = '0004'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'ingest_cursor',
+        sa.Column('device_id', sa.String(), nullable=False),
+        sa.Column('last_seq', sa.BigInteger(), nullable=False, server_default='0'),
+        sa.Column('updated_at', sa.DateTime(timezone=True), nullable=False, server_default=sa.func.now()),
+        sa.PrimaryKeyConstraint('device_id'),
+    )
+
+
+def downgrade():
+    op.drop_table('ingest_cursor')
@@ -0,0 +1,31 @@
+"""clinical_entry (record_id, entry_date) index for the vitals time series
+
+Built with CREATE INDEX CONCURRENTLY so a live database keeps serving writes.
+
+Revision ID: 0006
+Revises: 0005
+Create Date: 2024-06-10 00:00:05
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '0006'
+down_revision = '0005'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # CONCURRENTLY cannot run inside a transaction block
+    with op.get_context().autocommit_block():
+        op.create_index(
+            'ix_clinical_entry_record_id_entry_date', 'clinical_entry', ['record_id', 'entry_date'],
+            postgresql_concurrently=True,
+        )
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_clinical_entry_record_id_entry_date', table_name='clinical_entry', postgresql_concurrently=True)
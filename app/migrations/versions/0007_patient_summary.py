@@ -0,0 +1,50 @@
+"""patient_summary dashboard projection
+
+Fill it after upgrading with `python patient_summary.py rebuild` (from app/).
+
+Revision ID: 0007
+Revises: 0006
+Create Date: 2024-06-10 00:00:06
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision = '0007'
+down_revision = '0006'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'patient_summary',
+        sa.Column('patient_id', postgresql.UUID(), nullable=False),
+        sa.Column('name', sa.String(), nullable=True),
+        sa.Column('record_count', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('entry_count', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('note_count', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('lab_report_count', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('last_entry_date', sa.Date(), nullable=True),
+        sa.Column('height', sa.Integer(), nullable=True),
+        sa.Column('weight', sa.Integer(), nullable=True),
+        sa.Column('body_temp', sa.Float(), nullable=True),
+        sa.Column('blood_type', sa.String(3), nullable=True),
+        sa.Column('systolic', sa.Integer(), nullable=True),
+        sa.Column('diastolic', sa.Integer(), nullable=True),
+        sa.Column('pulse', sa.Integer(), nullable=True),
+        sa.Column('last_note_date', sa.DateTime(), nullable=True),
+        sa.Column('last_diagnosis', sa.String(), nullable=True),
+        sa.Column('last_lab_report_date', sa.Date(), nullable=True),
+        sa.Column('updated_at', sa.DateTime(timezone=True), nullable=False, server_default=sa.func.now()),
+        sa.ForeignKeyConstraint(['patient_id'], ['patient.patient_id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('patient_id'),
+    )
+    op.create_index('ix_patient_summary_name_patient_id', 'patient_summary', ['name', 'patient_id'])
+    op.create_index('ix_patient_summary_updated_at_patient_id', 'patient_summary', ['updated_at', 'patient_id'])
+
+
+def downgrade():
+    op.drop_table('patient_summary')
@@ -0,0 +1,35 @@
+"""medical_note.search_vector with a GIN index for full-text search
+
+The column is added empty (no table rewrite) and the index is built CONCURRENTLY.
+Fill existing rows afterwards with `python note_search.py backfill` (from app/).
+
+Revision ID: 0008
+Revises: 0007
+Create Date: 2024-06-10 00:00:07
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision = '0008'
+down_revision = '0007'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('medical_note', sa.Column('search_vector', postgresql.TSVECTOR(), nullable=True))
+    # CONCURRENTLY cannot run inside a transaction block
+    with op.get_context().autocommit_block():
+        op.create_index(
+            'ix_medical_note_search_vector', 'medical_note', ['search_vector'],
+            postgresql_using='gin', postgresql_concurrently=True,
+        )
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_medical_note_search_vector', table_name='medical_note', postgresql_concurrently=True)
+    op.drop_column('medical_note', 'search_vector')
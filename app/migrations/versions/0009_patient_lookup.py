@@ -0,0 +1,52 @@
+"""patient lookup indexes: pg_trgm on name/alias, prefix indexes on ID and phone numbers
+
+The ID and phone indexes are on the columns cast to text, so they work whether the
+columns are varchar (models.py) or integer (older restored dumps). Built CONCURRENTLY.
+pg_trgm is a trusted extension from Postgres 13, older servers need a superuser to
+run CREATE EXTENSION pg_trgm once.
+
+Revision ID: 0009
+Revises: 0008
+Create Date: 2024-06-10 00:00:08
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '0009'
+down_revision = '0008'
+branch_labels = None
+depends_on = None
+
+TRIGRAM_INDEXES = [
+    ('ix_patient_name_trgm', 'name'),
+    ('ix_patient_alias_trgm', 'alias'),
+]
+
+PREFIX_INDEXES = [
+    ('ix_patient_national_id_prefix', 'national_id'),
+    ('ix_patient_phone_num_prefix', 'phone_num'),
+    ('ix_patient_relative_phone_prefix', 'relative_phone'),
+]
+
+
+def upgrade():
+    op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    # CONCURRENTLY cannot run inside a transaction block
+    with op.get_context().autocommit_block():
+        for name, column in TRIGRAM_INDEXES:
+            op.create_index(
+                name, 'patient', [column],
+                postgresql_using='gin', postgresql_ops={column: 'gin_trgm_ops'}, postgresql_concurrently=True,
+            )
+        for name, column in PREFIX_INDEXES:
+            op.create_index(
+                name, 'patient', [sa.text(f'({column}::text) text_pattern_ops')], postgresql_concurrently=True,
+            )
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        for name, _ in reversed(TRIGRAM_INDEXES + PREFIX_INDEXES):
+            op.drop_index(name, table_name='patient', postgresql_concurrently=True)
@@ -0,0 +1,35 @@
+"""change_log table for the incremental sync feed
+
+Revision ID: 0010
+Revises: 0009
+Create Date: 2024-06-10 00:00:09
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision = '0010'
+down_revision = '0009'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'change_log',
+        sa.Column('seq', sa.BigInteger(), sa.Identity(), nullable=False),
+        sa.Column('entity', sa.String(32), nullable=False),
+        sa.Column('op', sa.String(8), nullable=False),
+        sa.Column('entity_id', postgresql.UUID(), nullable=False),
+        sa.Column('record_id', postgresql.UUID(), nullable=True),
+        sa.Column('patient_id', postgresql.UUID(), nullable=True),
+        sa.Column('changed_at', sa.DateTime(timezone=True), nullable=False, server_default=sa.func.now()),
+        sa.PrimaryKeyConstraint('seq'),
+    )
+    op.create_index('ix_change_log_patient_id_seq', 'change_log', ['patient_id', 'seq'])
+
+
+def downgrade():
+    op.drop_table('change_log')
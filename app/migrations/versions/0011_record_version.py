@@ -0,0 +1,27 @@
+"""version counters on medical_record and patient for conditional GETs
+
+Constant defaults, so no table rewrite on Postgres 11+.
+
+Revision ID: 0011
+Revises: 0010
+Create Date: 2024-06-10 00:00:10
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '0011'
+down_revision = '0010'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('medical_record', sa.Column('version', sa.Integer(), nullable=False, server_default='0'))
+    op.add_column('patient', sa.Column('version', sa.Integer(), nullable=False, server_default='0'))
+
+
+def downgrade():
+    op.drop_column('patient', 'version')
+    op.drop_column('medical_record', 'version')
@@ -0,0 +1,36 @@
+"""audit_log table for patient data reads
+
+Revision ID: 0012
+Revises: 0011
+Create Date: 2024-06-10 00:00:11
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision = '0012'
+down_revision = '0011'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'audit_log',
+        sa.Column('id', sa.BigInteger(), sa.Identity(), nullable=False),
+        sa.Column('occurred_at', sa.DateTime(timezone=True), nullable=False),
+        sa.Column('user_id', postgresql.UUID(), nullable=False),
+        sa.Column('user_type', sa.Integer(), nullable=False),
+        sa.Column('action', sa.String(32), nullable=False),
+        sa.Column('entity_id', postgresql.UUID(), nullable=True),
+        sa.Column('detail', postgresql.JSONB(), nullable=True),
+        sa.PrimaryKeyConstraint('id'),
+    )
+    op.create_index('ix_audit_log_entity_id_occurred_at', 'audit_log', ['entity_id', 'occurred_at'])
+    op.create_index('ix_audit_log_user_id_occurred_at', 'audit_log', ['user_id', 'occurred_at'])
+
+
+def downgrade():
+    op.drop_table('audit_log')
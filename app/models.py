@@ -1,12 +1,23 @@
-from sqlalchemy import Column, DateTime, ForeignKey, Integer, String, Float, Boolean, JSON
+from sqlalchemy import BigInteger, Column, Identity, DateTime, ForeignKey, Integer, String, Float, Boolean, JSON, Index, func
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.dialects.postgresql import JSONB ,UUID
-from sqlalchemy.orm import relationship
-from sqlalchemy import Date
+from sqlalchemy.dialects.postgresql import JSONB ,UUID, TSVECTOR
+from sqlalchemy.orm import deferred, relationship
+from sqlalchemy import Date, text
+from sqlalchemy.types import TypeDecorator
 
 
 Base = declarative_base()
 
+class IntegerDigits(TypeDecorator):
+    # ID and phone numbers are integer columns in lobotomy.sql, but the forms and the import
+    # send them as digit strings. asyncpg binds with the column type ($n::INTEGER) and does
+    # not coerce, so convert here instead of in every endpoint.
+    impl = Integer
+    cache_ok = True
+
+    def process_bind_param(self, value, dialect):
+        return value if value is None else int(value)
+
 class User(Base):
     __tablename__ = 'user'
     user_id = Column(UUID, primary_key=True, index=True)
@@ -20,37 +31,51 @@ class User(Base):
     doctor = relationship("Doctor", back_populates="user")
     medical_staff = relationship("MedicalStaff", back_populates="user")
 
+    __table_args__ = (
+        Index('ux_user_email_lower', func.lower(user_email), unique=True),
+    )
+
 class Patient(Base):
     __tablename__ = 'patient'
     patient_id = Column(UUID, primary_key=True, index=True)
-    user_id = Column(UUID, ForeignKey('user.user_id'))
+    user_id = Column(UUID, ForeignKey('user.user_id'), index=True)
     name = Column(String)
     dob = Column(DateTime)
-    pob = Column(String)
-    national_id = Column(String)
+    national_id = Column(IntegerDigits)
     sex = Column(Boolean)
-    phone_num = Column(String)
+    phone_num = Column(IntegerDigits)
     address = Column(String)
     alias = Column(String)
-    relative_phone = Column(String)
-    insurance_id = Column(UUID, ForeignKey('insurance.insurance_id'))
+    relative_phone = Column(IntegerDigits)
+    insurance_id = Column(UUID, ForeignKey('insurance.insurance_id'), index=True)
+    # Bumped by change_log.record_many when the patient changes or gets a new record
+    version = Column(Integer, nullable=False, default=0, server_default='0')
 
     user = relationship("User", back_populates="patient")
     insurance = relationship("Insurance", back_populates="patient")
     medical_record = relationship("MedicalRecord", back_populates="patient")
     interest = relationship("PatientInterest", back_populates="patient")
 
+    __table_args__ = (
+        Index('ix_patient_name_patient_id', name, patient_id),
+        # Patient lookup, see patient_search.py
+        Index('ix_patient_name_trgm', name, postgresql_using='gin', postgresql_ops={'name': 'gin_trgm_ops'}),
+        Index('ix_patient_alias_trgm', alias, postgresql_using='gin', postgresql_ops={'alias': 'gin_trgm_ops'}),
+        Index('ix_patient_national_id_prefix', text('(national_id::text) text_pattern_ops')),
+        Index('ix_patient_phone_num_prefix', text('(phone_num::text) text_pattern_ops')),
+        Index('ix_patient_relative_phone_prefix', text('(relative_phone::text) text_pattern_ops')),
+    )
+
 class Admin(Base):
     __tablename__ = 'admin'
     admin_id = Column(UUID, primary_key=True, index=True)
-    user_id = Column(UUID, ForeignKey('user.user_id'))
+    user_id = Column(UUID, ForeignKey('user.user_id'), index=True)
     name = Column(String)
-    pob = Column(String)
     dob = Column(DateTime)
-    national_id = Column(String)
-    tax_number = Column(String)
+    national_id = Column(IntegerDigits)
+    tax_number = Column(IntegerDigits)
     sex = Column(Boolean)
-    phone_num = Column(String)
+    phone_num = Column(IntegerDigits)
     address = Column(String)
 
     user = relationship("User", back_populates="admin")
@@ -65,15 +90,15 @@ class Insurance(Base):
 class Doctor(Base):
     __tablename__ = 'doctor'
     doctor_id = Column(UUID, primary_key=True, index=True)
-    user_id = Column(UUID, ForeignKey('user.user_id'))
+    user_id = Column(UUID, ForeignKey('user.user_id'), index=True)
     name = Column(String, nullable=False)
     dob = Column(DateTime, nullable=False)
-    national_id = Column(String)
-    phone_num = Column(String, nullable=False)
+    national_id = Column(IntegerDigits)
+    phone_num = Column(IntegerDigits, nullable=False)
     address = Column(String)
     pob = Column(String)
     license_num = Column(String, nullable=False)
-    tax_num = Column(String, nullable=False)
+    tax_num = Column(IntegerDigits, nullable=False)
     historical = Column(JSONB, nullable=False)
     sex = Column(Boolean)
 
@@ -85,15 +110,15 @@ class Doctor(Base):
 class MedicalStaff(Base):
     __tablename__ = 'medical_staff'
     staff_id = Column(UUID, primary_key=True, index=True)
-    user_id = Column(UUID, ForeignKey('user.user_id'))
+    user_id = Column(UUID, ForeignKey('user.user_id'), index=True)
     name = Column(String, nullable=False)
     dob = Column(DateTime, nullable=False)
-    national_id = Column(String)
-    phone_num = Column(String, nullable=False)
+    national_id = Column(IntegerDigits)
+    phone_num = Column(IntegerDigits, nullable=False)
     address = Column(String)
     pob = Column(String)
     license_num = Column(String, nullable=False)
-    tax_num = Column(String, nullable=False)
+    tax_num = Column(IntegerDigits, nullable=False)
     historical = Column(JSONB, nullable=False)
     sex = Column(Boolean)
 
@@ -124,7 +149,7 @@ class Polyclinic(Base):
 class PolyclinicDoctor(Base):
     __tablename__ = 'doctor_poly'
     doctor_id = Column(UUID, ForeignKey('doctor.doctor_id'), primary_key=True)
-    poly_id = Column(UUID, ForeignKey('polyclinic.poly_id'), primary_key=True)
+    poly_id = Column(UUID, ForeignKey('polyclinic.poly_id'), primary_key=True, index=True)
 
     doctor = relationship("Doctor", back_populates="polyclinic")
     polyclinic = relationship("Polyclinic", back_populates="doctor")
@@ -132,7 +157,7 @@ class PolyclinicDoctor(Base):
 class LaboratoryStaff(Base):
     __tablename__ = 'staff_laboratory'
     staff_id = Column(UUID, ForeignKey('medical_staff.staff_id'), primary_key=True)
-    lab_id = Column(UUID, ForeignKey('laboratory.lab_id'), primary_key=True)
+    lab_id = Column(UUID, ForeignKey('laboratory.lab_id'), primary_key=True, index=True)
 
     staff = relationship("MedicalStaff", back_populates="laboratory_staff")
     lab = relationship("Laboratory", back_populates="staff")
@@ -140,8 +165,8 @@ class LaboratoryStaff(Base):
 class PatientInterest(Base):
     __tablename__ = 'patient_interest'
     patient_id = Column(UUID, ForeignKey('patient.patient_id'), primary_key=True)
-    doctor_id = Column(UUID, ForeignKey('doctor.doctor_id'))
-    staff_id = Column(UUID, ForeignKey('medical_staff.staff_id'))
+    doctor_id = Column(UUID, ForeignKey('doctor.doctor_id'), index=True)
+    staff_id = Column(UUID, ForeignKey('medical_staff.staff_id'), index=True)
 
     patient = relationship("Patient", back_populates="interest")
     doctor = relationship("Doctor", back_populates="interest")
@@ -150,21 +175,28 @@ class PatientInterest(Base):
 class MedicalRecord(Base):
     __tablename__ = 'medical_record'
     record_id = Column(UUID, primary_key=True, index=True)
-    patient_id = Column(UUID, ForeignKey('patient.patient_id'), nullable=False)
+    patient_id = Column(UUID, ForeignKey('patient.patient_id'), nullable=False, index=True)
     created_date = Column(DateTime(timezone=True), nullable=False)
     last_editted = Column(DateTime(timezone=True), nullable=False)
+    # Bumped by change_log.record_many on every change to the record's notes, entries and reports
+    version = Column(Integer, nullable=False, default=0, server_default='0')
 
     patient = relationship("Patient", back_populates="medical_record")
     clinical_entry = relationship("ClinicalEntry", back_populates="record")
     medical_note = relationship("MedicalNote", back_populates="record")
     lab_report = relationship("LabReport", back_populates="record")
 
+    __table_args__ = (
+        Index('ix_medical_record_created_date_record_id', created_date, record_id),
+        Index('ix_medical_record_last_editted_record_id', last_editted, record_id),
+    )
+
 class ClinicalEntry(Base):
     __tablename__ = 'clinical_entry'
     entry_id = Column(UUID, primary_key=True, index=True)
-    record_id = Column(UUID, ForeignKey('medical_record.record_id'), nullable=False)
+    record_id = Column(UUID, ForeignKey('medical_record.record_id'), nullable=False, index=True)
     entry_date = Column(Date, nullable=False)
-    staff_id = Column(UUID, ForeignKey('medical_staff.staff_id'), nullable=False)
+    staff_id = Column(UUID, ForeignKey('medical_staff.staff_id'), nullable=False, index=True)
     height = Column(Integer)
     weight = Column(Integer)
     body_temp = Column(Float)
@@ -177,31 +209,122 @@ class ClinicalEntry(Base):
     record = relationship("MedicalRecord", back_populates="clinical_entry")
     staff = relationship("MedicalStaff", back_populates="clinical_entry")
 
+    __table_args__ = (
+        # Vitals time series: one record's entries in date order
+        Index('ix_clinical_entry_record_id_entry_date', record_id, entry_date),
+    )
+
 class MedicalNote(Base):
     __tablename__ = 'medical_note'
     note_id = Column(UUID, primary_key=True, index=True)
-    record_id = Column(UUID, ForeignKey('medical_record.record_id'), nullable=False)
+    record_id = Column(UUID, ForeignKey('medical_record.record_id'), nullable=False, index=True)
     note_date = Column(DateTime, nullable=False)
     note_content = Column(String, nullable=False)
-    doctor_id = Column(UUID, ForeignKey('doctor.doctor_id'), nullable=False)
-    poly_id = Column(UUID, ForeignKey('polyclinic.poly_id'), nullable=False)
+    doctor_id = Column(UUID, ForeignKey('doctor.doctor_id'), nullable=False, index=True)
+    poly_id = Column(UUID, ForeignKey('polyclinic.poly_id'), nullable=False, index=True)
     attachment = Column(String)
     diagnosis = Column(String, nullable=False)
+    # Full-text search, see note_search.py. Deferred: never loaded with the note
+    search_vector = deferred(Column(TSVECTOR))
 
     record = relationship("MedicalRecord", back_populates="medical_note")
     doctor = relationship("Doctor", back_populates="medical_note")
     polyclinic = relationship("Polyclinic", back_populates="medical_note")
 
+    __table_args__ = (
+        Index('ix_medical_note_search_vector', 'search_vector', postgresql_using='gin'),
+    )
+
 class LabReport(Base):
     __tablename__ = 'lab_report'
     report_id = Column(UUID, primary_key=True, index=True)
-    record_id = Column(UUID, ForeignKey('medical_record.record_id'), nullable=False)
+    record_id = Column(UUID, ForeignKey('medical_record.record_id'), nullable=False, index=True)
     report_date = Column(Date, nullable=False)
     lab_note = Column(String, nullable=False)
-    staff_id = Column(UUID, ForeignKey('medical_staff.staff_id'), nullable=False)
-    lab_id = Column(UUID, ForeignKey('laboratory.lab_id'), nullable=False)
+    staff_id = Column(UUID, ForeignKey('medical_staff.staff_id'), nullable=False, index=True)
+    lab_id = Column(UUID, ForeignKey('laboratory.lab_id'), nullable=False, index=True)
     attachment = Column(String)
 
     record = relationship("MedicalRecord", back_populates="lab_report")
     staff = relationship("MedicalStaff", back_populates="lab_report")
-    lab = relationship("Laboratory", back_populates="lab_report")
\ No newline at end of file
+    lab = relationship("Laboratory", back_populates="lab_report")
+
+class TokenVersion(Base):
+    __tablename__ = 'token_version'
+    user_id = Column(UUID, ForeignKey('user.user_id', ondelete='CASCADE'), primary_key=True)
+    version = Column(Integer, nullable=False, default=0)
+
+class AttachmentBlob(Base):
+    # One row per stored file, MedicalNote/LabReport.attachment hold the digest
+    __tablename__ = 'attachment_blob'
+    digest = Column(String(64), primary_key=True)
+    size = Column(BigInteger, nullable=False)
+    ref_count = Column(Integer, nullable=False, default=0)
+    created_at = Column(DateTime(timezone=True), nullable=False, server_default=func.now())
+
+class IngestCursor(Base):
+    # Highest sequence number committed per streaming device, see vitals_stream.py
+    __tablename__ = 'ingest_cursor'
+    device_id = Column(String, primary_key=True)
+    last_seq = Column(BigInteger, nullable=False, default=0)
+    updated_at = Column(DateTime(timezone=True), nullable=False, server_default=func.now())
+
+class PatientSummary(Base):
+    # Dashboard projection, maintained by patient_summary.py, never written directly
+    __tablename__ = 'patient_summary'
+    patient_id = Column(UUID, ForeignKey('patient.patient_id', ondelete='CASCADE'), primary_key=True)
+    name = Column(String)
+    record_count = Column(Integer, nullable=False, default=0)
+    entry_count = Column(Integer, nullable=False, default=0)
+    note_count = Column(Integer, nullable=False, default=0)
+    lab_report_count = Column(Integer, nullable=False, default=0)
+    last_entry_date = Column(Date)
+    height = Column(Integer)
+    weight = Column(Integer)
+    body_temp = Column(Float)
+    blood_type = Column(String(3))
+    systolic = Column(Integer)
+    diastolic = Column(Integer)
+    pulse = Column(Integer)
+    last_note_date = Column(DateTime)
+    last_diagnosis = Column(String)
+    last_lab_report_date = Column(Date)
+    updated_at = Column(DateTime(timezone=True), nullable=False, server_default=func.now())
+
+    __table_args__ = (
+        Index('ix_patient_summary_name_patient_id', name, patient_id),
+        Index('ix_patient_summary_updated_at_patient_id', updated_at, patient_id),
+    )
+
+class ChangeLog(Base):
+    # Append-only, written by change_log.py in the same transaction as the change
+    __tablename__ = 'change_log'
+    seq = Column(BigInteger, Identity(), primary_key=True)
+    entity = Column(String(32), nullable=False)
+    op = Column(String(8), nullable=False)
+    entity_id = Column(UUID, nullable=False)
+    record_id = Column(UUID)
+    patient_id = Column(UUID)
+    changed_at = Column(DateTime(timezone=True), nullable=False, server_default=func.now())
+
+    __table_args__ = (
+        # Per-patient feeds
+        Index('ix_change_log_patient_id_seq', patient_id, seq),
+    )
+
+class AuditLog(Base):
+    # Reads of patient data, written in batches by audit.py
+    __tablename__ = 'audit_log'
+    id = Column(BigInteger, Identity(), primary_key=True)
+    occurred_at = Column(DateTime(timezone=True), nullable=False)
+    user_id = Column(UUID, nullable=False)
+    user_type = Column(Integer, nullable=False)
+    action = Column(String(32), nullable=False)
+    entity_id = Column(UUID)
+    detail = Column(JSONB)
+
+    __table_args__ = (
+        # Who looked at this patient / record, what did this user look at
+        Index('ix_audit_log_entity_id_occurred_at', entity_id, occurred_at),
+        Index('ix_audit_log_user_id_occurred_at', user_id, occurred_at),
+    )
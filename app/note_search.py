@@ -0,0 +1,106 @@
+from sqlalchemy import func, literal, literal_column, select, tuple_, update
+from sqlalchemy.dialects.postgresql import REGCONFIG
+from database import AsyncSessionLocal
+from models import MedicalNote, MedicalRecord
+from pagination import encode_cursor
+from config import settings
+import asyncio
+import schema
+import sys
+
+
+## MEDICAL NOTE SEARCH
+# MedicalNote.search_vector holds the diagnosis (weight A) and note content (weight B) as a
+# tsvector, GIN indexed (migration 0008). create/update_medical_note set it in the same
+# statement as the text; rows written before the column existed are filled by
+#   python note_search.py backfill
+# NOTE_SEARCH_CONFIG is the text search configuration ('simple' does no stemming and suits
+# mixed-language notes). Changing it needs a backfill with --all.
+NOTE_SEARCH_CONFIG = settings.note_search_config
+BACKFILL_BATCH_SIZE = 10000
+HEADLINE_OPTIONS = 'MaxFragments=2, MaxWords=20, MinWords=8'
+
+
+def _config():
+    return literal(NOTE_SEARCH_CONFIG, REGCONFIG)
+
+def note_vector(diagnosis, note_content):
+    # Values or columns; assign the result to MedicalNote.search_vector
+    # Weights are inlined: a bound varchar would not resolve setweight(tsvector, "char")
+    return func.setweight(func.to_tsvector(_config(), func.coalesce(diagnosis, '')), literal_column("'A'")).op('||')(
+        func.setweight(func.to_tsvector(_config(), func.coalesce(note_content, '')), literal_column("'B'"))
+    )
+
+async def search_notes(db, q, page, patient_id=None, poly_id=None):
+    # Ranked matches, best first. Keyset order is (rank, note_id) descending.
+    query = func.websearch_to_tsquery(_config(), q)
+    rank = func.ts_rank_cd(MedicalNote.search_vector, query)
+
+    stmt = (
+        select(
+            MedicalNote,
+            MedicalRecord.patient_id,
+            rank.label('rank'),
+            func.ts_headline(_config(), MedicalNote.note_content, query, HEADLINE_OPTIONS).label('headline'),
+        )
+        .join(MedicalRecord, MedicalRecord.record_id == MedicalNote.record_id)
+        .where(MedicalNote.search_vector.bool_op('@@')(query))
+    )
+    if patient_id is not None:
+        stmt = stmt.where(MedicalRecord.patient_id == patient_id)
+    if poly_id is not None:
+        stmt = stmt.where(MedicalNote.poly_id == poly_id)
+    if page.after is not None:
+        stmt = stmt.where(tuple_(rank, MedicalNote.note_id) < tuple_(*page.after))
+
+    rows = (await db.execute(stmt.order_by(rank.desc(), MedicalNote.note_id.desc()).limit(page.limit + 1))).all()
+
+    items = [
+        schema.NoteSearchHit(
+            **schema.MedicalNote.model_validate(note).model_dump(),
+            patient_id=row_patient_id, rank=row_rank, headline=headline,
+        )
+        for note, row_patient_id, row_rank, headline in rows[:page.limit]
+    ]
+    next_cursor = None
+    if len(rows) > page.limit:
+        last = items[-1]
+        next_cursor = encode_cursor(page.cursor_sort, [last.rank, last.note_id])
+    return {"items": items, "next_cursor": next_cursor}
+
+
+async def backfill(db, everything=False):
+    # Walks the table in note_id order, one short transaction per batch
+    done = 0
+    last = None
+    while True:
+        ids = select(MedicalNote.note_id).order_by(MedicalNote.note_id).limit(BACKFILL_BATCH_SIZE)
+        if last is not None:
+            ids = ids.where(MedicalNote.note_id > last)
+        ids = (await db.scalars(ids)).all()
+        if not ids:
+            return done
+
+        stmt = (
+            update(MedicalNote)
+            .where(MedicalNote.note_id.in_(ids))
+            .values(search_vector=note_vector(MedicalNote.diagnosis, MedicalNote.note_content))
+            .execution_options(synchronize_session=False)
+        )
+        if not everything:
+            stmt = stmt.where(MedicalNote.search_vector.is_(None))
+        done += (await db.execute(stmt)).rowcount
+        await db.commit()
+        last = ids[-1]
+
+
+async def _main(args):
+    async with AsyncSessionLocal() as db:
+        if args[:1] == ['backfill']:
+            print(f"indexed {await backfill(db, everything='--all' in args)} notes")
+        else:
+            raise SystemExit("usage: python note_search.py backfill [--all]")
+
+
+if __name__ == '__main__':
+    asyncio.run(_main(sys.argv[1:]))
@@ -0,0 +1,116 @@
+from sqlalchemy import delete, func, select, text
+from database import AsyncSessionLocal
+from models import MedicalNote
+from pagination import PageParams
+import note_search
+import argparse
+import asyncio
+import statistics
+import time
+
+
+## NOTE SEARCH BENCHMARK
+# Seeds N synthetic notes into one record (server side, diagnosis prefixed "BENCH "), indexes
+# them with note_search.backfill and times the search endpoint's query against an ILIKE scan,
+# which is what searching looked like without the tsvector column.
+#   python note_search_benchmark.py --seed 5000000 --record-id <id> --doctor-id <id> --poly-id <id>
+#   python note_search_benchmark.py --cleanup
+
+TERMS = ['pneumonia', 'hypertension', 'diabetes', 'fracture', 'migraine', 'asthma', 'dengue',
+         'tuberculosis', 'gastritis', 'anemia', 'bronchitis', 'dermatitis', 'sinusitis', 'vertigo']
+FILLER = ['patient', 'reports', 'mild', 'severe', 'pain', 'since', 'yesterday', 'fever', 'cough',
+          'advised', 'rest', 'follow', 'up', 'week', 'prescribed', 'oral', 'dose', 'daily', 'no',
+          'history', 'of', 'allergy', 'vital', 'signs', 'stable', 'examination', 'normal', 'left',
+          'right', 'chest', 'abdomen', 'headache', 'nausea', 'fatigue', 'improved', 'referred']
+SEED_CHUNK = 100000
+
+# Words are drawn with a skew (random()^3) so a few are common and most are rare, like real notes
+SEED_SQL = """
+    INSERT INTO medical_note (note_id, record_id, note_date, note_content, doctor_id, poly_id, diagnosis)
+    SELECT gen_random_uuid(), CAST(:record_id AS uuid), now() - (g % 3650) * interval '1 day',
+           array_to_string(ARRAY(
+               SELECT w.words[1 + floor(power(random(), 3) * array_length(w.words, 1))::int]
+               FROM generate_series(1, 40) WHERE g > 0
+           ), ' '),
+           CAST(:doctor_id AS uuid), CAST(:poly_id AS uuid),
+           'BENCH ' || w.terms[1 + g % array_length(w.terms, 1)]
+    FROM generate_series(CAST(:start AS int), CAST(:stop AS int)) g,
+         (SELECT CAST(:words AS text[]) AS words, CAST(:terms AS text[]) AS terms) w
+"""
+
+
+async def seed(args):
+    words = TERMS + FILLER
+    async with AsyncSessionLocal() as db:
+        for start in range(0, args.seed, SEED_CHUNK):
+            stop = min(args.seed, start + SEED_CHUNK) - 1
+            await db.execute(text(SEED_SQL), {
+                'record_id': args.record_id, 'doctor_id': args.doctor_id, 'poly_id': args.poly_id,
+                'words': words, 'terms': TERMS, 'start': start, 'stop': stop,
+            })
+            await db.commit()
+            print(f"seeded {stop + 1}/{args.seed}", flush=True)
+        started = time.perf_counter()
+        indexed = await note_search.backfill(db)
+        print(f"backfill: {indexed} notes in {time.perf_counter() - started:.0f}s")
+        await db.execute(text("ANALYZE medical_note"))
+        await db.commit()
+
+async def timed(run, rounds):
+    samples = []
+    for _ in range(rounds):
+        started = time.perf_counter()
+        result = await run()
+        samples.append((time.perf_counter() - started) * 1000)
+    return statistics.median(samples), result
+
+async def measure(args):
+    async with AsyncSessionLocal() as db:
+        total = await db.scalar(select(func.count()).select_from(MedicalNote))
+        print(f"{total} notes, median of {args.rounds} runs")
+        for term in TERMS[:args.terms]:
+            first_page = PageParams(cursor=None, limit=50, sort=None, order='asc')
+            fts_ms, result = await timed(lambda: note_search.search_notes(db, term, first_page), args.rounds)
+
+            next_ms = None
+            if result["next_cursor"]:
+                second_page = PageParams(cursor=result["next_cursor"], limit=50, sort=None, order='asc')
+                next_ms, _ = await timed(lambda: note_search.search_notes(db, term, second_page), args.rounds)
+
+            pattern = f"%{term}%"
+            ilike = select(MedicalNote.note_id).where(
+                MedicalNote.note_content.ilike(pattern) | MedicalNote.diagnosis.ilike(pattern)
+            ).limit(50)
+            ilike_ms, _ = await timed(lambda: db.execute(ilike), args.rounds)
+
+            next_text = f"{next_ms:8.1f}ms" if next_ms is not None else "       -  "
+            print(f"{term:14} tsvector page 1 {fts_ms:8.1f}ms  page 2 {next_text}  ILIKE (unranked) {ilike_ms:8.1f}ms")
+
+async def cleanup():
+    async with AsyncSessionLocal() as db:
+        result = await db.execute(delete(MedicalNote).where(MedicalNote.diagnosis.like('BENCH %')))
+        await db.commit()
+        print(f"deleted {result.rowcount} benchmark notes")
+
+async def main(args):
+    if args.cleanup:
+        await cleanup()
+        return
+    if args.seed:
+        await seed(args)
+    await measure(args)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Medical note full-text search benchmark")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--record-id')
+    parser.add_argument('--doctor-id')
+    parser.add_argument('--poly-id')
+    parser.add_argument('--terms', type=int, default=len(TERMS))
+    parser.add_argument('--rounds', type=int, default=5)
+    parser.add_argument('--cleanup', action='store_true')
+    args = parser.parse_args()
+    if args.seed and not (args.record_id and args.doctor_id and args.poly_id):
+        parser.error("--seed needs --record-id, --doctor-id and --poly-id")
+    asyncio.run(main(args))
@@ -0,0 +1,138 @@
+from fastapi import HTTPException, Query
+from sqlalchemy import and_, or_, tuple_
+from datetime import date, datetime, time
+from typing import Optional
+import base64
+import json
+import uuid
+
+
+## PAGE SETTINGS
+PAGE_LIMIT_DEFAULT = 50
+PAGE_LIMIT_MAX = 500
+
+# Cursor values keep their type so they can be bound back against the sort column
+_DUMPERS = {
+    uuid.UUID: ('uuid', str),
+    datetime: ('datetime', datetime.isoformat),
+    date: ('date', date.isoformat),
+    time: ('time', time.isoformat),
+}
+_LOADERS = {
+    'uuid': uuid.UUID,
+    'datetime': datetime.fromisoformat,
+    'date': date.fromisoformat,
+    'time': time.fromisoformat,
+}
+
+
+def _dump_value(value):
+    if type(value) in _DUMPERS:
+        tag, dump = _DUMPERS[type(value)]
+        return [tag, dump(value)]
+    return ['raw', value]
+
+def _load_value(item):
+    tag, value = item
+    if tag == 'raw':
+        return value
+    return _LOADERS[tag](value)
+
+def encode_cursor(sort, values):
+    payload = {'s': sort, 'v': [_dump_value(value) for value in values]}
+    return base64.urlsafe_b64encode(json.dumps(payload).encode()).decode()
+
+def decode_cursor(cursor, sort):
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        if payload['s'] != sort:
+            raise ValueError("cursor was issued for a different sort")
+        return [_load_value(item) for item in payload['v']]
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+class PageParams:
+    # Common query parameters of every list endpoint, use as `page: PageParams = Depends()`
+    def __init__(
+        self,
+        cursor: Optional[str] = None,
+        limit: int = Query(PAGE_LIMIT_DEFAULT, ge=1, le=PAGE_LIMIT_MAX),
+        sort: Optional[str] = None,
+        order: str = Query('asc', pattern='^(asc|desc)$'),
+    ):
+        self.limit = limit
+        self.sort = sort
+        self.descending = order == 'desc'
+        # A cursor is only valid for the sort it was issued for
+        self.cursor_sort = f"{sort}:{order}"
+        self.after = decode_cursor(cursor, self.cursor_sort) if cursor else None
+
+
+def sort_columns(page, key_column, sortable):
+    # Keyset order is (sort column, primary key); the key makes it total and stable
+    if page.sort is None:
+        return [key_column]
+    if page.sort not in sortable:
+        raise HTTPException(status_code=400, detail=f"Cannot sort by {page.sort}, choose one of {sorted(sortable)}")
+    return [sortable[page.sort], key_column]
+
+def _after(columns, values, descending):
+    # Rows past the cursor. NULL sort values order above every other value (NULLS LAST ascending,
+    # first descending) like paginate_rows; a row comparison is NULL for them, so say it explicitly.
+    position, bound = tuple_(*columns), tuple_(*values)
+    if len(columns) == 1:
+        return position < bound if descending else position > bound
+    (column, key_column), (value, key) = columns, values
+    if value is None:
+        if descending:
+            return or_(column.is_not(None), and_(column.is_(None), key_column < key))
+        return and_(column.is_(None), key_column > key)
+    if descending:
+        return position < bound
+    return or_(position > bound, column.is_(None))
+
+async def paginate(db, stmt, page, key_column, sortable=None):
+    columns = sort_columns(page, key_column, sortable or {})
+
+    if page.after is not None:
+        if len(page.after) != len(columns):
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+        stmt = stmt.where(_after(columns, page.after, page.descending))
+
+    # Same NULL placement as a default b-tree index, so the index still delivers the order
+    ordering = [column.desc().nulls_first() if page.descending else column.asc().nulls_last() for column in columns]
+    rows = (await db.scalars(stmt.order_by(*ordering).limit(page.limit + 1))).all()
+
+    items = rows[:page.limit]
+    next_cursor = None
+    if len(rows) > page.limit:
+        last = items[-1]
+        next_cursor = encode_cursor(page.cursor_sort, [getattr(last, column.key) for column in columns])
+
+    return {"items": items, "next_cursor": next_cursor}
+
+def _position(values):
+    # Python cannot order None against values, sort NULLs last like Postgres does
+    return tuple((value is None, value) for value in values)
+
+def paginate_rows(rows, page, key_column, sortable=None):
+    # paginate() over rows already in memory (dicts keyed by column name), same cursor format
+    names = [column.key for column in sort_columns(page, key_column, sortable or {})]
+    ordered = sorted(rows, key=lambda row: _position([row[name] for name in names]), reverse=page.descending)
+
+    if page.after is not None:
+        if len(page.after) != len(names):
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+        bound = _position(page.after)
+        if page.descending:
+            ordered = [row for row in ordered if _position([row[name] for name in names]) < bound]
+        else:
+            ordered = [row for row in ordered if _position([row[name] for name in names]) > bound]
+
+    items = ordered[:page.limit]
+    next_cursor = None
+    if len(ordered) > page.limit:
+        next_cursor = encode_cursor(page.cursor_sort, [items[-1][name] for name in names])
+
+    return {"items": items, "next_cursor": next_cursor}
@@ -0,0 +1,68 @@
+from fastapi import HTTPException
+from sqlalchemy import Text, bindparam, cast, func, literal, or_, select
+from models import Patient
+import re
+
+
+## PATIENT LOOKUP
+# Registration desk search (migration 0009). Digits search national_id, phone_num and
+# relative_phone by prefix (text_pattern_ops indexes on the columns cast to text, which also
+# covers databases where they are integers). Anything else searches name and alias through
+# pg_trgm GIN indexes: substrings (ILIKE) and near misses (word similarity, so "jon smit" finds
+# "Jonathan Smith"). Best matches first, no pagination.
+SEARCH_MIN_LENGTH = 3
+SEARCH_LIMIT_MAX = 50
+
+_PHONE_PUNCTUATION = re.compile(r'[\s\-().+]')
+
+# Column order of the compact projection, see schema.PatientMatch
+MATCH_COLUMNS = (
+    Patient.patient_id, Patient.name, Patient.alias, Patient.dob, Patient.sex,
+    Patient.national_id, Patient.phone_num,
+)
+
+
+def _escape_like(value):
+    return value.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+def _as_text(column):
+    # Must match the index expressions in migration 0009
+    return cast(column, Text)
+
+async def search_patients(db, q, limit):
+    q = q.strip()
+    if len(q) < SEARCH_MIN_LENGTH:
+        raise HTTPException(status_code=400, detail=f"Search needs at least {SEARCH_MIN_LENGTH} characters")
+
+    digits = _PHONE_PUNCTUATION.sub('', q)
+    if digits.isdigit():
+        # Inlined rather than bound: a generic plan for `LIKE $1` cannot use a prefix index
+        prefix = bindparam('prefix', f"{digits}%", literal_execute=True)
+        stmt = (
+            select(*MATCH_COLUMNS)
+            .where(or_(*(
+                _as_text(column).like(prefix)
+                for column in (Patient.national_id, Patient.phone_num, Patient.relative_phone)
+            )))
+            .order_by(Patient.name, Patient.patient_id)
+        )
+    else:
+        pattern = f"%{_escape_like(q)}%"
+        term = literal(q, Text)
+        score = func.greatest(
+            func.word_similarity(term, Patient.name),
+            func.word_similarity(term, func.coalesce(Patient.alias, '')),
+        )
+        stmt = (
+            select(*MATCH_COLUMNS)
+            .where(or_(
+                Patient.name.ilike(pattern),
+                Patient.alias.ilike(pattern),
+                # `<%` is true when word_similarity reaches pg_trgm.word_similarity_threshold (0.6)
+                term.op('<%')(Patient.name),
+                term.op('<%')(Patient.alias),
+            ))
+            .order_by(score.desc(), Patient.name, Patient.patient_id)
+        )
+
+    return (await db.execute(stmt.limit(limit))).mappings().all()
@@ -0,0 +1,114 @@
+from sqlalchemy import func, select, text
+from database import AsyncSessionLocal
+from models import Patient
+import patient_search
+import argparse
+import asyncio
+import random
+import statistics
+import time
+
+
+## PATIENT LOOKUP BENCHMARK
+# Seeds N synthetic patients (server side; their users have @bench.invalid emails), then times
+# patient_search.search_patients for name fragments, typos and phone/ID prefixes against the
+# 50ms target.
+#   python patient_search_benchmark.py --seed 2000000
+#   python patient_search_benchmark.py --cleanup
+
+FIRST = ['Adi', 'Budi', 'Citra', 'Dewi', 'Eka', 'Fajar', 'Gita', 'Hendra', 'Indah', 'Joko',
+         'Kartika', 'Lestari', 'Made', 'Nur', 'Oka', 'Putri', 'Rizky', 'Sari', 'Tono', 'Wulan',
+         'John', 'Maria', 'David', 'Sarah', 'Michael', 'Linda', 'James', 'Anna', 'Robert', 'Grace']
+LAST = ['Santoso', 'Wijaya', 'Pratama', 'Saputra', 'Hidayat', 'Siregar', 'Nasution', 'Halim',
+        'Kusuma', 'Gunawan', 'Setiawan', 'Purnomo', 'Hartono', 'Susanto', 'Lubis', 'Tanjung',
+        'Smith', 'Johnson', 'Brown', 'Taylor', 'Anderson', 'Thomas', 'Moore', 'Martin']
+SEED_CHUNK = 100000
+TARGET_MS = 50
+
+SEED_SQL = """
+    WITH seeded AS (
+        SELECT g, gen_random_uuid() AS user_id,
+               n.first[1 + floor(random() * array_length(n.first, 1))::int] || ' ' ||
+               n.last[1 + floor(random() * array_length(n.last, 1))::int] || ' ' ||
+               n.last[1 + floor(random() * array_length(n.last, 1))::int] AS name
+        FROM generate_series(CAST(:start AS int), CAST(:stop AS int)) g,
+             (SELECT CAST(:first AS text[]) AS first, CAST(:last AS text[]) AS last) n
+    ), new_user AS (
+        INSERT INTO "user" (user_id, user_name, user_email, password, user_type)
+        SELECT user_id, 'bench' || g, 'bench' || g || '@bench.invalid', '!', 4 FROM seeded
+    )
+    -- Numbers are inserted as integers, which suits both varchar and integer columns
+    INSERT INTO patient (patient_id, user_id, name, dob, national_id, phone_num, alias, relative_phone)
+    SELECT gen_random_uuid(), user_id, name, date '1950-01-01' + (g % 25000),
+           100000000 + g, 800000000 + (random() * 99999999)::int,
+           CASE WHEN g % 4 = 0 THEN split_part(name, ' ', 1) END,
+           800000000 + (random() * 99999999)::int
+    FROM seeded
+"""
+
+
+def queries(rng, count):
+    # Realistic desk input: name fragments, a typo, full name, phone and ID prefixes
+    result = []
+    for _ in range(count):
+        first, last = rng.choice(FIRST), rng.choice(LAST)
+        typo = last[:2] + last[3:] if len(last) > 4 else last
+        result += [
+            ('fragment', last[:4].lower()),
+            ('typo', f"{first} {typo}"),
+            ('full name', f"{first} {last}"),
+            ('phone prefix', f"8{rng.randint(1000, 9999)}"),
+            ('id prefix', f"1000{rng.randint(10, 99)}"),
+        ]
+    return result
+
+async def seed(args):
+    async with AsyncSessionLocal() as db:
+        for start in range(0, args.seed, SEED_CHUNK):
+            stop = min(args.seed, start + SEED_CHUNK) - 1
+            await db.execute(text(SEED_SQL), {'start': start, 'stop': stop, 'first': FIRST, 'last': LAST})
+            await db.commit()
+            print(f"seeded {stop + 1}/{args.seed}", flush=True)
+        await db.execute(text("ANALYZE patient"))
+        await db.commit()
+
+async def measure(args):
+    rng = random.Random(0)
+    samples = {}
+    async with AsyncSessionLocal() as db:
+        total = await db.scalar(select(func.count()).select_from(Patient))
+        for kind, q in queries(rng, args.queries):
+            started = time.perf_counter()
+            await patient_search.search_patients(db, q, 20)
+            samples.setdefault(kind, []).append((time.perf_counter() - started) * 1000)
+
+    print(f"{total} patients, {args.queries} queries per kind, target {TARGET_MS}ms")
+    for kind, latencies in samples.items():
+        ordered = sorted(latencies)
+        p95 = ordered[min(len(ordered) - 1, int(0.95 * len(ordered)))]
+        verdict = 'ok' if p95 <= TARGET_MS else 'OVER'
+        print(f"{kind:13} p50 {statistics.median(ordered):7.1f}ms  p95 {p95:7.1f}ms  max {ordered[-1]:7.1f}ms  {verdict}")
+
+async def cleanup():
+    async with AsyncSessionLocal() as db:
+        bench_users = text("SELECT user_id FROM \"user\" WHERE user_email LIKE '%@bench.invalid'")
+        patients = await db.execute(text(f"DELETE FROM patient WHERE user_id IN ({bench_users.text})"))
+        await db.execute(text(f"DELETE FROM \"user\" WHERE user_id IN ({bench_users.text})"))
+        await db.commit()
+        print(f"deleted {patients.rowcount} benchmark patients")
+
+async def main(args):
+    if args.cleanup:
+        await cleanup()
+        return
+    if args.seed:
+        await seed(args)
+    await measure(args)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Patient lookup benchmark")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--queries', type=int, default=50)
+    parser.add_argument('--cleanup', action='store_true')
+    asyncio.run(main(parser.parse_args()))
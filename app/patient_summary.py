@@ -0,0 +1,99 @@
+from sqlalchemy import bindparam, text
+from sqlalchemy.dialects.postgresql import ARRAY, UUID
+from database import AsyncSessionLocal
+import asyncio
+import sys
+import uuid
+
+
+## PATIENT SUMMARY
+# patient_summary holds one dashboard row per patient: counts, latest vitals, last diagnosis and
+# last lab report. Every endpoint that writes a patient, record, entry, note or lab report calls
+# refresh_* before its commit, which recomputes the rows of just the patients it touched inside
+# the same transaction. Recomputing a patient (a few index lookups) rather than applying deltas
+# keeps the row right when an update moves a date or a record changes hands.
+#   python patient_summary.py rebuild      # after migrating, or to repair drift
+
+_SUMMARY_COLUMNS = """
+    patient_id, name, record_count, entry_count, note_count, lab_report_count,
+    last_entry_date, height, weight, body_temp, blood_type, systolic, diastolic, pulse,
+    last_note_date, last_diagnosis, last_lab_report_date, updated_at
+"""
+
+# {target} selects the patient_id/name rows to recompute
+_UPSERT = """
+    INSERT INTO patient_summary (""" + _SUMMARY_COLUMNS + """)
+    SELECT t.patient_id, t.name,
+           (SELECT count(*) FROM medical_record r WHERE r.patient_id = t.patient_id),
+           (SELECT count(*) FROM clinical_entry e JOIN medical_record r USING (record_id) WHERE r.patient_id = t.patient_id),
+           (SELECT count(*) FROM medical_note n JOIN medical_record r USING (record_id) WHERE r.patient_id = t.patient_id),
+           (SELECT count(*) FROM lab_report l JOIN medical_record r USING (record_id) WHERE r.patient_id = t.patient_id),
+           e.entry_date, e.height, e.weight, e.body_temp, e.blood_type, e.systolic, e.diastolic, e.pulse,
+           n.note_date, n.diagnosis,
+           (SELECT max(l.report_date) FROM lab_report l JOIN medical_record r USING (record_id) WHERE r.patient_id = t.patient_id),
+           now()
+    FROM ({target}) t
+    LEFT JOIN LATERAL (
+        SELECT e.* FROM clinical_entry e JOIN medical_record r USING (record_id)
+        WHERE r.patient_id = t.patient_id
+        ORDER BY e.entry_date DESC, e.entry_id DESC LIMIT 1
+    ) e ON true
+    LEFT JOIN LATERAL (
+        SELECT n.note_date, n.diagnosis FROM medical_note n JOIN medical_record r USING (record_id)
+        WHERE r.patient_id = t.patient_id
+        ORDER BY n.note_date DESC, n.note_id DESC LIMIT 1
+    ) n ON true
+    ON CONFLICT (patient_id) DO UPDATE SET
+""" + ",\n".join(
+    f"        {column} = excluded.{column}"
+    for column in (column.strip() for column in _SUMMARY_COLUMNS.split(','))
+    if column != 'patient_id'
+)
+
+_BY_PATIENT = "SELECT patient_id, name FROM patient WHERE patient_id = ANY(:ids)"
+_BY_RECORD = """
+    SELECT p.patient_id, p.name FROM patient p
+    WHERE p.patient_id IN (SELECT patient_id FROM medical_record WHERE record_id = ANY(:ids))
+"""
+_ALL = "SELECT patient_id, name FROM patient"
+
+_ids = bindparam('ids', type_=ARRAY(UUID))
+
+
+async def _refresh(db, target, ids):
+    ids = sorted({uuid.UUID(str(value)) for value in ids if value is not None})
+    if not ids:
+        return
+    # Pending ORM objects (autoflush is off) must be in the database before recomputing
+    await db.flush()
+    # Writers touching the same patient queue on its row, so each recompute runs after the
+    # previous writer committed and sees its rows. Sorted ids keep the lock order stable.
+    await db.execute(
+        text(f"SELECT 1 FROM patient WHERE patient_id IN (SELECT patient_id FROM ({target}) t) "
+             "ORDER BY patient_id FOR NO KEY UPDATE").bindparams(_ids),
+        {'ids': ids},
+    )
+    await db.execute(text(_UPSERT.format(target=target)).bindparams(_ids), {'ids': ids})
+
+async def refresh_patients(db, patient_ids):
+    await _refresh(db, _BY_PATIENT, patient_ids)
+
+async def refresh_records(db, record_ids):
+    await _refresh(db, _BY_RECORD, record_ids)
+
+async def rebuild(db):
+    result = await db.execute(text(_UPSERT.format(target=_ALL)))
+    await db.commit()
+    return result.rowcount
+
+
+async def _main(command):
+    async with AsyncSessionLocal() as db:
+        if command == 'rebuild':
+            print(f"rebuilt {await rebuild(db)} patient summaries")
+        else:
+            raise SystemExit("usage: python patient_summary.py rebuild")
+
+
+if __name__ == '__main__':
+    asyncio.run(_main(sys.argv[1] if len(sys.argv) > 1 else None))
@@ -0,0 +1,74 @@
+from sqlalchemy import select
+from models import Polyclinic, Laboratory, Insurance
+from config import settings
+import asyncio
+import time
+import uuid
+
+
+## REFERENCE DATA
+# Polyclinics, laboratories and insurers change a few times a year but are read on every page,
+# so each table is held in memory as a whole-table snapshot. Writes in this process call
+# invalidate(); other workers pick the change up after REFDATA_TTL_SECONDS (0 = only on invalidate).
+REFDATA_TTL_SECONDS = settings.refdata_ttl_seconds
+
+
+class RefTable:
+    def __init__(self, model, key_column, ttl_seconds):
+        self.model = model
+        self.key_column = key_column
+        self.ttl_seconds = ttl_seconds
+        self.version = 0
+        self.rows = None
+        self.by_id = {}
+        self.loaded_at = None
+        self.lock = asyncio.Lock()
+
+    def is_stale(self):
+        if self.rows is None:
+            return True
+        return bool(self.ttl_seconds) and time.monotonic() - self.loaded_at > self.ttl_seconds
+
+    def invalidate(self):
+        # Bumping the version also discards a reload that was running while the write committed
+        self.version += 1
+        self.rows = None
+        self.by_id = {}
+
+    async def snapshot(self, db):
+        if self.is_stale():
+            async with self.lock:
+                if self.is_stale():
+                    version = self.version
+                    # Plain column mappings, not ORM objects, so the snapshot is never tied to a session
+                    result = await db.execute(select(*self.model.__table__.columns))
+                    rows = [dict(row) for row in result.mappings()]
+                    if version == self.version:
+                        self.rows = rows
+                        self.by_id = {row[self.key_column.key]: row for row in rows}
+                        self.loaded_at = time.monotonic()
+                    else:
+                        return rows
+        return self.rows
+
+    async def get(self, db, row_id):
+        try:
+            row_id = uuid.UUID(str(row_id))
+        except ValueError:
+            return None
+        await self.snapshot(db)
+        row = self.by_id.get(row_id)
+        if row is None:
+            # Could have been added by another worker since our snapshot, misses ask the database
+            result = await db.execute(select(*self.model.__table__.columns).where(self.key_column == row_id))
+            found = result.mappings().first()
+            row = dict(found) if found else None
+        return row
+
+    async def exists(self, db, row_id):
+        return await self.get(db, row_id) is not None
+
+
+polyclinics = RefTable(Polyclinic, Polyclinic.poly_id, REFDATA_TTL_SECONDS)
+laboratories = RefTable(Laboratory, Laboratory.lab_id, REFDATA_TTL_SECONDS)
+insurers = RefTable(Insurance, Insurance.insurance_id, REFDATA_TTL_SECONDS)
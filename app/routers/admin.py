@@ -1,68 +1,62 @@
-from typing import Annotated, Optional, Dict
-from fastapi import Depends, FastAPI, HTTPException, status, Form, UploadFile, Header
+from typing import Annotated, Optional, Dict, List
+from fastapi import Depends, FastAPI, HTTPException, status, Form, UploadFile, File, Header, Request, Response, Query
 from pydantic import BaseModel, EmailStr, constr, Field
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 from fastapi import APIRouter
 from fastapi.responses import StreamingResponse
-from sqlalchemy.orm import Session
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload
 from dependencies import get_db, get_current_user
+from pagination import PageParams, paginate, paginate_rows
+from refdata import insurers
+from streaming import ndjson_response, wants_ndjson
+import bulk_import
+from downloads import REVALIDATE, if_none_match, not_modified
+import patient_summary
+import patient_search
+import change_log
+import audit
 from datetime import datetime, timedelta
-from passlib.context import CryptContext
 
 import uuid
 import json
-import os
-from dotenv import load_dotenv
+from config import settings
 
+import schema
 from schema import *
 from models import *
 
-load_dotenv('.env')
-
-## SET UP CRYPTO CONTEXT
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
-
-def get_password_hash(password):
-    return pwd_context.hash(password)
-
-def verify_password(plain_password, hashed_password):
-    return pwd_context.verify(plain_password, hashed_password)
-
-ASSET_STORAGE = os.environ['ASSET_STORAGE']
+ASSET_STORAGE = settings.asset_storage
 
 ## INITIALIZE ROUTER
 router = APIRouter()
 
 
 #GET LIST ADMIN
-@router.get("/admin/list")
+@router.get("/admin/list", response_model=schema.Page[schema.Admin])
 async def view_admin(
+    page: PageParams = Depends(),
     user: str = Depends(get_current_user),
-    db: Session = Depends(get_db)):
-    try:
-        if user.user_type != 1:
-            raise HTTPException(status_code=403, detail="Access forbidden")
+    db: AsyncSession = Depends(get_db)):
+    if user.user_type != 1:
+        raise HTTPException(status_code=403, detail="Access forbidden")
 
-        admins = db.query(Admin).all()
-        if not admins:
-            raise HTTPException(status_code=404, detail="No admins found")
-        return admins
-    except Exception as e:
-        raise HTTPException(status_code=500, detail="Internal server error")
+    return await paginate(db, select(Admin), page, Admin.admin_id, {'name': Admin.name})
 
     
 #GET ADMIN BY ADMIN_ID
-@router.get("/admin/{admin_id}")
+@router.get("/admin/{admin_id}", response_model=schema.Admin)
 async def get_admin_by_id(
     admin_id: str, 
     user: str = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     try:
         if user.user_type != 1:
             raise HTTPException(status_code=403, detail="Access forbidden. Only admins can access this endpoint.")
 
-        admin = db.query(Admin).filter(Admin.admin_id == admin_id).first()
+        admin = (await db.scalars(select(Admin).where(Admin.admin_id == admin_id))).first()
         if not admin:
             raise HTTPException(status_code=404, detail="Admin not found")
         return admin
@@ -70,11 +64,10 @@ async def get_admin_by_id(
         raise HTTPException(status_code=500, detail="Internal server error")
     
 #UPDATE ADMIN
-@router.put("/admin/{admin_id}")
+@router.put("/admin/{admin_id}", response_model=schema.Admin)
 async def update_admin(
     admin_id: str,
     name: str = Form(None),
-    pob: str = Form(None),
     dob: int = Form(None),
     national_id: int = Form(None),
     tax_number: int = Form(None),
@@ -82,21 +75,19 @@ async def update_admin(
     address: str = Form(None),
     phone_num: int = Form(None),
     user: str = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     try:
         if user.user_type != 1:
             raise HTTPException(status_code=403, detail="Access forbidden. Only admins can update admin information.")
 
-        admin = db.query(Admin).filter(Admin.admin_id == admin_id).first()
+        admin = (await db.scalars(select(Admin).where(Admin.admin_id == admin_id))).first()
         if not admin:
             raise HTTPException(status_code=404, detail="Admin not found")
         
         # Update admin information
         if name is not None:
             admin.name = name
-        if pob is not None:
-            admin.pob = pob
         if dob is not None:
             admin.dob = datetime.fromtimestamp(dob)
         if national_id is not None:
@@ -110,50 +101,126 @@ async def update_admin(
         if phone_num is not None:
             admin.phone_num = phone_num
 
-        db.commit()
-        db.refresh(admin)
+        await db.commit()
+        await db.refresh(admin)
         return admin
     except Exception as e:
         raise HTTPException(status_code=500, detail=str("Internel Server Error"))
 
 
 ##GET LIST PATIENT
-@router.get("/patient/list")
+@router.get("/patient/list", response_model=schema.Page[schema.PatientOverview])
 async def view_patient(
+    request: Request,
+    insurance_id: Optional[str] = None,
+    stream: bool = False,
+    page: PageParams = Depends(),
     user: str = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
-    try:
-        if user.user_type not in [1, 2, 3]:
-            raise HTTPException(status_code=403, detail="Access forbidden")
-        
-        patients = db.query(Patient).all()
-        if not patients:
-            raise HTTPException(status_code=404, detail="No patients found")
-        for p in patients:
-            record = db.query(MedicalRecord).filter(MedicalRecord.patient_id == p.patient_id).all()
-            p.medical_record = record
-            for r in record:
-                entry = db.query(ClinicalEntry).filter(ClinicalEntry.record_id == r.record_id).all()
-                note = db.query(MedicalNote).filter(MedicalNote.record_id == r.record_id).all()
-                r.clinical_entry = entry
-                r.medical_note = note
-        return patients
-    except Exception as e:
-        print(e)
-        raise HTTPException(status_code=500, detail="Internal server error")
+    if user.user_type not in [1, 2, 3]:
+        raise HTTPException(status_code=403, detail="Access forbidden")
+
+    filters = []
+    if insurance_id is not None:
+        filters.append(Patient.insurance_id == insurance_id)
+
+    # Full export: flat patient rows as NDJSON (?stream=1 or Accept: application/x-ndjson)
+    if wants_ndjson(request, stream):
+        audit.record(user, 'patient.export', insurance_id=insurance_id)
+        return ndjson_response(select(Patient.__table__).where(*filters).order_by(Patient.patient_id))
+
+    # Eager load records with their entries and notes: one SELECT per level
+    # instead of one per patient and per record. selectinload batches its IN
+    # lists by 500 keys; the page size cap keeps the patients in one batch, the
+    # entry and note levels take one more SELECT per 500 records on the page.
+    # The query count depends on the page, never on the size of the tables.
+    stmt = select(Patient).where(*filters).options(
+        selectinload(Patient.medical_record).selectinload(MedicalRecord.clinical_entry),
+        selectinload(Patient.medical_record).selectinload(MedicalRecord.medical_note),
+    )
+
+    audit.record(user, 'patient.list', insurance_id=insurance_id)
+    return await paginate(db, stmt, page, Patient.patient_id, {'name': Patient.name, 'dob': Patient.dob})
+
+
+##GET PATIENT SUMMARIES (dashboard, reads only patient_summary, see patient_summary.py)
+@router.get("/patient/summary", response_model=schema.Page[schema.PatientSummary])
+async def view_patient_summary(
+    page: PageParams = Depends(),
+    user: str = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    if user.user_type not in [1, 2, 3]:
+        raise HTTPException(status_code=403, detail="Access forbidden")
+
+    return await paginate(db, select(PatientSummary), page, PatientSummary.patient_id,
+                          {'name': PatientSummary.name, 'updated_at': PatientSummary.updated_at})
+
+
+##SEARCH PATIENTS (name/alias fuzzy, national ID and phone numbers by prefix, see patient_search.py)
+@router.get("/patient/search", response_model=List[schema.PatientMatch])
+async def search_patient(
+    q: str,
+    limit: int = Query(20, ge=1, le=patient_search.SEARCH_LIMIT_MAX),
+    user: str = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    if user.user_type not in [1, 2, 3]:
+        raise HTTPException(status_code=403, detail="Access forbidden")
+
+    return await patient_search.search_patients(db, q, limit)
+
+
+#BULK IMPORT PATIENTS (CSV or NDJSON, see bulk_import.py for the columns)
+@router.post("/patient/import", response_model=schema.ImportReport)
+async def import_patients(
+    file: UploadFile = File(...),
+    format: Optional[str] = Form(None),
+    user: str = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    if user.user_type != 1:
+        raise HTTPException(status_code=403, detail="Access forbidden")
+
+    fmt = bulk_import.detect_format(file.filename, format)
+    return await bulk_import.import_patients(db, file.file, fmt)
 
 
 #GET PATIENT DATA BY ID
-@router.get("/patient/{patient_id}")
+@router.get("/patient/{patient_id}", response_model=schema.PatientDetail)
 async def get_patient_by_id(
     patient_id: str, 
+    request: Request,
+    response: Response,
     user: str = Depends(get_current_user), 
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
+    # Conditional GET: the ETag combines the patient's version with its records' versions, all
+    # read in one indexed query; the access check runs before a 304 can reveal anything
+    versions = (await db.execute(
+        select(Patient.user_id, Patient.version, func.coalesce(func.sum(MedicalRecord.version), 0))
+        .outerjoin(MedicalRecord, MedicalRecord.patient_id == Patient.patient_id)
+        .where(Patient.patient_id == patient_id)
+        .group_by(Patient.patient_id)
+    )).first()
+    if versions is None:
+        raise HTTPException(status_code=404, detail="Patient not found")
+    owner, patient_version, records_version = versions
+    if user.user_type not in [1, 2] and user.user_id != owner:
+        raise HTTPException(status_code=403, detail="Access forbidden")
+    etag = f'W/"p{patient_version}.{records_version}"'
+    if if_none_match(request, etag):
+        # A revalidation still shows the client holds the data, so it is audited too
+        audit.record(user, 'patient.read', patient_id, not_modified=True)
+        return not_modified(etag)
+    audit.record(user, 'patient.read', patient_id)
+    response.headers['etag'] = etag
+    response.headers['cache-control'] = REVALIDATE
+
     try:
         # Fetch patient data
-        patient = db.query(Patient).filter(Patient.patient_id == patient_id).first()
+        patient = (await db.scalars(select(Patient).where(Patient.patient_id == patient_id))).first()
         if not patient:
             raise HTTPException(status_code=404, detail="Patient not found")
         
@@ -161,14 +228,16 @@ async def get_patient_by_id(
         if user.user_type not in [1, 2] and user.user_id != patient.user_id:
             raise HTTPException(status_code=403, detail="Access forbidden")
 
-        # Fetch medical record
-        medical_record = db.query(MedicalRecord).filter(MedicalRecord.patient_id == patient.patient_id).first()
-        if not medical_record:
-            medical_record = None 
-
-        medical_record.medical_note = db.query(MedicalNote).filter(MedicalNote.record_id == medical_record.record_id).all()
-        medical_record.clinical_entry = db.query(ClinicalEntry).filter(ClinicalEntry.record_id == medical_record.record_id).all()
-        medical_record.lab_report = db.query(LabReport).filter(LabReport.record_id == medical_record.record_id).all()
+        # Fetch medical record together with its notes, entries and lab reports
+        medical_record = (await db.scalars(
+            select(MedicalRecord)
+            .where(MedicalRecord.patient_id == patient.patient_id)
+            .options(
+                selectinload(MedicalRecord.medical_note),
+                selectinload(MedicalRecord.clinical_entry),
+                selectinload(MedicalRecord.lab_report),
+            )
+        )).first()
 
         return {
             'patient': patient,
@@ -178,7 +247,7 @@ async def get_patient_by_id(
         raise HTTPException(status_code=500, detail="Internal server error")
 
 #UPDATE PATIENT
-@router.put("/patient/{patient_id}")
+@router.put("/patient/{patient_id}", response_model=schema.Patient)
 async def update_patient(
     patient_id: str,
     name: str = Form(None),
@@ -191,13 +260,13 @@ async def update_patient(
     relative_phone: Optional[str] = Form(None),
     insurance_id: Optional[str] = Form(None),
     user: str = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     try:
         if user.user_type not in [1, 2]:
             raise HTTPException(status_code=403, detail="Access forbidden")
 
-        patient = db.query(Patient).filter(Patient.patient_id == patient_id).first()
+        patient = (await db.scalars(select(Patient).where(Patient.patient_id == patient_id))).first()
         if not patient:
             raise HTTPException(status_code=404, detail="Patient not found")
 
@@ -220,23 +289,25 @@ async def update_patient(
         if insurance_id is not None:
             patient.insurance_id = insurance_id
 
-        db.commit()
-        db.refresh(patient)
+        await patient_summary.refresh_patients(db, [patient.patient_id])
+        await change_log.record(db, 'patient', 'update', patient.patient_id, patient_id=patient.patient_id)
+        await db.commit()
+        await db.refresh(patient)
         return patient
     except Exception as e:
         raise HTTPException(status_code=500, detail="Internal server error")
 
 # REGISTER NEW INSURANCE
-@router.post("/insurance/new")
+@router.post("/insurance/new", response_model=schema.Insurance)
 async def register_insurance(
     insurance_name: str = Form(None),
     user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     if user.user_type != 1:  # Ensure the user is an admin
         raise HTTPException(status_code=403, detail="Access forbidden")
 
-    existing_insurance = db.query(Insurance).filter(Insurance.insurance_name == insurance_name).first()
+    existing_insurance = (await db.scalars(select(Insurance).where(Insurance.insurance_name == insurance_name))).first()
     if existing_insurance:
         raise HTTPException(status_code=400, detail="This insurance name already exists")
 
@@ -245,69 +316,64 @@ async def register_insurance(
 
         insurance = Insurance(insurance_id=insurance_id, insurance_name=insurance_name)
         db.add(insurance)
-        db.commit()
-        db.refresh(insurance)
+        await db.commit()
+        insurers.invalidate()
+        await db.refresh(insurance)
         return insurance
     except Exception as e:
         print(e)
         raise HTTPException(status_code=500, detail="Internal server error")
     
 # GET LIST OF INSURANCE
-@router.get("/insurance/list")
+@router.get("/insurance/list", response_model=schema.Page[schema.Insurance])
 async def view_insurance(
+    page: PageParams = Depends(),
     user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     if user.user_type != 1:  # Ensure the user is an admin
         raise HTTPException(status_code=403, detail="Access forbidden")
 
-    try:
-        insurances = db.query(Insurance).all()
-        if not insurances:
-            raise HTTPException(status_code=404, detail="No insurances found")
-        return insurances
-    except Exception as e:
-        raise HTTPException(status_code=500, detail="Internal server error")
+    rows = await insurers.snapshot(db)
+    return paginate_rows(rows, page, Insurance.insurance_id, {'name': Insurance.insurance_name})
 
 # GET INSURANCE BY ID
-@router.get("/insurance/{insurance_id}")
+@router.get("/insurance/{insurance_id}", response_model=schema.Insurance)
 async def get_insurance_by_id(
     insurance_id: str,
     user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     if user.user_type != 1:  # Ensure the user is an admin
         raise HTTPException(status_code=403, detail="Access forbidden")
 
-    try:
-        insurance = db.query(Insurance).filter(Insurance.insurance_id == insurance_id).first()
-        if not insurance:
-            raise HTTPException(status_code=404, detail="Insurance not found")
-        return insurance
-    except Exception as e:
-        raise HTTPException(status_code=500, detail="Internal server error")
+    insurance = await insurers.get(db, insurance_id)
+    if not insurance:
+        raise HTTPException(status_code=404, detail="Insurance not found")
+    return insurance
 
 # UPDATE INSURANCE
-@router.put("/insurance/{insurance_id}")
+@router.put("/insurance/{insurance_id}", response_model=schema.Insurance)
 async def update_insurance(
     insurance_id: str,
     insurance_name: str = Form(None),
     user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     if user.user_type != 1:  # Ensure the user is an admin
         raise HTTPException(status_code=403, detail="Access forbidden")
 
     try:
-        insurance = db.query(Insurance).filter(Insurance.insurance_id == insurance_id).first()
+        insurance = (await db.scalars(select(Insurance).where(Insurance.insurance_id == insurance_id))).first()
         if not insurance:
             raise HTTPException(status_code=404, detail="Insurance not found")
 
         if insurance_name is not None:
             insurance.insurance_name = insurance_name
 
-        db.commit()
-        db.refresh(insurance)
+        await db.commit()
+        insurers.invalidate()
+        await db.refresh(insurance)
         return insurance
     except Exception as e:
         raise HTTPException(status_code=500, detail="Internal server error")
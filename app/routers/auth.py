@@ -2,38 +2,32 @@ from typing import Annotated, Optional
 from fastapi import Depends, FastAPI, HTTPException, status, Form
 from pydantic import BaseModel, EmailStr, constr, Field
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
-from fastapi_sqlalchemy import DBSessionMiddleware, db
 from fastapi import APIRouter
-from sqlalchemy.orm import Session
-from dependencies import get_db, get_current_user
-from passlib.context import CryptContext
-from jose import JWTError, jwt
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm.attributes import set_committed_value
+from dependencies import get_db, get_current_user, get_token_version, revoke_tokens, invalidate_user, identity_cache
+from pagination import PageParams, paginate
+from hashing import get_password_hash, verify_password
+import jwt
 from datetime import datetime, timedelta
+from config import settings
 import uuid
-import os
-from dotenv import load_dotenv
+import patient_summary
+import change_log
+import audit
 
 
+import schema
 from schema import *
 from models import *
 
 
-load_dotenv('.env')
-
-## SET UP CRYPTO CONTEXT
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
-
-def get_password_hash(password):
-    return pwd_context.hash(password)
-
-def verify_password(plain_password, hashed_password):
-    return pwd_context.verify(plain_password, hashed_password)
-
 ## INITIALIZE ROUTER
 router = APIRouter()
 
 #CREATE ADMIN
-@router.post("/admin/new")
+@router.post("/admin/new", response_model=schema.Admin)
 async def register_admin(
     name: str = Form(None),
     dob: int = Form(None),
@@ -48,15 +42,16 @@ async def register_admin(
     db=Depends(get_db)
 ):
     # Check for duplicate email
-    existing_user = db.query(User).filter(User.user_email == email).first()
+    existing_user = (await db.scalars(select(User).where(func.lower(User.user_email) == func.lower(email)))).first()
     if existing_user:
         raise HTTPException(status_code=400, detail="Email already registered")
 
+    password_hash = await get_password_hash(password)
+
     try:
         user_id = str(uuid.uuid4())  # Generate a UUID for user_id
         admin_id = str(uuid.uuid4())  # Generate a UUID for admin_id
         dob_datetime = datetime.fromtimestamp(dob)
-        password_hash = get_password_hash(password)
         user = User(user_id=user_id, user_name=user_name, user_email=email, password=password_hash, user_type=1)
         admin = Admin(admin_id=admin_id, user_id=user_id,
                       name=name, dob=dob_datetime,
@@ -64,9 +59,10 @@ async def register_admin(
                       phone_num=phone_num, sex=sex, address=address)
         db.add(user)
         db.add(admin)
-        db.commit()
-        db.refresh(user)
-        db.refresh(admin)
+        await db.commit()
+        invalidate_user(email)
+        await db.refresh(user)
+        await db.refresh(admin)
         return admin
     except Exception as e:
         print(e)
@@ -74,7 +70,7 @@ async def register_admin(
 
 
 #REGISTER NEW PATIENT
-@router.post("/patient/new")
+@router.post("/patient/new", response_model=schema.Patient)
 async def register_patient(
     name: str = Form(None),
     dob: int = Form(None),
@@ -89,23 +85,24 @@ async def register_patient(
     password: str = Form(None),
     user_name: str = Form(None),
     current_user: User = Depends(get_current_user),  # Use current_user instead of user
-    db: Session = Depends(get_db)  # Use Session type hint for db
+    db: AsyncSession = Depends(get_db)  # Use AsyncSession type hint for db
 ):
     # Ensure only admin can register a new patient
     if current_user.user_type not in [1]:
         raise HTTPException(status_code=403, detail="Access forbidden. Only admins and doctors can register patients.")
     
     # Check for duplicate email
-    existing_user = db.query(User).filter(User.user_email == email).first()
+    existing_user = (await db.scalars(select(User).where(func.lower(User.user_email) == func.lower(email)))).first()
     if existing_user:
         raise HTTPException(status_code=400, detail="Email already registered")
     
+    password_hash = await get_password_hash(password)
+
     try:
         user_id = str(uuid.uuid4())  # Generate a UUID for user_id
         patient_id = str(uuid.uuid4())  # Generate a UUID for patient_id
 
         dob_datetime = datetime.fromtimestamp(dob)
-        password_hash = get_password_hash(password)
 
         new_user = User(
             user_id=user_id,
@@ -131,9 +128,12 @@ async def register_patient(
         
         db.add(new_user)
         db.add(new_patient)
-        db.commit()
-        db.refresh(new_user)
-        db.refresh(new_patient)
+        await patient_summary.refresh_patients(db, [patient_id])
+        await change_log.record(db, 'patient', 'insert', patient_id, patient_id=patient_id)
+        await db.commit()
+        invalidate_user(email)
+        await db.refresh(new_user)
+        await db.refresh(new_patient)
         return new_patient
     except Exception as e:
         print(e)
@@ -144,6 +144,7 @@ async def register_patient(
 ## LOGIN SETUP
 class Token(BaseModel):
     access_token: str
+    user_type: int
     token_type: str
     
 def create_access_token(data: dict, expires_delta: timedelta | None = None):
@@ -153,81 +154,108 @@ def create_access_token(data: dict, expires_delta: timedelta | None = None):
     else:
         expire = datetime.now() + timedelta(days=2) ##Sementara aku buat 2 hari (Chr)
     to_encode.update({"exp": expire})
-    encoded_jwt = jwt.encode(to_encode, os.environ['SECRET_KEY'], algorithm=os.environ['ALGORITHM'])
+    encoded_jwt = jwt.encode(to_encode, settings.secret_key, algorithm=settings.algorithm)
     return encoded_jwt
 
-def authenticate_user(user_email: str, password: str, db: Session):
-    user = db.query(User).filter(User.user_email == user_email).first()
+async def authenticate_user(user_email: str, password: str, db: AsyncSession):
+    user = (await db.scalars(select(User).where(func.lower(User.user_email) == func.lower(user_email)))).first()
     if not user:
         return False
-    if not verify_password(password, user.password):
+    if not await verify_password(password, user.password):
         return False
     return user
 
-@router.post("/oauth/client/token")
+@router.post("/oauth/client/token", response_model=Token)
 async def login(
     form_data: Annotated[OAuth2PasswordRequestForm, Depends()],
     db=Depends(get_db)
 ):
-    user = authenticate_user(form_data.username, form_data.password, db)
+    user = await authenticate_user(form_data.username, form_data.password, db)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect username or password",
             headers={"WWW-Authenticate": "Bearer"},
         )
-    access_token_expires = timedelta(hours=int(os.environ['ACCESS_TOKEN_EXPIRE_HOURS']))
+    access_token_expires = timedelta(hours=settings.access_token_expire_hours)
+    token_version = await get_token_version(db, user.user_id)
     access_token = create_access_token(
-        data={"sub": user.user_email}, expires_delta=access_token_expires
+        data={
+            "sub": user.user_email,
+            "uid": str(user.user_id),
+            "utype": user.user_type,
+            "ver": token_version,
+        },
+        expires_delta=access_token_expires
     )
     return {"access_token": access_token, "user_type": user.user_type, "token_type": "bearer"}
 
-@router.get("/auth/me")
+@router.get("/auth/me", response_model=schema.UserProfile)
 async def verify_identity(
     user: str = Depends(get_current_user),
     db=Depends(get_db)
 ):
-    try:
-        patient = db.query(Patient).filter(Patient.user_id == user.user_id).all()[0]
-        user.patient = [patient]
-    except Exception as e:
-        print(f"Failed to retrieve patient: {e}")
-        patient = None
+    # In claims mode the caller is a Principal, load the full user row for this endpoint
+    if not isinstance(user, User):
+        user = (await db.scalars(select(User).where(User.user_id == user.user_id))).first()
+        if user is None:
+            raise HTTPException(status_code=401, detail="User not found")
 
-    try:
-        admin = db.query(Admin).filter(Admin.user_id == user.user_id).all()[0]
-        user.admin = [admin]
-    except Exception as e:
-        print(f"Failed to retrieve admin: {e}")
-        admin = None
+    # Attach every role row (empty lists included) so the response never lazy loads
+    for relationship_name, model in (('patient', Patient), ('admin', Admin), ('doctor', Doctor), ('medical_staff', MedicalStaff)):
+        rows = (await db.scalars(select(model).where(model.user_id == user.user_id))).all()
+        set_committed_value(user, relationship_name, list(rows))
 
-    try:
-        doctor = db.query(Doctor).filter(Doctor.user_id == user.user_id).all()[0]
-        user.doctor = [doctor]
-    except Exception as e:
-        print(f"Failed to retrieve doctor: {e}")
-        doctor = None
+    return user
 
-    try:
-        staff = db.query(MedicalStaff).filter(MedicalStaff.user_id == user.user_id).all()[0]
-        user.medical_staff = [staff]
-    except Exception as e:
-        print(f"Failed to retrieve medical staff: {e}")
-        staff = None
 
-    return user
+#REVOKE ALL ISSUED TOKENS OF A USER
+@router.post("/user/{user_id}/revoke-tokens", response_model=schema.Message)
+async def revoke_user_tokens(
+    user_id: str,
+    user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    if user.user_type != 1:
+        raise HTTPException(status_code=403, detail="Access forbidden")
+
+    target = (await db.scalars(select(User).where(User.user_id == user_id))).first()
+    if not target:
+        raise HTTPException(status_code=404, detail="User not found")
+
+    await revoke_tokens(db, user_id)
+    invalidate_user(target.user_email)
+    return {"message": "User tokens revoked"}
+
+
+#IDENTITY CACHE COUNTERS
+@router.get("/auth/identity-cache", response_model=schema.IdentityCacheStats)
+async def view_identity_cache(
+    user: User = Depends(get_current_user)
+):
+    if user.user_type != 1:
+        raise HTTPException(status_code=403, detail="Access forbidden")
+    return identity_cache.stats()
 
 
-@router.get("/user/list")
+#AUDIT QUEUE COUNTERS (see audit.py)
+@router.get("/audit/stats", response_model=schema.AuditStats)
+async def view_audit_stats(
+    user: User = Depends(get_current_user)
+):
+    if user.user_type != 1:
+        raise HTTPException(status_code=403, detail="Access forbidden")
+    return audit.audit_log.stats()
+
+
+@router.get("/user/list", response_model=schema.Page[schema.User])
 async def view_user(
-    db: Session = Depends(get_db)
+    user_type: Optional[int] = None,
+    page: PageParams = Depends(),
+    db: AsyncSession = Depends(get_db)
 ):
-    try:
-        insurances = db.query(User).all()
-        if not insurances:
-            raise HTTPException(status_code=404, detail="No USERS found")
-        return insurances
-    except Exception as e:
-        raise HTTPException(status_code=500, detail="Internal server error")
-    
+    stmt = select(User)
+    if user_type is not None:
+        stmt = stmt.where(User.user_type == user_type)
 
+    return await paginate(db, stmt, page, User.user_id, {'email': User.user_email})
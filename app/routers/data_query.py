@@ -2,28 +2,21 @@ from typing import Annotated, Optional, Dict
 from fastapi import Depends, FastAPI, HTTPException, status, Form, UploadFile
 from pydantic import BaseModel, EmailStr, constr, Field
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
-from fastapi_sqlalchemy import DBSessionMiddleware, db
 from fastapi import APIRouter
 from fastapi.responses import StreamingResponse
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.orm import selectinload
 from dependencies import get_db, get_current_user
-from passlib.context import CryptContext
-from jose import JWTError, jwt
 from datetime import datetime, timedelta
-from moviepy.editor import VideoFileClip
-from pydub import AudioSegment
 import uuid
 import json
-import os
-from dotenv import load_dotenv
+from config import settings
 
 
 from schema import *
 from models import *
 
-
-load_dotenv('.env')
-ASSET_STORAGE = os.environ['ASSET_STORAGE']
+ASSET_STORAGE = settings.asset_storage
 
 ## INITIALIZE ROUTER
 router = APIRouter()
@@ -33,13 +26,12 @@ async def get_preview_vids(
     user: str = Depends(get_current_user),
     db=Depends(get_db)
 ):
-    query_res = (
-        db.query(Media_Unit, Template)
+    query_res = (await db.execute(
+        select(Media_Unit, Template)
         .join(Template, Media_Unit.template_id == Template.template_id)
         .filter(Media_Unit.is_preview == True)
         .order_by(Media_Unit.media_unit_edited_datetime.asc())
-        .all()
-    )
+    )).all()
     res = {"media_units": []}
     for unit, template in query_res:
         print(unit)
@@ -94,13 +86,12 @@ async def get_preview_vids(
     db=Depends(get_db)
 ):
     # print(user.user_id)
-    query_res = (
-        db.query(Media_Unit, Template)
+    query_res = (await db.execute(
+        select(Media_Unit, Template)
         .join(Template, Media_Unit.template_id == Template.template_id)
         .filter(Media_Unit.user_id == user.user_id, Media_Unit.media_unit_edited_datetime != None)
         .order_by(Media_Unit.media_unit_edited_datetime.desc())
-        .all()
-    )
+    )).all()
     res = {"media_units": []}
     for unit, template in query_res:
         print(unit)
@@ -139,7 +130,7 @@ async def get_preview_vids(
     user: str = Depends(get_current_user),
     db=Depends(get_db)
 ):
-    query_res = db.query(TemplateAvatar, Template).join(Template, TemplateAvatar.template_id == Template.template_id).all()
+    query_res = (await db.execute(select(TemplateAvatar, Template).join(Template, TemplateAvatar.template_id == Template.template_id))).all()
     res = {"media_units": []}
     for unit, template in query_res:
         res_unit = TemplateAvatar_Response(
@@ -158,7 +149,7 @@ async def get_preview_vids(
     user: str = Depends(get_current_user),
     db=Depends(get_db)
 ):
-    query_res = db.query(Avatar).all()
+    query_res = (await db.scalars(select(Avatar))).all()
     return {'avatars': query_res}
 
 @router.get("/products")
@@ -166,7 +157,9 @@ async def fetch_product_templates(
     user: str = Depends(get_current_user),
     db=Depends(get_db)
 ):
-    products = db.query(Product).all()
+    products = (await db.scalars(
+        select(Product).options(selectinload(Product.templates).selectinload(Template.template_avatar))
+    )).all()
 
     res = {'products': []}
 
@@ -1,46 +1,44 @@
-from typing import Annotated, Optional, Dict
-from fastapi import Depends, FastAPI, HTTPException, status, Form, UploadFile, File
-from pydantic import BaseModel, EmailStr, constr, Field, create_model
+from typing import Annotated, Optional, Dict, List
+from fastapi import Depends, FastAPI, HTTPException, status, Form, UploadFile, File, Request, Response, WebSocket, Query
+from pydantic import BaseModel, EmailStr, constr, Field
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
-from fastapi_sqlalchemy import DBSessionMiddleware, db
 from fastapi import APIRouter
 from fastapi.responses import StreamingResponse
-from sqlalchemy.orm import Session
-from dependencies import get_db, get_current_user
-from passlib.context import CryptContext
-from jose import JWTError, jwt
-from datetime import datetime, timedelta
-from moviepy.editor import VideoFileClip
-from pydub import AudioSegment
+from sqlalchemy import Date, DateTime, cast, func, insert, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload
+from dependencies import get_db, get_current_user, invalidate_user
+from pagination import PageParams, paginate, paginate_rows
+from refdata import polyclinics, laboratories
+from streaming import ndjson_response, wants_ndjson
+from hashing import get_password_hash, verify_password
+from historical import parse_historical
+import storage
+import vitals_stream
+import patient_summary
+import note_search
+import change_log
+import audit
+from downloads import REVALIDATE, attachment_response, if_none_match, not_modified
+from datetime import date, datetime, timedelta
 import uuid
-import json
-import os
-from dotenv import load_dotenv
-import shutil
+from config import settings
 
 
+import schema
 from schema import *
 from models import *
 
-
-load_dotenv('.env')
-
-## SET UP CRYPTO CONTEXT
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
-
-def get_password_hash(password):
-    return pwd_context.hash(password)
-
-def verify_password(plain_password, hashed_password):
-    return pwd_context.verify(plain_password, hashed_password)
-
-ASSET_STORAGE = os.environ['ASSET_STORAGE']
+ASSET_STORAGE = settings.asset_storage
+CLINICAL_ENTRY_BATCH_MAX = 10000
+VITALS_METRICS = ('systolic', 'diastolic', 'pulse', 'body_temp', 'weight')
+VITALS_BUCKETS = ('day', 'week', 'month')
 
 ## INITIALIZE ROUTER
 router = APIRouter()
 
 #REGISTER NEW DOCTOR
-@router.post("/doctor/new")
+@router.post("/doctor/new", response_model=schema.Doctor)
 async def register_doctor(
     name: str = Form(None),
     pob: str = Form(None),
@@ -55,78 +53,67 @@ async def register_doctor(
     email: EmailStr = Form(None),
     password: str = Form(None),
     user_name: str = Form(None),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     # Check for duplicate email
-    existing_user = db.query(User).filter(User.user_email == email).first()
+    existing_user = (await db.scalars(select(User).where(func.lower(User.user_email) == func.lower(email)))).first()
     if existing_user:
         raise HTTPException(status_code=400, detail="Email already registered")
 
+    historical_data = parse_historical(historical)
+    password_hash = await get_password_hash(password)
+
     try:
         user_id = str(uuid.uuid4())  # Generate a UUID for user_id
         doctor_id = str(uuid.uuid4()) # Generate a UUID for doctor_id
         dob_datetime = datetime.fromtimestamp(dob)
-        password_hash = get_password_hash(password)
         
-        if historical:
-            try:
-                # Convert string to dictionary
-                data_dict = json.loads(historical)
-            except json.JSONDecodeError as e:
-                raise HTTPException(status_code=400, detail=f"Invalid JSON for historical field: {str(e)}")
-        else:
-            data_dict = {}
-
-        # Create dynamic fields for the historical model
-        dynamic_fields = {key: (type(value), ...) for key, value in data_dict.items()}
-        DynamicModel = create_model('DynamicModel', **dynamic_fields)
-        dynamic_instance = DynamicModel(**data_dict).json()
-
         user = User(user_id=user_id, user_name=user_name, user_email=email, password=password_hash, user_type=2)
         doctor = Doctor(
             doctor_id=doctor_id, user_id=user_id, 
             name=name, dob=dob_datetime, national_id=national_id, 
             tax_num=tax_num, license_num=license_num, 
-            historical=dynamic_instance, pob=pob, 
+            historical=historical_data, pob=pob, 
             phone_num=phone_num, sex=sex, address=address
         )
         db.add(user)
         db.add(doctor)
-        db.commit()
-        db.refresh(user)
-        db.refresh(doctor)
+        await db.commit()
+        invalidate_user(email)
+        await db.refresh(user)
+        await db.refresh(doctor)
         return doctor
     except Exception as e:
         print(e)
         raise HTTPException(status_code=500, detail=str(e))
     
 ##GET LIST DOCTOR
-@router.get("/doctor/list")
+@router.get("/doctor/list", response_model=schema.Page[schema.Doctor])
 async def view_doctor(
+    poly_id: Optional[str] = None,
+    page: PageParams = Depends(),
     user: str = Depends(get_current_user), 
-    db: Session = Depends(get_db)):
-    try:
-        if user.user_type != 1:
-            raise HTTPException(status_code=403, detail="Access forbidden.")
+    db: AsyncSession = Depends(get_db)):
+    if user.user_type != 1:
+        raise HTTPException(status_code=403, detail="Access forbidden.")
 
-        doctors = db.query(Doctor).all()
-        if not doctors:
-            raise HTTPException(status_code=404, detail="No doctors found")
-        return doctors
-    except Exception as e:
-        raise HTTPException(status_code=500, detail="Internal server error")
+    stmt = select(Doctor)
+    if poly_id is not None:
+        stmt = stmt.join(PolyclinicDoctor, PolyclinicDoctor.doctor_id == Doctor.doctor_id).where(PolyclinicDoctor.poly_id == poly_id)
+
+    return await paginate(db, stmt, page, Doctor.doctor_id, {'name': Doctor.name})
 
 ##GET DOCTOR BY DOCTOR_ID
-@router.get("/doctor/{doctor_id}")
+@router.get("/doctor/{doctor_id}", response_model=schema.Doctor)
 async def get_doctor_by_id(
     doctor_id: str, 
     user: str = Depends(get_current_user),
-    db: Session = Depends(get_db)):
+    db: AsyncSession = Depends(get_db)):
     try:
         if user.user_type not in [1, 2]:
             raise HTTPException(status_code=403, detail="Access forbidden")
         
-        doctor = db.query(Doctor).filter(Doctor.doctor_id == doctor_id).first()
+        doctor = (await db.scalars(select(Doctor).where(Doctor.doctor_id == doctor_id))).first()
         if not doctor:
             raise HTTPException(status_code=404, detail="Doctor not found")
         return doctor
@@ -134,7 +121,7 @@ async def get_doctor_by_id(
         raise HTTPException(status_code=500, detail="Internal server error")
 
 ##UPDATE DOCTOR
-@router.put("/doctor/{doctor_id}")
+@router.put("/doctor/{doctor_id}", response_model=schema.Doctor)
 async def update_doctor(
     doctor_id: str,
     name: str = Form(None),
@@ -148,13 +135,15 @@ async def update_doctor(
     address: str = Form(None),
     sex: bool = Form(None),
     user: str = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
+    historical_data = parse_historical(historical) if historical is not None else None
+
     try:
         if user.user_type != 1:
             raise HTTPException(status_code=403, detail="Access forbidden.")
         
-        doctor = db.query(Doctor).filter(Doctor.doctor_id == doctor_id).first()
+        doctor = (await db.scalars(select(Doctor).where(Doctor.doctor_id == doctor_id))).first()
         if not doctor:
             raise HTTPException(status_code=404, detail="Doctor not found")
     
@@ -173,20 +162,20 @@ async def update_doctor(
         if license_num is not None:
             doctor.license_num = license_num
         if historical is not None:
-            doctor.historical = historical
+            doctor.historical = historical_data
         if address is not None:
             doctor.address = address
         if sex is not None:
             doctor.sex = sex
 
-        db.commit()
-        db.refresh(doctor)
+        await db.commit()
+        await db.refresh(doctor)
         return doctor
     except Exception as e:
         raise HTTPException(status_code=500, detail="Internal server error")
 
 #REGISTER NEW STAFF
-@router.post("/staff/new")
+@router.post("/staff/new", response_model=schema.MedicalStaff)
 async def register_staff(
     name: str = Form(None),
     dob: int = Form(None),  
@@ -204,81 +193,69 @@ async def register_staff(
     db=Depends(get_db)
 ):  
     ## Check for duplicate email
-    existing_user = db.query(User).filter(User.user_email == email).first()
+    existing_user = (await db.scalars(select(User).where(func.lower(User.user_email) == func.lower(email)))).first()
     if existing_user:
         raise HTTPException(status_code=400, detail="Email already registered")
 
+    historical_data = parse_historical(historical)
+    password_hash = await get_password_hash(password)
+
     try:
         user_id = str(uuid.uuid4())  # Generate a UUID for user_id
         staff_id = str(uuid.uuid4()) # Generate a UUID for admin_id
         dob_datetime = datetime.fromtimestamp(dob)
-        password_hash = get_password_hash(password)
-        
-        if historical:
-            try:
-                # Convert string to dictionary
-                data_dict = json.loads(historical)
-            except json.JSONDecodeError as e:
-                raise HTTPException(status_code=400, detail=f"Invalid JSON for historical field: {str(e)}")
-        else:
-            data_dict = {}
-
-        # Create dynamic fields for the historical model
-        dynamic_fields = {key: (type(value), ...) for key, value in data_dict.items()}
-        DynamicModel = create_model('DynamicModel', **dynamic_fields)
-        dynamic_instance = DynamicModel(**data_dict).json()
-
         
         user = User(user_id=user_id, user_name=user_name, user_email=email, password=password_hash, user_type=3)
         staff = MedicalStaff(staff_id=staff_id, user_id=user_id, 
                       name=name, dob=dob_datetime, pob=pob,
                       national_id=national_id, tax_num=tax_num,
-                      license_num=license_num, historical=dynamic_instance,
+                      license_num=license_num, historical=historical_data,
                       phone_num=phone_num, sex=sex, address=address)
         db.add(user)
         db.add(staff)
-        db.commit()
-        db.refresh(user)
-        db.refresh(staff)
+        await db.commit()
+        invalidate_user(email)
+        await db.refresh(user)
+        await db.refresh(staff)
         return staff
     except Exception as e:
         print(e)
         raise HTTPException(status_code=500, detail=str(e))
     
 ##GET LIST STAFF
-@router.get("/staff/list")
+@router.get("/staff/list", response_model=schema.Page[schema.MedicalStaff])
 async def view_staff(
+    lab_id: Optional[str] = None,
+    page: PageParams = Depends(),
     user: str = Depends(get_current_user), 
-    db: Session = Depends(get_db)):
-    try:
-        if user.user_type != 1:
-            raise HTTPException(status_code=403, detail="Access forbidden")
+    db: AsyncSession = Depends(get_db)):
+    if user.user_type != 1:
+        raise HTTPException(status_code=403, detail="Access forbidden")
 
-        staffs = db.query(MedicalStaff).all()
-        if not staffs:
-            raise HTTPException(status_code=404, detail="No staffs found")
-        return staffs
-    except Exception as e:
-        raise HTTPException(status_code=500, detail="Internal server error")
+    stmt = select(MedicalStaff)
+    if lab_id is not None:
+        stmt = stmt.join(LaboratoryStaff, LaboratoryStaff.staff_id == MedicalStaff.staff_id).where(LaboratoryStaff.lab_id == lab_id)
+
+    return await paginate(db, stmt, page, MedicalStaff.staff_id, {'name': MedicalStaff.name})
     
 ##GET STAFF BY STAFF_ID
-@router.get("/staff/{staff_id}")
+@router.get("/staff/{staff_id}", response_model=schema.MedicalStaff)
 async def get_staff_by_id(
     staff_id: str, 
     user: str = Depends(get_current_user),
-    db: Session = Depends(get_db)):
+    db: AsyncSession = Depends(get_db)):
     try:
         if user.user_type != 1:
             raise HTTPException(status_code=403, detail="Access forbidden")
         
-        staff = db.query(MedicalStaff).filter(MedicalStaff.staff_id == staff_id).first()
+        staff = (await db.scalars(select(MedicalStaff).where(MedicalStaff.staff_id == staff_id))).first()
         if not staff:
             raise HTTPException(status_code=404, detail="Staff not found")
         return staff
     except Exception as e:
         raise HTTPException(status_code=500, detail="Internal server error")
     
-@router.put("/staff/{staff_id}")
+@router.put("/staff/{staff_id}", response_model=schema.MedicalStaff)
 async def update_staff(
     staff_id: str,
     name: str = Form(None),
@@ -294,11 +271,13 @@ async def update_staff(
     user: str = Depends(get_current_user),
     db=Depends(get_db)
 ):  
+    historical_data = parse_historical(historical) if historical is not None else None
+
     try:
         if user.user_type != 1:
             raise HTTPException(status_code=403, detail="Access forbidden")
         
-        staff = db.query(MedicalStaff).filter(MedicalStaff.staff_id == staff_id).first()
+        staff = (await db.scalars(select(MedicalStaff).where(MedicalStaff.staff_id == staff_id))).first()
         if not staff:
             raise HTTPException(status_code=404, detail="Staff not found")
 
@@ -317,28 +296,21 @@ async def update_staff(
         if license_num is not None:
             staff.license_num = license_num
         if historical is not None:
-            try:
-                data_dict = json.loads(historical)
-            except json.JSONDecodeError as e:
-                raise HTTPException(status_code=400, detail=f"Invalid JSON for historical field: {str(e)}")
-            dynamic_fields = {key: (type(value), ...) for key, value in data_dict.items()}
-            DynamicModel = create_model('DynamicModel', **dynamic_fields)
-            dynamic_instance = DynamicModel(**data_dict).json()
-            staff.historical = dynamic_instance
+            staff.historical = historical_data
         if address is not None:
             staff.address = address
         if sex is not None:
             staff.sex = sex
 
-        db.commit()
-        db.refresh(staff)
+        await db.commit()
+        await db.refresh(staff)
         return staff
     except Exception as e:
         raise HTTPException(status_code=500, detail="Internal server error")
 
 
 #REGISTER NEW POLYCLINIC
-@router.post("/poly/new")
+@router.post("/poly/new", response_model=schema.Polyclinic)
 async def register_polyclinic(
     poly_name: str = Form(None),
     poly_desc: str = Form(None),
@@ -349,7 +321,7 @@ async def register_polyclinic(
         raise HTTPException(status_code=403, detail="Access forbidden")
     
     ## Check for duplicate polyclinic name
-    existing_poly = db.query(Polyclinic).filter(Polyclinic.poly_name == poly_name).first()
+    existing_poly = (await db.scalars(select(Polyclinic).where(Polyclinic.poly_name == poly_name))).first()
     if existing_poly:
         raise HTTPException(status_code=400, detail="This polyclinic name already exist")
     
@@ -358,49 +330,43 @@ async def register_polyclinic(
         
         polyclinic = Polyclinic(poly_id=poly_id, poly_name=poly_name, poly_desc=poly_desc)
         db.add(polyclinic)
-        db.commit()
-        db.refresh(polyclinic)
+        await db.commit()
+        polyclinics.invalidate()
+        await db.refresh(polyclinic)
         return polyclinic
     except Exception as e:
         print(e)
         raise HTTPException(status_code=500, detail="Internal server error")
     
 ##GET LIST POLYCLINIC
-@router.get("/poly/list")
+@router.get("/poly/list", response_model=schema.Page[schema.Polyclinic])
 async def view_poly(
+    page: PageParams = Depends(),
     user: str = Depends(get_current_user),
-    db: Session = Depends(get_db)):
-    try:
-        # if user.user_type != 1:
-        #     raise HTTPException(status_code=403, detail="Access forbidden")
+    db: AsyncSession = Depends(get_db)):
+    # if user.user_type != 1:
+    #     raise HTTPException(status_code=403, detail="Access forbidden")
 
-        polyclinics = db.query(Polyclinic).all()
-        if not polyclinics:
-            raise HTTPException(status_code=404, detail="No polyclinics found")
-        return polyclinics
-    except Exception as e:
-        raise HTTPException(status_code=500, detail="Internal server error")
+    rows = await polyclinics.snapshot(db)
+    return paginate_rows(rows, page, Polyclinic.poly_id, {'name': Polyclinic.poly_name})
     
 ##GET POLY BY POLY_ID
-@router.get("/poly/{poly_id}")
+@router.get("/poly/{poly_id}", response_model=schema.Polyclinic)
 async def get_poly_by_id(
     poly_id: str, 
     user: str = Depends(get_current_user),
-    db: Session = Depends(get_db)):
-    try:
-        if user.user_type != 1:
-            raise HTTPException(status_code=403, detail="Access forbidden")
-        
-        polyclinic = db.query(Polyclinic).filter(Polyclinic.poly_id == poly_id).first()
-        if not polyclinic:
-            raise HTTPException(status_code=404, detail="Polyclinic not found")
-        return polyclinic
-    except Exception as e:
-        raise HTTPException(status_code=500, detail="Internal server error")
+    db: AsyncSession = Depends(get_db)):
+    if user.user_type != 1:
+        raise HTTPException(status_code=403, detail="Access forbidden")
+
+    polyclinic = await polyclinics.get(db, poly_id)
+    if not polyclinic:
+        raise HTTPException(status_code=404, detail="Polyclinic not found")
+    return polyclinic
     
 ##CONTINUE HERE 06 JUNE 2024 01:18AM
 #UPDATE POLYCLINIC
-@router.put("/poly/{poly_id}")
+@router.put("/poly/{poly_id}", response_model=schema.Polyclinic)
 async def update_polyclinic(
     poly_id: str,
     poly_name: str = Form(None),
@@ -412,7 +378,7 @@ async def update_polyclinic(
         if user.user_type != 1:
             raise HTTPException(status_code=403, detail="Access forbidden")
 
-        polyclinic = db.query(Polyclinic).filter(Polyclinic.poly_id == poly_id).first()
+        polyclinic = (await db.scalars(select(Polyclinic).where(Polyclinic.poly_id == poly_id))).first()
         if not polyclinic:
             raise HTTPException(status_code=404, detail="Polyclinic not found")
         
@@ -421,15 +387,16 @@ async def update_polyclinic(
         if poly_desc is not None:
             polyclinic.poly_desc = poly_desc
 
-        db.commit()
-        db.refresh(polyclinic)
+        await db.commit()
+        polyclinics.invalidate()
+        await db.refresh(polyclinic)
         return polyclinic
     except Exception as e:
         raise HTTPException(status_code=500, detail="Internal server error")
 
 
 #REGISTER NEW LABORATORY
-@router.post("/lab/new")
+@router.post("/lab/new", response_model=schema.Laboratory)
 async def register_laboratory(
     lab_name: str = Form(None),
     lab_desc: str = Form(None),
@@ -440,7 +407,7 @@ async def register_laboratory(
         raise HTTPException(status_code=403, detail="Access forbidden")
 
     ## Check for duplicate laboratory name
-    existing_poly = db.query(Laboratory).filter(Laboratory.lab_name == lab_name).first()
+    existing_poly = (await db.scalars(select(Laboratory).where(Laboratory.lab_name == lab_name))).first()
     if existing_poly:
         raise HTTPException(status_code=400, detail="This laboratory name already exist")
     
@@ -449,60 +416,54 @@ async def register_laboratory(
         
         laboratory = Laboratory(lab_id=lab_id, lab_name=lab_name, lab_desc=lab_desc)
         db.add(laboratory)
-        db.commit()
-        db.refresh(laboratory)
+        await db.commit()
+        laboratories.invalidate()
+        await db.refresh(laboratory)
         return laboratory
     except Exception as e:
         print(e)
         raise HTTPException(status_code=500, detail="Internal server error")
     
 ##GET LIST LAB
-@router.get("/lab/list")
+@router.get("/lab/list", response_model=schema.Page[schema.Laboratory])
 async def view_lab(
+    page: PageParams = Depends(),
     user: str = Depends(get_current_user), 
-    db: Session = Depends(get_db)):
-    try:
-        # if user.user_type != 1:
-        #     raise HTTPException(status_code=403, detail="Access forbidden")
+    db: AsyncSession = Depends(get_db)):
+    # if user.user_type != 1:
+    #     raise HTTPException(status_code=403, detail="Access forbidden")
 
-        labs = db.query(Laboratory).all()
-        if not labs:
-            raise HTTPException(status_code=404, detail="No labs found")
-        return labs
-    except Exception as e:
-        raise HTTPException(status_code=500, detail="Internal server error")
+    rows = await laboratories.snapshot(db)
+    return paginate_rows(rows, page, Laboratory.lab_id, {'name': Laboratory.lab_name})
 
 ##GET LAB BY LAB_ID
-@router.get("/lab/{lab_id}")
+@router.get("/lab/{lab_id}", response_model=schema.Laboratory)
 async def get_lab_by_id(
     lab_id: str, 
     user: str = Depends(get_current_user),
-    db: Session = Depends(get_db)):
-    try:
-        # if user.user_type != 1:
-        #     raise HTTPException(status_code=403, detail="Access forbidden")
-    
-        lab = db.query(Laboratory).filter(Laboratory.lab_id == lab_id).first()
-        if not lab:
-            raise HTTPException(status_code=404, detail="Laboratory not found")
-        return lab
-    except Exception as e:
-        raise HTTPException(status_code=500, detail="Internal server error")
+    db: AsyncSession = Depends(get_db)):
+    # if user.user_type != 1:
+    #     raise HTTPException(status_code=403, detail="Access forbidden")
+
+    lab = await laboratories.get(db, lab_id)
+    if not lab:
+        raise HTTPException(status_code=404, detail="Laboratory not found")
+    return lab
 
 # UPDATE LABORATORY
-@router.put("/lab/{lab_id}")
+@router.put("/lab/{lab_id}", response_model=schema.Laboratory)
 async def update_laboratory(
     lab_id: str,
     lab_name: str = Form(None),
     lab_desc: str = Form(None),
     user: str = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     try:
         if user.user_type != 1:
             raise HTTPException(status_code=403, detail="Access forbidden")
     
-        laboratory = db.query(Laboratory).filter(Laboratory.lab_id == lab_id).first()
+        laboratory = (await db.scalars(select(Laboratory).where(Laboratory.lab_id == lab_id))).first()
         if not laboratory:
             raise HTTPException(status_code=404, detail="Laboratory not found")
 
@@ -511,15 +472,16 @@ async def update_laboratory(
         if lab_desc is not None:
             laboratory.lab_desc = lab_desc
 
-        db.commit()
-        db.refresh(laboratory)
+        await db.commit()
+        laboratories.invalidate()
+        await db.refresh(laboratory)
         return laboratory
     except Exception as e:
         raise HTTPException(status_code=500, detail="Internal server error")
 
 
 #ASSIGN DOCTOR TO POLYCLINIC
-@router.post("/poly/assign-doctor")
+@router.post("/poly/assign-doctor", response_model=schema.PolyclinicDoctor)
 async def register_doctor_polyclinic(
     poly_id: str=Form(None),
     doctor_id: str=Form(None),
@@ -530,54 +492,53 @@ async def register_doctor_polyclinic(
         raise HTTPException(status_code=403, detail="Access forbidden")
 
     ## Check if doctor_id exist
-    existing_doctor = db.query(Doctor).filter(Doctor.doctor_id == doctor_id).first()
+    existing_doctor = (await db.scalars(select(Doctor).where(Doctor.doctor_id == doctor_id))).first()
     if not existing_doctor:
         raise HTTPException(status_code=400, detail="This doctor ID is missing or does not exist")
     
     ## Check if poly_id exist
-    existing_poly = db.query(Polyclinic).filter(Polyclinic.poly_id == poly_id).first()
-    if not existing_poly:
+    if not await polyclinics.exists(db, poly_id):
         raise HTTPException(status_code=400, detail="This polyclinic ID is missing or does not exist")
     
     # Check if doctor is already assigned to the same poly
-    existing_assignment = db.query(PolyclinicDoctor).filter(
+    existing_assignment = (await db.scalars(select(PolyclinicDoctor).where(
         PolyclinicDoctor.poly_id == poly_id, PolyclinicDoctor.doctor_id == doctor_id
-    ).first()
+    ))).first()
     if existing_assignment:
         raise HTTPException(status_code=400, detail="Doctor is already assigned to this polyclinic")
     
     try:        
         polyclinic_doctor = PolyclinicDoctor(poly_id=poly_id, doctor_id=doctor_id)
         db.add(polyclinic_doctor)
-        db.commit()
-        db.refresh(polyclinic_doctor)
+        await db.commit()
+        await db.refresh(polyclinic_doctor)
         return polyclinic_doctor
     except Exception as e:
         print(e)
         raise HTTPException(status_code=500, detail="Internal server error")
 
 #REMOVE DOCTOR FROM POLYCLINIC
-@router.delete("/poly/remove-doctor")
+@router.delete("/poly/remove-doctor", response_model=schema.Message)
 async def remove_doctor_from_polyclinic(
     poly_id: str = Form(None),
     doctor_id: str = Form(None),
     user: str = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     if user.user_type != 1:
         raise HTTPException(status_code=403, detail="Access forbidden")
 
     try:
         # Check if the assignment exists
-        existing_assignment = db.query(PolyclinicDoctor).filter(
+        existing_assignment = (await db.scalars(select(PolyclinicDoctor).where(
             PolyclinicDoctor.poly_id == poly_id, PolyclinicDoctor.doctor_id == doctor_id
-        ).first()
+        ))).first()
         if not existing_assignment:
             raise HTTPException(status_code=404, detail="Assignment not found")
 
         # Remove the assignment
-        db.delete(existing_assignment)
-        db.commit()
+        await db.delete(existing_assignment)
+        await db.commit()
         return {"message": "Doctor removed from polyclinic successfully"}
     except Exception as e:
         print(e)
@@ -585,77 +546,76 @@ async def remove_doctor_from_polyclinic(
 
 
 #REGISTER/ASSIGN STAFF TO LABORATORY
-@router.post("/lab/assign-staff")
+@router.post("/lab/assign-staff", response_model=schema.LaboratoryStaff)
 async def assign_staff_laboratory(
     lab_id: str = Form(None),
     staff_id: str = Form(None),
     user: str = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     if user.user_type != 1:
         raise HTTPException(status_code=403, detail="Access forbidden")
 
     # Check if staff_id exists
-    existing_staff = db.query(MedicalStaff).filter(MedicalStaff.staff_id == staff_id).first()
+    existing_staff = (await db.scalars(select(MedicalStaff).where(MedicalStaff.staff_id == staff_id))).first()
     if not existing_staff:
         raise HTTPException(status_code=404, detail="Staff ID not found")
 
     # Check if lab_id exists
-    existing_lab = db.query(Laboratory).filter(Laboratory.lab_id == lab_id).first()
-    if not existing_lab:
+    if not await laboratories.exists(db, lab_id):
         raise HTTPException(status_code=404, detail="Laboratory ID not found")
 
     # Check if staff is already assigned to the laboratory
-    existing_assignment = db.query(LaboratoryStaff).filter(
+    existing_assignment = (await db.scalars(select(LaboratoryStaff).where(
         LaboratoryStaff.lab_id == lab_id, LaboratoryStaff.staff_id == staff_id
-    ).first()
+    ))).first()
     if existing_assignment:
         raise HTTPException(status_code=400, detail="Staff is already assigned to this laboratory")
 
     try:
         staff_laboratory = LaboratoryStaff(staff_id=staff_id, lab_id=lab_id)
         db.add(staff_laboratory)
-        db.commit()
-        db.refresh(staff_laboratory)
+        await db.commit()
+        await db.refresh(staff_laboratory)
         return staff_laboratory
     except Exception as e:
         print(e)
         raise HTTPException(status_code=500, detail="Internal server error")
     
 # REMOVE STAFF FROM LABORATORY
-@router.delete("/lab/remove-staff")
+@router.delete("/lab/remove-staff", response_model=schema.Message)
 async def remove_staff_from_laboratory(
     lab_id: str = Form(None),
     staff_id: str = Form(None),
     user: str = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     if user.user_type != 1:
         raise HTTPException(status_code=403, detail="Access forbidden")
 
     try:
         # Check if the assignment exists
-        existing_assignment = db.query(LaboratoryStaff).filter(
+        existing_assignment = (await db.scalars(select(LaboratoryStaff).where(
             LaboratoryStaff.lab_id == lab_id, LaboratoryStaff.staff_id == staff_id
-        ).first()
+        ))).first()
         if not existing_assignment:
             raise HTTPException(status_code=404, detail="Assignment not found")
 
         # Remove the assignment
-        db.delete(existing_assignment)
-        db.commit()
+        await db.delete(existing_assignment)
+        await db.commit()
         return {"message": "Staff removed from laboratory successfully"}
     except Exception as e:
         print(e)
         raise HTTPException(status_code=500, detail="Internal server error")
 
-@router.post("/patient/assign-interest")
+@router.post("/patient/assign-interest", response_model=schema.Message)
 async def assign_patient_interest(
     patient_id: Optional[str] = Form(None),
     staff_id: Optional[str] = Form(None),
     doctor_id: Optional[str] = Form(None),
     user: str = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     if user.user_type != 1:
         raise HTTPException(status_code=403, detail="Access forbidden")
@@ -665,27 +625,27 @@ async def assign_patient_interest(
         raise HTTPException(status_code=400, detail="Either staff_id or doctor_id is required")
 
     # Check if patient exists
-    existing_patient = db.query(Patient).filter(Patient.patient_id == patient_id).first()
+    existing_patient = (await db.scalars(select(Patient).where(Patient.patient_id == patient_id))).first()
     if not existing_patient:
         raise HTTPException(status_code=404, detail="Patient not found")
 
     # Check if staff exists (if provided)
     if staff_id:
-        existing_staff = db.query(MedicalStaff).filter(MedicalStaff.staff_id == staff_id).first()
+        existing_staff = (await db.scalars(select(MedicalStaff).where(MedicalStaff.staff_id == staff_id))).first()
         if not existing_staff:
             raise HTTPException(status_code=404, detail="Staff not found")
 
     # Check if doctor exists (if provided)
     if doctor_id:
-        existing_doctor = db.query(Doctor).filter(Doctor.doctor_id == doctor_id).first()
+        existing_doctor = (await db.scalars(select(Doctor).where(Doctor.doctor_id == doctor_id))).first()
         if not existing_doctor:
             raise HTTPException(status_code=404, detail="Doctor not found")
 
     # Attempt to create patient interest record
-    existing_interest = db.query(PatientInterest).filter(
+    existing_interest = (await db.scalars(select(PatientInterest).where(
         PatientInterest.patient_id == patient_id,
         (PatientInterest.staff_id == staff_id) | (PatientInterest.doctor_id == doctor_id)
-    ).first()
+    ))).first()
 
     if existing_interest:
         raise HTTPException(status_code=400, detail="Patient interest already exists")
@@ -693,57 +653,57 @@ async def assign_patient_interest(
     try:
         patient_interest = PatientInterest(patient_id=patient_id, staff_id=staff_id, doctor_id=doctor_id)
         db.add(patient_interest)
-        db.commit()
+        await db.commit()
         return {"message": "Patient interest successfully assigned"}
     except Exception as e:
         print(e)
         raise HTTPException(status_code=500, detail="Internal server error")
 
 # REMOVE PATIENT INTEREST
-@router.delete("/patient/remove-interest")
+@router.delete("/patient/remove-interest", response_model=schema.Message)
 async def remove_patient_interest(
     patient_id: str = Form(...),
     staff_id: str = Form(None),
     doctor_id: str = Form(None),
     user: str = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     if user.user_type != 1:
         raise HTTPException(status_code=403, detail="Access forbidden")
 
     # Check if the patient interest record exists based on the combination of parameters
-    existing_interest = db.query(PatientInterest).filter(
+    existing_interest = (await db.scalars(select(PatientInterest).where(
         PatientInterest.patient_id == patient_id,
         ((PatientInterest.staff_id == staff_id) & (PatientInterest.doctor_id == None)) |
         ((PatientInterest.doctor_id == doctor_id) & (PatientInterest.staff_id == None))
-    ).first()
+    ))).first()
 
     if not existing_interest:
         raise HTTPException(status_code=404, detail="Patient interest not found")
 
     try:
         # Delete the patient interest record
-        db.delete(existing_interest)
-        db.commit()
+        await db.delete(existing_interest)
+        await db.commit()
         return {"message": "Patient interest successfully removed"}
     except Exception as e:
         print(e)
         raise HTTPException(status_code=500, detail=str(e))
 
 #CREATE NEW MEDICAL RECORD
-@router.post("/emr/new")
+@router.post("/emr/new", response_model=schema.MedicalRecord)
 async def create_medical_record(
     patient_id: Optional[str] = Form(None),
     created_date: datetime = Form(None),
     last_editted: datetime = Form(None),
     user: str = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     if user.user_type not in [1,2,3]:
         raise HTTPException(status_code=403, detail="Access forbidden")
     
     # Check existing medical record
-    medical_record = db.query(MedicalRecord).filter(MedicalRecord.patient_id == patient_id).first()
+    medical_record = (await db.scalars(select(MedicalRecord).where(MedicalRecord.patient_id == patient_id))).first()
     if medical_record:
         raise HTTPException(status_code=400, detail="There is existing medical record") 
     
@@ -752,54 +712,82 @@ async def create_medical_record(
     try:
         medical_record = MedicalRecord(record_id=record_id, patient_id=patient_id, created_date=created_date, last_editted=last_editted)
         db.add(medical_record)
-        db.commit()
-        db.refresh(medical_record)
+        await patient_summary.refresh_patients(db, [patient_id])
+        await change_log.record(db, 'medical_record', 'insert', record_id, patient_id=patient_id)
+        await db.commit()
+        await db.refresh(medical_record)
         return medical_record
 
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
     
 ##GET LIST MEDICAL RECORD
-@router.get("/emr/list")
+@router.get("/emr/list", response_model=schema.Page[schema.MedicalRecord])
 async def view_emr(
+    request: Request,
+    patient_id: Optional[str] = None,
+    stream: bool = False,
+    page: PageParams = Depends(),
     user: str = Depends(get_current_user),
-    db: Session = Depends(get_db)):
-    try:
-        if user.user_type != 1:
-            raise HTTPException(status_code=403, detail="Access forbidden")
+    db: AsyncSession = Depends(get_db)):
+    if user.user_type != 1:
+        raise HTTPException(status_code=403, detail="Access forbidden")
 
-        records = db.query(MedicalRecord).all()
-        if not records:
-            raise HTTPException(status_code=404, detail="No records found")
-        return records
-    except Exception as e:
-        raise HTTPException(status_code=500, detail="Internal server error")
+    filters = []
+    if patient_id is not None:
+        filters.append(MedicalRecord.patient_id == patient_id)
+
+    # Full export: one record per line as NDJSON (?stream=1 or Accept: application/x-ndjson)
+    if wants_ndjson(request, stream):
+        return ndjson_response(select(MedicalRecord.__table__).where(*filters).order_by(MedicalRecord.record_id))
+
+    sortable = {'created_date': MedicalRecord.created_date, 'last_editted': MedicalRecord.last_editted}
+    return await paginate(db, select(MedicalRecord).where(*filters), page, MedicalRecord.record_id, sortable)
     
 ##GET MEDICAL RECORD BY ID
-@router.get("/emr/{record_id}")
+@router.get("/emr/{record_id}", response_model=schema.MedicalRecordDetail)
 async def get_medical_record(
     record_id: str, 
+    request: Request,
+    response: Response,
     user: str = Depends(get_current_user),
-    db: Session = Depends(get_db)):
+    db: AsyncSession = Depends(get_db)):
+    # Conditional GET: the record's version (bumped by every child write) is the ETag, so an
+    # unchanged record costs one primary key lookup and a 304
+    version = await db.scalar(select(MedicalRecord.version).where(MedicalRecord.record_id == record_id))
+    if version is None:
+        raise HTTPException(status_code=404, detail="Medical record not found")
+    etag = f'W/"r{version}"'
+    if if_none_match(request, etag):
+        audit.record(user, 'medical_record.read', record_id, not_modified=True)
+        return not_modified(etag)
+    audit.record(user, 'medical_record.read', record_id)
+    response.headers['etag'] = etag
+    response.headers['cache-control'] = REVALIDATE
+
     try:
         # if user.user_type != 1:
         #     raise HTTPException(status_code=403, detail="Access forbidden")
         
-        medical_record = db.query(MedicalRecord).filter(MedicalRecord.record_id == record_id).first()
+        medical_record = (await db.scalars(
+            select(MedicalRecord)
+            .where(MedicalRecord.record_id == record_id)
+            .options(
+                selectinload(MedicalRecord.medical_note),
+                selectinload(MedicalRecord.clinical_entry),
+                selectinload(MedicalRecord.lab_report),
+            )
+        )).first()
         if not medical_record:
             raise HTTPException(status_code=404, detail="Medical record not found")
 
-        medical_record.medical_note = db.query(MedicalNote).filter(MedicalNote.record_id == record_id).all()
-        medical_record.clinical_entry = db.query(ClinicalEntry).filter(ClinicalEntry.record_id == record_id).all()
-        medical_record.lab_report = db.query(LabReport).filter(LabReport.record_id == record_id).all()
-
         return medical_record
     except Exception as e:
         raise HTTPException(status_code=500, detail="Internal server error")
 
 #CONTI NUE 6 JUNI 2024 05:54AM    
 ## CREATE NEW MEDICAL_NOTE
-@router.post("/emr/new-medical-note")
+@router.post("/emr/new-medical-note", response_model=schema.MedicalNote)
 async def create_medical_note(
     record_id: str = Form(None),
     note_date: int = Form(None),
@@ -809,28 +797,24 @@ async def create_medical_note(
     attachment: UploadFile = File(None),
     diagnosis: str = Form(None),
     user: str = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     if user.user_type != 2:
         raise HTTPException(status_code=403, detail="Access forbidden")
     
     # Check existing medical record
-    medical_record = db.query(MedicalRecord).filter(MedicalRecord.record_id == record_id).first()
+    medical_record = (await db.scalars(select(MedicalRecord).where(MedicalRecord.record_id == record_id))).first()
     if not medical_record:
         raise HTTPException(status_code=404, detail="Medical record not found") 
     
     note_id = str(uuid.uuid4())  # Generate a UUID for record
 
-    try:
-        attachment_path = None
-        if attachment:
-            save_dir = "attachments"
-            os.makedirs(save_dir, exist_ok=True)
-            file_location = f"{save_dir}/{note_id}_{attachment.filename}"
-            with open(file_location, "wb") as file_object:
-                shutil.copyfileobj(attachment.file, file_object)
-            attachment_path = file_location
+    # Stored before the try so a 413 from the store reaches the client
+    attachment_digest = None
+    if attachment:
+        attachment_digest = await storage.store(db, attachment.file)
 
+    try:
         note_date = datetime.fromtimestamp(note_date)
 
         medical_note = MedicalNote(
@@ -840,61 +824,84 @@ async def create_medical_note(
             note_content=note_content,
             doctor_id=doctor_id,
             poly_id=poly_id,
-            attachment=attachment_path,
-            diagnosis=diagnosis
+            attachment=attachment_digest,
+            diagnosis=diagnosis,
+            search_vector=note_search.note_vector(diagnosis, note_content),
         )
         db.add(medical_note)
-        db.commit()
-        db.refresh(medical_note)
+        await patient_summary.refresh_records(db, [record_id])
+        await change_log.record(db, 'medical_note', 'insert', note_id, record_id=record_id)
+        await db.commit()
+        await db.refresh(medical_note)
         return medical_note
 
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 #UPDATE MEDICAL_NOTE
-@router.put("/emr/medical-note/{note_id}")
+@router.put("/emr/medical-note/{note_id}", response_model=schema.MedicalNote)
 async def update_medical_note(
     note_id: str,
     note_content: str = Form(None),
     diagnosis: str = Form(None),
     attachment: UploadFile = File(None),
     user: str = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     if user.user_type != 2:
         raise HTTPException(status_code=403, detail="Access forbidden")
     
     # Check if the medical note exists
-    medical_note = db.query(MedicalNote).filter(MedicalNote.note_id == note_id).first()
+    medical_note = (await db.scalars(select(MedicalNote).where(MedicalNote.note_id == note_id))).first()
     if not medical_note:
         raise HTTPException(status_code=404, detail="Medical note not found")
 
+    if attachment:
+        medical_note.attachment = await storage.replace(db, medical_note.attachment, attachment.file)
+
     try:
         # Update the medical note content and diagnosis if provided
         if note_content is not None:
             medical_note.note_content = note_content
         if diagnosis is not None:
             medical_note.diagnosis = diagnosis
+        if note_content is not None or diagnosis is not None:
+            medical_note.search_vector = note_search.note_vector(medical_note.diagnosis, medical_note.note_content)
 
-        # Update the attachment if provided
-        if attachment:
-            save_dir = "attachments"
-            os.makedirs(save_dir, exist_ok=True)
-            file_location = f"{save_dir}/{note_id}_{attachment.filename}"
-            with open(file_location, "wb") as file_object:
-                shutil.copyfileobj(attachment.file, file_object)
-            medical_note.attachment = file_location
-
-        db.commit()
-        db.refresh(medical_note)
+        await patient_summary.refresh_records(db, [medical_note.record_id])
+        await change_log.record(db, 'medical_note', 'update', medical_note.note_id, record_id=medical_note.record_id)
+        await db.commit()
+        await db.refresh(medical_note)
         return medical_note
 
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+
+##SEARCH MEDICAL NOTES
+# Full-text search over diagnosis and note content, best match first (see note_search.py).
+# q takes web search syntax: words, "quoted phrases", OR, -excluded
+@router.get("/emr/medical-note/search", response_model=schema.Page[schema.NoteSearchHit])
+async def search_medical_notes(
+    q: str,
+    patient_id: Optional[uuid.UUID] = None,
+    poly_id: Optional[uuid.UUID] = None,
+    page: PageParams = Depends(),
+    user: str = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    if user.user_type not in [1, 2, 3]:
+        raise HTTPException(status_code=403, detail="Access forbidden")
+    if page.sort is not None:
+        raise HTTPException(status_code=400, detail="Search results are ordered by rank")
+
+    try:
+        return await note_search.search_notes(db, q, page, patient_id=patient_id, poly_id=poly_id)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
     
 ## CREATE NEW CLINICAL ENTRY IN EXISTING RECORD
-@router.post("/emr/new-clinical-entry") 
+@router.post("/emr/new-clinical-entry", response_model=schema.ClinicalEntry)
 async def create_clinical_entry(
     record_id: str = Form(None),
     entry_date: int = Form(None),
@@ -908,13 +915,13 @@ async def create_clinical_entry(
     pulse: Optional[int] = Form(None),
     note: Optional[str] = Form(None),
     user: str = Depends(get_current_user),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
 ):
     if user.user_type not in [1,2,3,4]:
         raise HTTPException(status_code=403, detail="Access forbidden")
     
     # Check existing medical record
-    medical_record = db.query(MedicalRecord).filter(MedicalRecord.record_id == record_id).first()
+    medical_record = (await db.scalars(select(MedicalRecord).where(MedicalRecord.record_id == record_id))).first()
     if not medical_record:
         raise HTTPException(status_code=400, detail="Medical record not found")
     
@@ -938,15 +945,75 @@ async def create_clinical_entry(
             note=note
         )
         db.add(clinical_entry)
-        db.commit()
-        db.refresh(clinical_entry)
+        await patient_summary.refresh_records(db, [record_id])
+        await change_log.record(db, 'clinical_entry', 'insert', entry_id, record_id=record_id)
+        await db.commit()
+        await db.refresh(clinical_entry)
         return clinical_entry
 
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
     
+## CREATE CLINICAL ENTRIES IN BATCH
+# For monitors and nurses' stations posting vitals in bulk: a JSON array of entries across any
+# number of records. Record and staff ids are checked with one query each, entries pointing at
+# unknown ids are reported per item and the rest go in with a single multi-row insert and one commit.
+@router.post("/emr/clinical-entries", response_model=schema.ClinicalEntryBatchResult)
+async def create_clinical_entries(
+    entries: List[schema.ClinicalEntryIn],
+    user: str = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
+):
+    if user.user_type not in [1,2,3,4]:
+        raise HTTPException(status_code=403, detail="Access forbidden")
+    if len(entries) > CLINICAL_ENTRY_BATCH_MAX:
+        raise HTTPException(status_code=413, detail=f"At most {CLINICAL_ENTRY_BATCH_MAX} entries per request")
+
+    record_ids = {entry.record_id for entry in entries}
+    staff_ids = {entry.staff_id for entry in entries}
+    known_records = set((await db.scalars(select(MedicalRecord.record_id).where(MedicalRecord.record_id.in_(record_ids)))).all())
+    known_staff = set((await db.scalars(select(MedicalStaff.staff_id).where(MedicalStaff.staff_id.in_(staff_ids)))).all())
+
+    results = []
+    rows = []
+    for index, entry in enumerate(entries):
+        if entry.record_id not in known_records:
+            results.append(schema.ClinicalEntryResult(index=index, error="Medical record not found"))
+        elif entry.staff_id not in known_staff:
+            results.append(schema.ClinicalEntryResult(index=index, error="Staff not found"))
+        else:
+            entry_id = uuid.uuid4()
+            rows.append({"entry_id": entry_id, **entry.model_dump()})
+            results.append(schema.ClinicalEntryResult(index=index, entry_id=entry_id))
+
+    try:
+        if rows:
+            # With RETURNING, a list of parameter sets is sent as multi-row INSERT ... VALUES
+            # statements of 1000 rows each (insertmanyvalues), not one statement per entry
+            await db.execute(insert(ClinicalEntry).returning(ClinicalEntry.entry_id), rows)
+            await patient_summary.refresh_records(db, {row['record_id'] for row in rows})
+            await change_log.record_many(db, 'clinical_entry', 'insert', [
+                {'entity_id': row['entry_id'], 'record_id': row['record_id']} for row in rows
+            ])
+            await db.commit()
+        return schema.ClinicalEntryBatchResult(inserted=len(rows), failed=len(entries) - len(rows), results=results)
+
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+## STREAM CLINICAL ENTRIES OVER WEBSOCKET
+# Long-lived device connections, protocol and batching in vitals_stream.py
+@router.websocket("/emr/clinical-entries/stream")
+async def stream_clinical_entries(websocket: WebSocket, device_id: str):
+    user = await vitals_stream.authenticate(websocket)
+    if user is None or user.user_type not in [1,2,3,4]:
+        await websocket.close(code=vitals_stream.CLOSE_POLICY, reason="Access forbidden")
+        return
+
+    await vitals_stream.ingest(websocket, device_id)
+
 #UPDATE CLINICAL ENTRY
-@router.put("/emr/clinical-entry/{entry_id}")
+@router.put("/emr/clinical-entry/{entry_id}", response_model=schema.ClinicalEntry)
 async def update_clinical_entry(
     entry_id: str,
     height: Optional[int] = Form(None),
@@ -958,13 +1025,13 @@ async def update_clinical_entry(
     pulse: Optional[int] = Form(None),
     note: Optional[str] = Form(None),
     user: str = Depends(get_current_user),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
 ):
     if user.user_type != 3:
         raise HTTPException(status_code=403, detail="Access forbidden")
     
     # Check if the clinical entry exists
-    clinical_entry = db.query(ClinicalEntry).filter(ClinicalEntry.entry_id == entry_id).first()
+    clinical_entry = (await db.scalars(select(ClinicalEntry).where(ClinicalEntry.entry_id == entry_id))).first()
     if not clinical_entry:
         raise HTTPException(status_code=404, detail="Clinical entry not found")
 
@@ -987,8 +1054,10 @@ async def update_clinical_entry(
         if note is not None:
             clinical_entry.note = note
 
-        db.commit()
-        db.refresh(clinical_entry)
+        await patient_summary.refresh_records(db, [clinical_entry.record_id])
+        await change_log.record(db, 'clinical_entry', 'update', clinical_entry.entry_id, record_id=clinical_entry.record_id)
+        await db.commit()
+        await db.refresh(clinical_entry)
         return clinical_entry
 
     except Exception as e:
@@ -996,7 +1065,7 @@ async def update_clinical_entry(
 
 
 ## CREATE NEW LAB REPORT IN EXISTING RECORD
-@router.post("/emr/new-lab-report") 
+@router.post("/emr/new-lab-report", response_model=schema.LabReport)
 async def create_lab_report(
     record_id: str = Form(None),
     report_date: int = Form(None),
@@ -1005,30 +1074,25 @@ async def create_lab_report(
     lab_id: str = Form(None),
     attachment: Optional[UploadFile] = File(None),
     user: str = Depends(get_current_user),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
 ):
     if user.user_type != 3:
         raise HTTPException(status_code=403, detail="Access forbidden")
     
     # Check existing medical record
-    medical_record = db.query(MedicalRecord).filter(MedicalRecord.record_id == record_id).first()
+    medical_record = (await db.scalars(select(MedicalRecord).where(MedicalRecord.record_id == record_id))).first()
     if not medical_record:
         raise HTTPException(status_code=400, detail="Medical record not found")
     
     report_id = str(uuid.uuid4())  # Generate a UUID for record
 
+    attachment_digest = None
+    if attachment:
+        attachment_digest = await storage.store(db, attachment.file)
+
     try:
         report_date = datetime.fromtimestamp(report_date)
 
-        attachment_path = None
-        if attachment:
-            save_dir = "attachments"
-            os.makedirs(save_dir, exist_ok=True)
-            file_location = f"{save_dir}/{record_id}_{attachment.filename}"
-            with open(file_location, "wb") as file_object:
-                shutil.copyfileobj(attachment.file, file_object)
-            attachment_path = file_location
-
         lab_report = LabReport(
             report_id = report_id,
             record_id=record_id,
@@ -1036,17 +1100,19 @@ async def create_lab_report(
             lab_note=lab_note,
             staff_id=staff_id,
             lab_id=lab_id,
-            attachment=attachment_path,
+            attachment=attachment_digest,
         )
         db.add(lab_report)
-        db.commit()
-        db.refresh(lab_report)
+        await patient_summary.refresh_records(db, [record_id])
+        await change_log.record(db, 'lab_report', 'insert', report_id, record_id=record_id)
+        await db.commit()
+        await db.refresh(lab_report)
         return lab_report
 
     except Exception as e:
         raise HTTPException(status_code=500, detail="Internal server error")
 
-@router.put("/emr/update-lab-report/{report_id}")
+@router.put("/emr/update-lab-report/{report_id}", response_model=schema.LabReport)
 async def update_lab_report(
     report_id: str,
     lab_note: str = Form(None),
@@ -1054,16 +1120,19 @@ async def update_lab_report(
     lab_id: str = Form(None),
     attachment: Optional[UploadFile] = File(None),
     user: str = Depends(get_current_user),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
 ):
     if user.user_type != 3:
         raise HTTPException(status_code=403, detail="Access forbidden")
     
     # Check if the lab report exists
-    lab_report = db.query(LabReport).filter(LabReport.report_id == report_id).first()
+    lab_report = (await db.scalars(select(LabReport).where(LabReport.report_id == report_id))).first()
     if not lab_report:
         raise HTTPException(status_code=404, detail="Lab report not found")
 
+    if attachment is not None:
+        lab_report.attachment = await storage.replace(db, lab_report.attachment, attachment.file)
+
     try:
         # Update the lab report details if provided
         if lab_note is not None:
@@ -1072,18 +1141,182 @@ async def update_lab_report(
             lab_report.staff_id = staff_id
         if lab_id is not None:
             lab_report.lab_id = lab_id
-        if attachment is not None:
-            # Save attachment if provided
-            save_dir = "attachments"
-            os.makedirs(save_dir, exist_ok=True)
-            file_location = f"{save_dir}/{report_id}_{attachment.filename}"
-            with open(file_location, "wb") as file_object:
-                shutil.copyfileobj(attachment.file, file_object)
-            lab_report.attachment = file_location
-
-        db.commit()
-        db.refresh(lab_report)
+
+        await patient_summary.refresh_records(db, [lab_report.record_id])
+        await change_log.record(db, 'lab_report', 'update', lab_report.report_id, record_id=lab_report.record_id)
+        await db.commit()
+        await db.refresh(lab_report)
         return lab_report
 
     except Exception as e:
         raise HTTPException(status_code=500, detail="Internal server error")
+
+
+## UPLOAD ATTACHMENTS AS RAW BODY
+# Multipart uploads are spooled to a temp file by Starlette before the handler runs, so every
+# byte is written twice. These take the file as the request body and stream it straight into
+# the attachment store:  curl -T scan.pdf -H "Authorization: Bearer ..." .../attachment
+@router.put("/emr/medical-note/{note_id}/attachment", response_model=schema.MedicalNote)
+async def upload_medical_note_attachment(
+    note_id: str,
+    request: Request,
+    user: str = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    if user.user_type != 2:
+        raise HTTPException(status_code=403, detail="Access forbidden")
+    storage.check_content_length(request)
+
+    medical_note = (await db.scalars(select(MedicalNote).where(MedicalNote.note_id == note_id))).first()
+    if not medical_note:
+        raise HTTPException(status_code=404, detail="Medical note not found")
+
+    medical_note.attachment = await storage.replace_stream(db, medical_note.attachment, request.stream())
+    await change_log.record(db, 'medical_note', 'update', medical_note.note_id, record_id=medical_note.record_id)
+    await db.commit()
+    await db.refresh(medical_note)
+    return medical_note
+
+@router.put("/emr/lab-report/{report_id}/attachment", response_model=schema.LabReport)
+async def upload_lab_report_attachment(
+    report_id: str,
+    request: Request,
+    user: str = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    if user.user_type != 3:
+        raise HTTPException(status_code=403, detail="Access forbidden")
+    storage.check_content_length(request)
+
+    lab_report = (await db.scalars(select(LabReport).where(LabReport.report_id == report_id))).first()
+    if not lab_report:
+        raise HTTPException(status_code=404, detail="Lab report not found")
+
+    lab_report.attachment = await storage.replace_stream(db, lab_report.attachment, request.stream())
+    await change_log.record(db, 'lab_report', 'update', lab_report.report_id, record_id=lab_report.record_id)
+    await db.commit()
+    await db.refresh(lab_report)
+    return lab_report
+
+
+## DOWNLOAD ATTACHMENTS
+async def check_record_access(db, user, record_id):
+    # Admins, doctors and medical staff see every record, patients only their own
+    if user.user_type in [1, 2, 3]:
+        return
+    owner = (await db.scalars(
+        select(Patient.user_id)
+        .join(MedicalRecord, MedicalRecord.patient_id == Patient.patient_id)
+        .where(MedicalRecord.record_id == record_id)
+    )).first()
+    if owner is None or str(owner) != str(user.user_id):
+        raise HTTPException(status_code=403, detail="Access forbidden")
+
+@router.get("/emr/medical-note/{note_id}/attachment")
+async def download_medical_note_attachment(
+    note_id: str,
+    request: Request,
+    user: str = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    medical_note = (await db.scalars(select(MedicalNote).where(MedicalNote.note_id == note_id))).first()
+    if not medical_note:
+        raise HTTPException(status_code=404, detail="Medical note not found")
+    await check_record_access(db, user, medical_note.record_id)
+
+    return await attachment_response(request, medical_note.attachment)
+
+@router.get("/emr/lab-report/{report_id}/attachment")
+async def download_lab_report_attachment(
+    report_id: str,
+    request: Request,
+    user: str = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    lab_report = (await db.scalars(select(LabReport).where(LabReport.report_id == report_id))).first()
+    if not lab_report:
+        raise HTTPException(status_code=404, detail="Lab report not found")
+    await check_record_access(db, user, lab_report.record_id)
+
+    return await attachment_response(request, lab_report.attachment)
+
+
+## VITALS TIME SERIES
+# Chart data for a record: clinical entries aggregated per day/week/month in SQL, so a multi-year
+# chart is a few hundred rows. `metrics` is a comma separated subset of VITALS_METRICS.
+@router.get("/emr/{record_id}/vitals", response_model=schema.VitalsSeries, response_model_exclude_none=True)
+async def get_vitals_series(
+    record_id: str,
+    bucket: str = 'day',
+    start: Optional[date] = None,
+    end: Optional[date] = None,
+    metrics: Optional[str] = None,
+    user: str = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    if bucket not in VITALS_BUCKETS:
+        raise HTTPException(status_code=400, detail=f"bucket must be one of {VITALS_BUCKETS}")
+    selected = metrics.split(',') if metrics else list(VITALS_METRICS)
+    unknown = set(selected) - set(VITALS_METRICS)
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown metrics {sorted(unknown)}, use {VITALS_METRICS}")
+
+    if (await db.scalar(select(MedicalRecord.record_id).where(MedicalRecord.record_id == record_id))) is None:
+        raise HTTPException(status_code=404, detail="Medical record not found")
+    await check_record_access(db, user, record_id)
+
+    try:
+        bucket_start = cast(func.date_trunc(bucket, cast(ClinicalEntry.entry_date, DateTime)), Date).label('bucket_start')
+        columns = [bucket_start, func.count().label('count')]
+        for metric in selected:
+            column = getattr(ClinicalEntry, metric)
+            columns += [
+                func.min(column).label(f'{metric}_min'),
+                func.max(column).label(f'{metric}_max'),
+                func.avg(column).label(f'{metric}_mean'),
+            ]
+        stmt = select(*columns).where(ClinicalEntry.record_id == record_id)
+        if start is not None:
+            stmt = stmt.where(ClinicalEntry.entry_date >= start)
+        if end is not None:
+            stmt = stmt.where(ClinicalEntry.entry_date <= end)
+        rows = (await db.execute(stmt.group_by(bucket_start).order_by(bucket_start))).mappings().all()
+
+        points = []
+        for row in rows:
+            point = {"start": row['bucket_start'], "count": row['count']}
+            for metric in selected:
+                # avg() of an integer column is numeric, i.e. Decimal
+                mean = row[f'{metric}_mean']
+                point[metric] = {
+                    "min": row[f'{metric}_min'],
+                    "max": row[f'{metric}_max'],
+                    "mean": None if mean is None else round(float(mean), 2),
+                }
+            points.append(point)
+        return {"record_id": record_id, "bucket": bucket, "points": points}
+
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+## CHANGE FEED
+# Inserted/updated patients, records, notes, entries and lab reports in commit order, for
+# mobile clients and the warehouse to sync incrementally (see change_log.py). Start without a
+# cursor, then keep passing next_cursor back. Patients only see changes to their own data.
+@router.get("/changes", response_model=schema.ChangeFeed)
+async def get_changes(
+    cursor: Optional[str] = None,
+    limit: int = Query(500, ge=1, le=change_log.CHANGE_FEED_LIMIT_MAX),
+    entity: Optional[str] = None,
+    user: str = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    entities = change_log.parse_entities(entity)
+    patient_ids = None
+    if user.user_type not in [1, 2, 3]:
+        patient_ids = (await db.scalars(select(Patient.patient_id).where(Patient.user_id == user.user_id))).all()
+        if not patient_ids:
+            raise HTTPException(status_code=403, detail="Access forbidden")
+
+    return await change_log.read_changes(db, cursor, limit, entities=entities, patient_ids=patient_ids)
@@ -1,170 +1,310 @@
-from pydantic import BaseModel
-from datetime import datetime, date
-from typing import Dict, Optional
+from pydantic import BaseModel, BeforeValidator, ConfigDict, constr
+from datetime import datetime, date, time
+from typing import Annotated, Dict, Generic, List, Optional, TypeVar, Union
+import json
+import uuid
 
 
-class User(BaseModel):
-    user_id: str
-    user_name: str
+# The restored lobotomy.sql schema differs from models.py in a few columns: ID and phone numbers
+# are integers (models.IntegerDigits) but strings in the API, DateTime columns can be dates and the
+# record timestamps are `time with time zone`. The response types accept what the database returns.
+NumericText = Annotated[str, BeforeValidator(lambda value: value if value is None else str(value))]
+Day = Union[datetime, date]
+Timestamp = Union[datetime, time]
+# Older rows stored `historical` as a JSON string inside the JSONB column
+Historical = Annotated[Dict, BeforeValidator(lambda value: json.loads(value) if isinstance(value, str) else value)]
+# Request dates: unix timestamp (like the form endpoints) or an ISO date
+UnixDay = Annotated[date, BeforeValidator(
+    lambda value: datetime.fromtimestamp(int(value)).date() if str(value).isdigit() else value
+)]
+
+T = TypeVar('T')
+
+
+class ORMModel(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+
+class Page(BaseModel, Generic[T]):
+    items: List[T]
+    next_cursor: Optional[str] = None
+
+class Message(BaseModel):
+    message: str
+
+class ImportRowError(BaseModel):
+    row: int
+    error: str
+
+class ImportReport(BaseModel):
+    received: int
+    imported: int
+    failed: int
+    errors: List[ImportRowError]
+
+class ClinicalEntryIn(BaseModel):
+    record_id: uuid.UUID
+    entry_date: UnixDay
+    staff_id: uuid.UUID
+    height: Optional[int] = None
+    weight: Optional[int] = None
+    body_temp: Optional[float] = None
+    blood_type: Optional[constr(max_length=3)] = None
+    systolic: Optional[int] = None
+    diastolic: Optional[int] = None
+    pulse: Optional[int] = None
+    note: Optional[str] = None
+
+class VitalsReading(ClinicalEntryIn):
+    # Per-device sequence number, strictly increasing, see vitals_stream.py
+    seq: int
+
+class ClinicalEntryResult(BaseModel):
+    # index is the position in the request array
+    index: int
+    entry_id: Optional[uuid.UUID] = None
+    error: Optional[str] = None
+
+class ClinicalEntryBatchResult(BaseModel):
+    inserted: int
+    failed: int
+    results: List[ClinicalEntryResult]
+
+class VitalsStats(BaseModel):
+    min: Optional[float] = None
+    max: Optional[float] = None
+    mean: Optional[float] = None
+
+class VitalsPoint(BaseModel):
+    # One bucket; metrics that were not requested are left out
+    start: date
+    count: int
+    systolic: Optional[VitalsStats] = None
+    diastolic: Optional[VitalsStats] = None
+    pulse: Optional[VitalsStats] = None
+    body_temp: Optional[VitalsStats] = None
+    weight: Optional[VitalsStats] = None
+
+class VitalsSeries(BaseModel):
+    record_id: uuid.UUID
+    bucket: str
+    points: List[VitalsPoint]
+
+class IdentityCacheStats(BaseModel):
+    size: int
+    maxsize: int
+    ttl: float
+    hits: int
+    misses: int
+
+class AuditStats(BaseModel):
+    queue_depth: int
+    queue_max: int
+    enqueued: int
+    # Not queued: the queue was full, or the app was shutting down
+    rejected: int
+    flushed: int
+    # Queued but lost to a failed flush or a drain that ran out of time
+    dropped: int
+    flush_errors: int
+    last_flush_ms: Optional[float] = None
+
+
+class User(ORMModel):
+    # The password hash is never part of a response
+    user_id: uuid.UUID
+    user_name: Optional[str] = None
     user_type: int
     user_email: str
-    password: str
-    class Config:
-        orm_mode = True
 
-class Admin(BaseModel):
-    admin_id: str
-    user_id: str
+class Admin(ORMModel):
+    admin_id: uuid.UUID
+    user_id: uuid.UUID
     name: str
-    dob: datetime
-    tax_number: int
-    national_id: int
-    sex: bool
-    phone_num: Optional[int]
-    address: Optional[str]
-    class Config:
-        orm_mode = True
-
-class Patient(BaseModel):
-    patient_id: str
-    user_id: str
+    dob: Optional[Day] = None
+    tax_number: Optional[NumericText] = None
+    national_id: Optional[NumericText] = None
+    sex: Optional[bool] = None
+    phone_num: Optional[NumericText] = None
+    address: Optional[str] = None
+
+class Patient(ORMModel):
+    patient_id: uuid.UUID
+    user_id: uuid.UUID
     name: str
-    dob: datetime
-    national_id: str
-    sex: bool
-    phone_num: str
-    address: Optional[str]
-    alias: Optional[str]
-    relative_phone: str
-    insurance_id: Optional[str]
-    class Config:
-        orm_mode = True
-
-class Insurance(BaseModel):
-    insurance_id: str
-    insurance_name: str
-    class Config:
-        orm_mode = True
-
-class Doctor(BaseModel):
-    doctor_id: str
-    user_id: str
+    dob: Optional[Day] = None
+    national_id: Optional[NumericText] = None
+    sex: Optional[bool] = None
+    phone_num: Optional[NumericText] = None
+    address: Optional[str] = None
+    alias: Optional[str] = None
+    relative_phone: Optional[NumericText] = None
+    insurance_id: Optional[uuid.UUID] = None
+
+class PatientMatch(ORMModel):
+    # Compact projection for patient lookups
+    patient_id: uuid.UUID
     name: str
-    dob: datetime
-    national_id: int
-    phone_num: int
-    address: Optional[str]
-    pob: str
-    license_num: str
-    tax_num: int
-    historical: Dict
-    sex: bool
+    alias: Optional[str] = None
+    dob: Optional[Day] = None
+    sex: Optional[bool] = None
+    national_id: Optional[NumericText] = None
+    phone_num: Optional[NumericText] = None
 
-    class Config:
-        orm_mode = True
+class Insurance(ORMModel):
+    insurance_id: uuid.UUID
+    insurance_name: Optional[str] = None
 
-class MedicalStaff(BaseModel):
-    staff_id: str
-    user_id: str
+class Doctor(ORMModel):
+    doctor_id: uuid.UUID
+    user_id: uuid.UUID
     name: str
-    dob: datetime
-    national_id: int
-    phone_num: int
-    address: Optional[str]
-    pob: str
+    dob: Day
+    national_id: Optional[NumericText] = None
+    phone_num: NumericText
+    address: Optional[str] = None
+    pob: Optional[str] = None
     license_num: str
-    tax_num: int
-    historical: Dict
-    sex: bool
+    tax_num: NumericText
+    historical: Historical
+    sex: Optional[bool] = None
 
-    class Config:
-        orm_mode = True
+class MedicalStaff(ORMModel):
+    staff_id: uuid.UUID
+    user_id: uuid.UUID
+    name: str
+    dob: Day
+    national_id: Optional[NumericText] = None
+    phone_num: NumericText
+    address: Optional[str] = None
+    pob: Optional[str] = None
+    license_num: str
+    tax_num: NumericText
+    historical: Historical
+    sex: Optional[bool] = None
 
-class Laboratory(BaseModel):
-    lab_id: str
+class Laboratory(ORMModel):
+    lab_id: uuid.UUID
     lab_name: str
-    lab_desc: Optional[str]
+    lab_desc: Optional[str] = None
 
-    class Config:
-        orm_mode = True
-
-class Polyclinic(BaseModel):
-    poly_id: str
+class Polyclinic(ORMModel):
+    poly_id: uuid.UUID
     poly_name: str
-    poly_desc: Optional[str]
-
-    class Config:
-        orm_mode = True
-
-class PolyclinicDoctor(BaseModel):
-    doctor_id: str
-    poly_id: str
-
-    class Config:
-        orm_mode = True
-
-class LaboratoryStaff(BaseModel):
-    staff_id: str
-    lab_id: str
-
-    class Config:
-        orm_mode = True
-
-class PatientInterest(BaseModel):
-    patient_id: str
-    doctor_id: str
-    staff_id: str
-
-    class Config:
-        orm_mode = True
-
-class MedicalRecord(BaseModel):
-    record_id: str
-    patient_id: str
-    created_date: datetime
-    last_editted: datetime
-
-    class Config:
-        orm_mode = True
-
-class ClinicalEntry(BaseModel):
-    entry_id: str
-    record_id: str
-    entry_date: date
-    staff_id: str
-    height: Optional[int]
-    weight: Optional[int]
-    body_temp: Optional[float]
-    blood_type: Optional[str]
-    systolic: Optional[int]
-    diastolic: Optional[int]
-    pulse: Optional[int]
-    note: Optional[str]
-
-    class Config:
-        orm_mode = True
-
-class MedicalNote(BaseModel):
-    note_id: str
-    record_id: str
-    note_date: date
+    poly_desc: Optional[str] = None
+
+class PolyclinicDoctor(ORMModel):
+    doctor_id: uuid.UUID
+    poly_id: uuid.UUID
+
+class LaboratoryStaff(ORMModel):
+    staff_id: uuid.UUID
+    lab_id: uuid.UUID
+
+class PatientInterest(ORMModel):
+    patient_id: uuid.UUID
+    doctor_id: Optional[uuid.UUID] = None
+    staff_id: Optional[uuid.UUID] = None
+
+class MedicalRecord(ORMModel):
+    record_id: uuid.UUID
+    patient_id: uuid.UUID
+    created_date: Timestamp
+    last_editted: Timestamp
+
+class ClinicalEntry(ORMModel):
+    entry_id: uuid.UUID
+    record_id: uuid.UUID
+    entry_date: Day
+    staff_id: uuid.UUID
+    height: Optional[int] = None
+    weight: Optional[int] = None
+    body_temp: Optional[float] = None
+    blood_type: Optional[str] = None
+    systolic: Optional[int] = None
+    diastolic: Optional[int] = None
+    pulse: Optional[int] = None
+    note: Optional[str] = None
+
+class MedicalNote(ORMModel):
+    note_id: uuid.UUID
+    record_id: uuid.UUID
+    note_date: Day
     note_content: str
-    doctor_id: str
-    poly_id: str
-    attachment: Optional[str]
+    doctor_id: uuid.UUID
+    poly_id: uuid.UUID
+    attachment: Optional[str] = None
     diagnosis: str
 
-    class Config:
-        orm_mode = True
-
-class LabReport(BaseModel):
-    report_id: str
-    record_id: str
-    report_date: date
+class LabReport(ORMModel):
+    report_id: uuid.UUID
+    record_id: uuid.UUID
+    report_date: Day
     lab_note: str
-    staff_id: str
-    lab_id: str
-    attachment: str
+    staff_id: uuid.UUID
+    lab_id: uuid.UUID
+    attachment: Optional[str] = None
+
+
+class PatientSummary(ORMModel):
+    patient_id: uuid.UUID
+    name: Optional[str] = None
+    record_count: int
+    entry_count: int
+    note_count: int
+    lab_report_count: int
+    last_entry_date: Optional[Day] = None
+    height: Optional[int] = None
+    weight: Optional[int] = None
+    body_temp: Optional[float] = None
+    blood_type: Optional[str] = None
+    systolic: Optional[int] = None
+    diastolic: Optional[int] = None
+    pulse: Optional[int] = None
+    last_note_date: Optional[Day] = None
+    last_diagnosis: Optional[str] = None
+    last_lab_report_date: Optional[Day] = None
+    updated_at: datetime
+
+class NoteSearchHit(MedicalNote):
+    patient_id: uuid.UUID
+    rank: float
+    # Matching fragments of note_content, terms wrapped in <b></b>
+    headline: str
+
+class Change(BaseModel):
+    seq: int
+    entity: str
+    op: str
+    entity_id: uuid.UUID
+    patient_id: Optional[uuid.UUID] = None
+    changed_at: datetime
+    # Current state of the row, not the state at `seq`
+    data: Optional[Union[Patient, MedicalRecord, MedicalNote, ClinicalEntry, LabReport]] = None
+
+class ChangeFeed(BaseModel):
+    items: List[Change]
+    # Always set: pass it back to continue, it stays put while nothing changes
+    next_cursor: str
+    has_more: bool
+
+## NESTED RESPONSES
+# Only relationships the endpoint eager loads may appear here, anything else would lazy load
+class MedicalRecordEntries(MedicalRecord):
+    clinical_entry: List[ClinicalEntry] = []
+    medical_note: List[MedicalNote] = []
+
+class MedicalRecordDetail(MedicalRecordEntries):
+    lab_report: List[LabReport] = []
+
+class PatientOverview(Patient):
+    medical_record: List[MedicalRecordEntries] = []
+
+class PatientDetail(BaseModel):
+    patient: Patient
+    medical_record: Optional[MedicalRecordDetail] = None
 
-    class Config:
-        orm_mode = True
+class UserProfile(User):
+    patient: List[Patient] = []
+    admin: List[Admin] = []
+    doctor: List[Doctor] = []
+    medical_staff: List[MedicalStaff] = []
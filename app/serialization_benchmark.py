@@ -0,0 +1,71 @@
+from fastapi.responses import JSONResponse, ORJSONResponse
+from fastapi.routing import serialize_response
+from fastapi.utils import create_response_field
+from datetime import date, datetime, timezone
+from models import MedicalRecord, MedicalNote, ClinicalEntry, LabReport
+from sqlalchemy.orm.attributes import set_committed_value
+import argparse
+import asyncio
+import schema
+import time
+import uuid
+
+
+## SERIALIZATION BENCHMARK
+# Serializes one medical record with N notes, entries and lab reports the way FastAPI does for
+# GET /emr/{record_id}: before (no response_model: jsonable_encoder + JSONResponse) and after
+# (schema.MedicalRecordDetail + ORJSONResponse). No database needed.
+#   python serialization_benchmark.py --children 500
+
+
+def build_record(children):
+    # set_committed_value mirrors what selectinload leaves behind: children without back references
+    record_id = uuid.uuid4()
+    now = datetime.now(timezone.utc)
+    record = MedicalRecord(record_id=record_id, patient_id=uuid.uuid4(), created_date=now, last_editted=now)
+    set_committed_value(record, 'medical_note', [
+        MedicalNote(note_id=uuid.uuid4(), record_id=record_id, note_date=now, note_content="Follow-up visit, " * 8,
+                    doctor_id=uuid.uuid4(), poly_id=uuid.uuid4(), attachment=None, diagnosis="J06.9")
+        for _ in range(children)
+    ])
+    set_committed_value(record, 'clinical_entry', [
+        ClinicalEntry(entry_id=uuid.uuid4(), record_id=record_id, entry_date=date.today(), staff_id=uuid.uuid4(),
+                      height=170, weight=65, body_temp=36.6, blood_type="O+", systolic=120, diastolic=80,
+                      pulse=72, note="stable")
+        for _ in range(children)
+    ])
+    set_committed_value(record, 'lab_report', [
+        LabReport(report_id=uuid.uuid4(), record_id=record_id, report_date=date.today(), lab_note="CBC within range",
+                  staff_id=uuid.uuid4(), lab_id=uuid.uuid4(), attachment="ab" * 32)
+        for _ in range(children)
+    ])
+    return record
+
+async def render(field, response_class, record):
+    content = await serialize_response(field=field, response_content=record, is_coroutine=True)
+    return response_class(content).body
+
+async def measure(field, response_class, record, rounds):
+    body = await render(field, response_class, record)
+    started = time.perf_counter()
+    for _ in range(rounds):
+        await render(field, response_class, record)
+    return (time.perf_counter() - started) / rounds * 1000, len(body)
+
+async def main(args):
+    record = build_record(args.children)
+    field = create_response_field(name='response', type_=schema.MedicalRecordDetail)
+
+    before_ms, before_size = await measure(None, JSONResponse, record, args.rounds)
+    after_ms, after_size = await measure(field, ORJSONResponse, record, args.rounds)
+    print(f"record with {args.children} notes/entries/reports, {args.rounds} rounds")
+    print(f"jsonable_encoder + JSONResponse:      {before_ms:8.2f} ms  {before_size} bytes")
+    print(f"response_model + ORJSONResponse:      {after_ms:8.2f} ms  {after_size} bytes")
+    print(f"speedup: {before_ms / after_ms:.1f}x")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="EMR response serialization benchmark")
+    parser.add_argument('--children', type=int, default=500)
+    parser.add_argument('--rounds', type=int, default=20)
+    asyncio.run(main(parser.parse_args()))
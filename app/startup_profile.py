@@ -0,0 +1,60 @@
+from collections import defaultdict
+from config import settings
+import argparse
+import os
+import subprocess
+import sys
+
+
+## STARTUP PROFILE
+# Imports `main` in a fresh interpreter with -X importtime and reports where the time goes.
+#   python startup_profile.py              breakdown by top-level package
+#   python startup_profile.py --check      exit 1 when over STARTUP_IMPORT_BUDGET_MS (CI gate)
+# tests/test_startup.py runs the same check. Import time is noisy, --runs N keeps the fastest run.
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+
+def import_times(module='main'):
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+        capture_output=True, text=True, cwd=APP_DIR,
+    )
+    if result.returncode != 0:
+        raise SystemExit(result.stderr)
+
+    # Lines look like "import time:   self [us] | cumulative | imported package", nesting is
+    # shown by indentation. Self time is grouped by top level package (so fastapi.routing counts
+    # for fastapi wherever it was imported from), the total comes from the top level lines.
+    packages = defaultdict(int)
+    total_us = 0
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative, name = line[len('import time:'):].split('|')
+        if not name.startswith('   '):
+            total_us += int(cumulative)
+        packages[name.strip().split('.')[0]] += int(self_us)
+    return total_us / 1000, {name: us / 1000 for name, us in packages.items()}
+
+def fastest_import(module='main', runs=1):
+    return min((import_times(module) for _ in range(runs)), key=lambda result: result[0])
+
+def main():
+    parser = argparse.ArgumentParser(description="Import-time breakdown of the API process")
+    parser.add_argument('--module', default='main')
+    parser.add_argument('--top', type=int, default=20)
+    parser.add_argument('--check', action='store_true', help="fail when over the startup budget")
+    parser.add_argument('--runs', type=int, default=1, help="report the fastest of N imports")
+    args = parser.parse_args()
+
+    total_ms, packages = fastest_import(args.module, args.runs)
+    for name, ms in sorted(packages.items(), key=lambda item: item[1], reverse=True)[:args.top]:
+        print(f"{ms:10.1f} ms  {name}")
+    print(f"{total_ms:10.1f} ms  total (budget {settings.startup_import_budget_ms:.0f} ms)")
+
+    if args.check and total_ms > settings.startup_import_budget_ms:
+        print("startup import budget exceeded", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,249 @@
+from fastapi import HTTPException
+from sqlalchemy import select, update, delete
+from sqlalchemy.dialects.postgresql import insert
+from starlette.concurrency import run_in_threadpool
+from database import AsyncSessionLocal
+from models import AttachmentBlob, MedicalNote, LabReport
+from config import settings
+import change_log
+import asyncio
+import hashlib
+import os
+import sys
+import tempfile
+
+
+## ATTACHMENT STORE
+# Every upload is stored once under its sha256 digest:  attachments/blobs/ab/abcdef...
+# MedicalNote.attachment / LabReport.attachment hold the digest, attachment_blob counts
+# how many rows point at each blob. Older rows may still hold an "attachments/{id}_{name}" path.
+ATTACHMENT_ROOT = settings.attachment_storage
+BLOB_DIR = os.path.join(ATTACHMENT_ROOT, 'blobs')
+TMP_DIR = os.path.join(BLOB_DIR, 'tmp')
+CHUNK_SIZE = 1024 * 1024
+ATTACHMENT_MAX_BYTES = settings.attachment_max_bytes
+ATTACHMENT_FSYNC = settings.attachment_fsync
+
+_HEX = frozenset('0123456789abcdef')
+
+
+def is_digest(attachment):
+    return attachment is not None and len(attachment) == 64 and set(attachment) <= _HEX
+
+def blob_path(digest):
+    return os.path.join(BLOB_DIR, digest[:2], digest)
+
+def attachment_path(attachment):
+    # Where the bytes of a stored attachment value live on disk
+    if is_digest(attachment):
+        return blob_path(attachment)
+    return attachment
+
+
+def check_content_length(request):
+    # Refuse oversized bodies before reading them when the client announces the size
+    length = request.headers.get('content-length')
+    if length is not None and length.isdigit() and int(length) > ATTACHMENT_MAX_BYTES:
+        raise HTTPException(status_code=413, detail="Attachment too large")
+
+class _BlobWriter:
+    # Hashes while writing to a temp file next to the blobs, so the final move is a rename.
+    # Every method blocks, call them from the threadpool.
+    def __init__(self):
+        os.makedirs(TMP_DIR, exist_ok=True)
+        fd, self.tmp_path = tempfile.mkstemp(dir=TMP_DIR)
+        self.file = os.fdopen(fd, 'wb')
+        self.digest = hashlib.sha256()
+        self.size = 0
+
+    def write(self, data):
+        self.size += len(data)
+        if self.size > ATTACHMENT_MAX_BYTES:
+            raise HTTPException(status_code=413, detail="Attachment too large")
+        self.digest.update(data)
+        self.file.write(data)
+
+    def finish(self):
+        if ATTACHMENT_FSYNC:
+            self.file.flush()
+            os.fsync(self.file.fileno())
+        self.file.close()
+        return self.digest.hexdigest(), self.size, self.tmp_path
+
+    def abort(self):
+        self.file.close()
+        os.unlink(self.tmp_path)
+
+def _spool(source):
+    writer = _BlobWriter()
+    try:
+        while chunk := source.read(CHUNK_SIZE):
+            writer.write(chunk)
+        return writer.finish()
+    except BaseException:
+        writer.abort()
+        raise
+
+def _place(digest, tmp_path):
+    # Duplicate content is already on disk: drop the temp copy instead of writing it again
+    path = blob_path(digest)
+    if os.path.exists(path):
+        os.unlink(tmp_path)
+        return
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    os.replace(tmp_path, path)
+    if ATTACHMENT_FSYNC:
+        # Make the rename itself durable
+        dir_fd = os.open(os.path.dirname(path), os.O_RDONLY)
+        try:
+            os.fsync(dir_fd)
+        finally:
+            os.close(dir_fd)
+
+async def add_reference(db, digest, size, tmp_path):
+    # The upsert takes the blob row lock before the file is placed, so a concurrent
+    # collect_garbage either finishes first (and we place the file again) or sees ref_count > 0.
+    # If the caller rolls back, the file stays without a row until collect_garbage adopts it.
+    await db.execute(
+        insert(AttachmentBlob)
+        .values(digest=digest, size=size, ref_count=1)
+        .on_conflict_do_update(
+            index_elements=[AttachmentBlob.digest],
+            set_={'ref_count': AttachmentBlob.ref_count + 1},
+        )
+    )
+    await run_in_threadpool(_place, digest, tmp_path)
+    return digest
+
+async def store(db, source):
+    # source is a readable binary file (e.g. UploadFile.file), returns the digest to save on the row.
+    # The reference is part of the caller's transaction and is committed with the row.
+    digest, size, tmp_path = await run_in_threadpool(_spool, source)
+    return await add_reference(db, digest, size, tmp_path)
+
+async def store_stream(db, chunks):
+    # chunks is an async iterator of bytes (e.g. request.stream()). The body goes straight to
+    # the blob store without being spooled first; small network chunks are gathered into
+    # CHUNK_SIZE writes so the threadpool hop is paid once per MB, not once per packet.
+    writer = await run_in_threadpool(_BlobWriter)
+    buffer = bytearray()
+    received = 0
+    try:
+        async for chunk in chunks:
+            received += len(chunk)
+            if received > ATTACHMENT_MAX_BYTES:
+                raise HTTPException(status_code=413, detail="Attachment too large")
+            buffer += chunk
+            if len(buffer) >= CHUNK_SIZE:
+                await run_in_threadpool(writer.write, bytes(buffer))
+                buffer.clear()
+        await run_in_threadpool(writer.write, bytes(buffer))
+        digest, size, tmp_path = await run_in_threadpool(writer.finish)
+    except BaseException:
+        writer.abort()
+        raise
+    return await add_reference(db, digest, size, tmp_path)
+
+async def release(db, attachment):
+    # Drop one reference, blobs at zero are removed by collect_garbage
+    if not is_digest(attachment):
+        return
+    await db.execute(
+        update(AttachmentBlob)
+        .where(AttachmentBlob.digest == attachment)
+        .values(ref_count=AttachmentBlob.ref_count - 1)
+    )
+
+async def replace(db, old_attachment, source):
+    digest = await store(db, source)
+    await release(db, old_attachment)
+    return digest
+
+async def replace_stream(db, old_attachment, chunks):
+    digest = await store_stream(db, chunks)
+    await release(db, old_attachment)
+    return digest
+
+
+## MAINTENANCE
+GC_BATCH_SIZE = 1000
+
+def _blob_files():
+    # [(digest, size)] of every blob on disk, temp files excluded
+    if not os.path.isdir(BLOB_DIR):
+        return []
+    files = []
+    for prefix in os.listdir(BLOB_DIR):
+        directory = os.path.join(BLOB_DIR, prefix)
+        if len(prefix) != 2 or not os.path.isdir(directory):
+            continue
+        for name in os.listdir(directory):
+            if is_digest(name):
+                files.append((name, os.path.getsize(os.path.join(directory, name))))
+    return files
+
+async def _adopt_orphans(db):
+    # add_reference places the file before the caller commits, so a rolled back upload leaves a
+    # file without a row. Such files get a row with no references, and the delete below removes
+    # them like any unused blob. For an upload still in flight the insert waits on its row lock
+    # and then conflicts, so its file is left alone.
+    files = await run_in_threadpool(_blob_files)
+    for start in range(0, len(files), GC_BATCH_SIZE):
+        batch = files[start:start + GC_BATCH_SIZE]
+        known = set((await db.scalars(
+            select(AttachmentBlob.digest).where(AttachmentBlob.digest.in_([digest for digest, _ in batch]))
+        )).all())
+        orphans = [{'digest': digest, 'size': size, 'ref_count': 0} for digest, size in batch if digest not in known]
+        if orphans:
+            await db.execute(insert(AttachmentBlob).values(orphans).on_conflict_do_nothing(index_elements=[AttachmentBlob.digest]))
+
+async def collect_garbage(db):
+    await _adopt_orphans(db)
+    removed = (await db.scalars(
+        delete(AttachmentBlob).where(AttachmentBlob.ref_count <= 0).returning(AttachmentBlob.digest)
+    )).all()
+    for digest in removed:
+        try:
+            os.unlink(blob_path(digest))
+        except FileNotFoundError:
+            pass
+    await db.commit()
+    return len(removed)
+
+async def migrate_legacy(db):
+    # Move "attachments/{id}_{name}" files into the blob store and point the rows at the digest
+    # Rows are logged as updates like any other attachment change, which also bumps their
+    # records' versions so cached GET /emr/{id} and /patient/{id} responses revalidate
+    migrated = 0
+    legacy_paths = set()
+    for entity, model, key in (('medical_note', MedicalNote, MedicalNote.note_id), ('lab_report', LabReport, LabReport.report_id)):
+        changes = []
+        rows = (await db.scalars(select(model).where(model.attachment.is_not(None)))).all()
+        for row in rows:
+            if is_digest(row.attachment) or not os.path.exists(row.attachment):
+                continue
+            with open(row.attachment, 'rb') as source:
+                row_digest = await store(db, source)
+            legacy_paths.add(row.attachment)
+            row.attachment = row_digest
+            changes.append({'entity_id': getattr(row, key.key), 'record_id': row.record_id})
+        await change_log.record_many(db, entity, 'update', changes)
+        migrated += len(changes)
+    await db.commit()
+    for path in legacy_paths:
+        os.unlink(path)
+    return migrated
+
+
+async def _main(command):
+    async with AsyncSessionLocal() as db:
+        if command == 'migrate':
+            print(f"migrated {await migrate_legacy(db)} attachments")
+        elif command == 'gc':
+            print(f"removed {await collect_garbage(db)} blobs")
+        else:
+            raise SystemExit("usage: python storage.py migrate|gc")
+
+
+if __name__ == '__main__':
+    asyncio.run(_main(sys.argv[1] if len(sys.argv) > 1 else None))
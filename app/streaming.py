@@ -0,0 +1,41 @@
+from fastapi import Request
+from fastapi.responses import StreamingResponse
+from database import AsyncSessionLocal
+from config import settings
+from datetime import date, datetime, time
+import orjson
+
+
+## EXPORT SETTINGS
+NDJSON_MEDIA_TYPE = 'application/x-ndjson'
+STREAM_BATCH_SIZE = settings.stream_batch_size
+# orjson refuses timezone-aware times (created_date in the restored dump), so dates and
+# times are passed through to _default and written by isoformat
+_DUMP_OPTIONS = orjson.OPT_APPEND_NEWLINE | orjson.OPT_PASSTHROUGH_DATETIME
+
+
+def wants_ndjson(request: Request, stream: bool):
+    return stream or NDJSON_MEDIA_TYPE in request.headers.get('accept', '')
+
+def _default(value):
+    if isinstance(value, (datetime, date, time)):
+        return value.isoformat()
+    return str(value)
+
+async def _ndjson_lines(partitions):
+    # One bytes chunk per partition of row mappings
+    async for partition in partitions:
+        yield b"".join(orjson.dumps(dict(row), default=_default, option=_DUMP_OPTIONS) for row in partition)
+
+async def _ndjson_rows(stmt):
+    # Own session: the export outlives the request handler. Rows come from a
+    # server-side cursor STREAM_BATCH_SIZE at a time as plain mappings (no ORM
+    # identity map), so memory stays flat whatever the table size.
+    async with AsyncSessionLocal() as db:
+        result = await db.stream(stmt.execution_options(yield_per=STREAM_BATCH_SIZE))
+        async for chunk in _ndjson_lines(result.mappings().partitions()):
+            yield chunk
+
+def ndjson_response(stmt):
+    # stmt should select table columns (e.g. select(Patient.__table__)), one line per row
+    return StreamingResponse(_ndjson_rows(stmt), media_type=NDJSON_MEDIA_TYPE)
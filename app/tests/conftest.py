@@ -0,0 +1,59 @@
+import asyncio
+import os
+import sys
+import tempfile
+
+import pytest
+
+
+## TEST SETUP
+# Like the app, tests import the modules in app/ top-level (`from database import ...`). Settings
+# come from the environment as usual, the defaults below only make the modules importable. Tests
+# that talk to Postgres take the `engine` fixture and are skipped when DATABASE_URL is unreachable.
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, APP_DIR)
+
+os.environ.setdefault('DATABASE_URL', 'postgresql://postgres@localhost/lobotomy')
+os.environ.setdefault('SECRET_KEY', 'test')
+os.environ.setdefault('ALGORITHM', 'HS256')
+os.environ.setdefault('ACCESS_TOKEN_EXPIRE_HOURS', '1')
+os.environ.setdefault('ASSET_STORAGE', tempfile.mkdtemp(prefix='assets-'))
+
+
+@pytest.fixture(scope='session')
+def engine():
+    # Blocking psycopg2 engine, enough for EXPLAIN and fixtures
+    from database import engine
+    try:
+        with engine.connect():
+            pass
+    except Exception as e:
+        pytest.skip(f"no database: {e.__class__.__name__}")
+    return engine
+
+
+@pytest.fixture
+def rollback_session(engine):
+    # run(fn) awaits fn(db, connection) with an AsyncSession inside a transaction that is
+    # rolled back afterwards. Each run gets its own engine, asyncpg connections belong to a loop.
+    from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+    from sqlalchemy.pool import NullPool
+    from database import ASYNC_DATABASE_URL
+
+    def run(fn):
+        async def scenario():
+            test_engine = create_async_engine(ASYNC_DATABASE_URL, poolclass=NullPool)
+            try:
+                async with test_engine.connect() as connection:
+                    transaction = await connection.begin()
+                    db = AsyncSession(bind=connection, join_transaction_mode='create_savepoint',
+                                      autoflush=False, expire_on_commit=False)
+                    try:
+                        return await fn(db, connection)
+                    finally:
+                        await db.close()
+                        await transaction.rollback()
+            finally:
+                await test_engine.dispose()
+        return asyncio.run(scenario())
+    return run
@@ -0,0 +1,85 @@
+from types import SimpleNamespace
+import asyncio
+
+import audit
+
+
+USER = SimpleNamespace(user_id='u1', user_type='admin')
+
+
+class FakeWrites(audit.AuditQueue):
+    # flush without a database, `delay` seconds per batch, failing when `fail` is set
+    def __init__(self, delay=0, fail=False, **kwargs):
+        super().__init__(**{'batch_size': 100, 'flush_seconds': 5, 'max_queue': 1000, **kwargs})
+        self.delay = delay
+        self.fail = fail
+        self.batches = []
+
+    async def flush(self, batch):
+        try:
+            await asyncio.sleep(self.delay)
+            if self.fail:
+                raise RuntimeError("copy failed")
+            self.batches.append(list(batch))
+            self.flushed += len(batch)
+        except Exception:
+            self.flush_errors += 1
+            self.dropped += len(batch)
+
+
+def run(queue, events, wait=0.1):
+    async def scenario():
+        queue.start()
+        for n in range(events):
+            queue.record(USER, 'read', n)
+        await asyncio.sleep(wait)
+        await queue.stop()
+    asyncio.run(scenario())
+    return queue.stats()
+
+
+def test_stop_flushes_the_batch_being_collected():
+    # flush_seconds is far away: all 10 events sit in the collector's batch when stop() comes
+    queue = FakeWrites()
+    stats = run(queue, 10)
+    assert stats['enqueued'] == 10
+    assert stats['flushed'] == 10
+    assert stats['enqueued'] == stats['flushed'] + stats['dropped']
+    assert stats['queue_depth'] == 0
+    assert [e[4] for batch in queue.batches for e in batch] == [str(n) for n in range(10)]
+
+
+def test_stop_drains_the_queue_in_batches():
+    queue = FakeWrites(batch_size=4)
+    stats = run(queue, 10, wait=0)
+    assert stats['flushed'] == 10
+    assert stats['enqueued'] == stats['flushed'] + stats['dropped']
+    assert max(len(batch) for batch in queue.batches) <= 4
+
+
+def test_failed_flush_is_counted_as_dropped():
+    stats = run(FakeWrites(fail=True), 10)
+    assert stats['flushed'] == 0
+    assert stats['dropped'] == 10
+    assert stats['flush_errors'] == 1
+
+
+def test_drain_timeout_counts_what_is_left(monkeypatch):
+    monkeypatch.setattr(audit, 'AUDIT_DRAIN_SECONDS', 0.2)
+    # The batch in flight when the drain runs out of time and the events behind it
+    stats = run(FakeWrites(delay=1, batch_size=4), 10, wait=0)
+    assert stats['flushed'] == 0
+    assert stats['dropped'] == 10
+    assert stats['enqueued'] == stats['flushed'] + stats['dropped']
+    assert stats['queue_depth'] == 0
+
+
+def test_full_queue_and_stopped_queue_reject():
+    queue = FakeWrites(max_queue=5)
+    stats = run(queue, 8)
+    assert stats['enqueued'] == 5
+    assert stats['rejected'] == 3
+    assert stats['flushed'] == 5
+    queue.record(USER, 'read', 'late')
+    assert queue.stats()['rejected'] == 4
+    assert queue.stats()['queue_depth'] == 0
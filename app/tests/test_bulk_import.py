@@ -0,0 +1,66 @@
+from sqlalchemy import func, select
+import io
+
+from models import Patient, User
+import bulk_import
+
+
+# Any bcrypt hash, rows carry password_hash so the import does not hash
+HASH = '$2b$12$' + 'a' * 53
+
+def rows(*lines):
+    header = 'email,user_name,password_hash,name,dob,phone_num,national_id,relative_phone\n'
+    return io.BytesIO((header + ''.join(line + '\n' for line in lines)).encode())
+
+def errors_by_row(report):
+    return {error['row']: error['error'] for error in report.errors}
+
+
+def test_number_and_length_checks_are_per_row():
+    report = bulk_import.ImportLog()
+    batch = list(bulk_import.read_rows(rows(
+        f'ok@example.com,ok,{HASH},Ok,1990-01-01,0812345,12,',
+        f'nophone@example.com,nophone,{HASH},No Phone,1990-01-01,,,',
+        f'letters@example.com,letters,{HASH},Letters,1990-01-01,08-123,,',
+        f'big@example.com,big,{HASH},Big,1990-01-01,081234567890,,',
+        f'negative@example.com,negative,{HASH},Negative,1990-01-01,812,-1,',
+        f'long@example.com,{"x" * 26},{HASH},Long Name,1990-01-01,812,,',
+    ), 'csv'))
+    valid = bulk_import.validate_batch(batch, report)
+
+    assert [row_no for row_no, _ in valid] == [1]
+    assert valid[0][1].phone_num == '0812345'
+    errors = errors_by_row(report)
+    assert sorted(errors) == [2, 3, 4, 5, 6]
+    assert errors[2].startswith('phone_num')
+    assert 'digits only' in errors[3]
+    assert str(bulk_import.INT4_MAX) in errors[4]
+    assert errors[5].startswith('national_id')
+    assert errors[6].startswith('user_name')
+
+def test_json_numbers_are_accepted():
+    report = bulk_import.ImportLog()
+    line = f'{{"email": "a@example.com", "user_name": "a", "password_hash": "{HASH}", "name": "A", "dob": "1990-01-01", "phone_num": 812}}'
+    [(_, row)] = bulk_import.validate_batch(bulk_import.read_rows(io.BytesIO(line.encode()), 'ndjson'), report)
+    assert row.phone_num == '812'
+    assert report.failed == 0
+
+
+def test_bad_row_does_not_abort_the_import(rollback_session):
+    async def scenario(db, connection):
+        report = await bulk_import.import_patients(db, rows(
+            f'import-a@example.test,import-a,{HASH},Import A,1990-01-01,812,,',
+            f'import-b@example.test,import-b,{HASH},Import B,1990-01-01,,,',
+            f'import-c@example.test,import-c,{HASH},Import C,1990-01-01,813,99,814',
+        ), 'csv')
+
+        assert report['received'] == 3
+        assert report['imported'] == 2
+        assert [error['row'] for error in report['errors']] == [2]
+        imported = (await db.scalars(
+            select(User.user_email).join(Patient, Patient.user_id == User.user_id)
+            .where(func.lower(User.user_email).like('import-%@example.test'))
+        )).all()
+        assert sorted(imported) == ['import-a@example.test', 'import-c@example.test']
+
+    rollback_session(scenario)
@@ -0,0 +1,43 @@
+from fastapi import HTTPException
+import asyncio
+import time
+
+import pytest
+
+import hashing
+
+
+def test_timed_out_job_keeps_its_slot(monkeypatch):
+    monkeypatch.setattr(hashing, 'HASH_TIMEOUT_SECONDS', 0.2)
+    monkeypatch.setattr(hashing, 'HASH_QUEUE_LIMIT', 1)
+
+    async def scenario():
+        with pytest.raises(HTTPException) as timed_out:
+            await hashing._run(time.sleep, 1)
+        assert 'timed out' in timed_out.value.detail
+        # The worker is still sleeping, a second job must not get past the limit
+        assert hashing._in_flight == 1
+        with pytest.raises(HTTPException) as busy:
+            await hashing._run(time.sleep, 0)
+        assert 'busy' in busy.value.detail
+        await asyncio.sleep(1.5)
+        assert hashing._in_flight == 0
+        await hashing._run(time.sleep, 0)
+        assert hashing._in_flight == 0
+
+    try:
+        asyncio.run(scenario())
+    finally:
+        hashing.shutdown()
+        hashing._executor = None
+
+
+def test_batch_goes_through_the_limit(monkeypatch):
+    monkeypatch.setattr(hashing, 'HASH_QUEUE_LIMIT', 0)
+
+    async def scenario():
+        with pytest.raises(HTTPException) as busy:
+            await hashing.get_password_hashes(['a', 'b'])
+        assert busy.value.status_code == 503
+
+    asyncio.run(scenario())
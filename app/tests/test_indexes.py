@@ -0,0 +1,74 @@
+from sqlalchemy import func, select, text, tuple_
+import json
+import uuid
+
+import pytest
+
+from models import ClinicalEntry, LabReport, MedicalNote, MedicalRecord, Patient, PatientInterest, User
+
+
+ID = uuid.UUID(int=1)
+
+# Hot queries of the routers -> indexes that may serve them (migrations 0003 and 0006)
+HOT_QUERIES = {
+    'login and get_current_user': (
+        select(User).where(func.lower(User.user_email) == func.lower('someone@example.com')),
+        {'ux_user_email_lower'},
+    ),
+    'patient of a user': (
+        select(Patient).where(Patient.user_id == ID),
+        {'ix_patient_user_id'},
+    ),
+    'records of a patient': (
+        select(MedicalRecord).where(MedicalRecord.patient_id == ID),
+        {'ix_medical_record_patient_id'},
+    ),
+    'entries of a record': (
+        select(ClinicalEntry).where(ClinicalEntry.record_id == ID),
+        {'ix_clinical_entry_record_id', 'ix_clinical_entry_record_id_entry_date'},
+    ),
+    'notes of a record': (
+        select(MedicalNote).where(MedicalNote.record_id == ID),
+        {'ix_medical_note_record_id'},
+    ),
+    'lab reports of a record': (
+        select(LabReport).where(LabReport.record_id == ID),
+        {'ix_lab_report_record_id'},
+    ),
+    'patients of a doctor': (
+        select(PatientInterest).where(PatientInterest.doctor_id == ID),
+        {'ix_patient_interest_doctor_id'},
+    ),
+    'patient list page by name': (
+        select(Patient).where(tuple_(Patient.name, Patient.patient_id) > tuple_('M', ID))
+        .order_by(Patient.name.asc().nulls_last(), Patient.patient_id.asc().nulls_last()).limit(51),
+        {'ix_patient_name_patient_id'},
+    ),
+    'record list page by creation time': (
+        select(MedicalRecord).order_by(MedicalRecord.created_date.desc().nulls_first(),
+                                       MedicalRecord.record_id.desc().nulls_first()).limit(51),
+        {'ix_medical_record_created_date_record_id'},
+    ),
+}
+
+
+def index_names(plan):
+    if isinstance(plan, dict):
+        names = {plan['Index Name']} if 'Index Name' in plan else set()
+        return names.union(*(index_names(value) for value in plan.values()))
+    if isinstance(plan, list):
+        return set().union(*(index_names(value) for value in plan))
+    return set()
+
+
+@pytest.mark.parametrize('name', HOT_QUERIES)
+def test_hot_query_uses_index(engine, name):
+    stmt, expected = HOT_QUERIES[name]
+    sql = str(stmt.compile(dialect=engine.dialect, compile_kwargs={'literal_binds': True}))
+    with engine.connect() as connection:
+        # The test tables are small, so ask whether an index can serve the query at all
+        connection.execute(text("SET LOCAL enable_seqscan = off"))
+        plan = connection.exec_driver_sql(f"EXPLAIN (FORMAT JSON) {sql}").scalar()
+        connection.rollback()
+    plan = json.loads(plan) if isinstance(plan, str) else plan
+    assert index_names(plan) & expected, f"{name}: no index from {expected} in {json.dumps(plan)}"
@@ -0,0 +1,42 @@
+from sqlalchemy import insert, update
+import uuid
+
+from database import async_engine
+from models import Admin, Doctor, MedicalStaff, Patient
+
+
+# Columns that are integers in lobotomy.sql, the endpoints set them from digit strings or ints
+NUMBER_COLUMNS = {
+    Patient: ('national_id', 'phone_num', 'relative_phone'),
+    Admin: ('national_id', 'tax_number', 'phone_num'),
+    Doctor: ('national_id', 'phone_num', 'tax_num'),
+    MedicalStaff: ('national_id', 'phone_num', 'tax_num'),
+}
+
+
+def bound(stmt):
+    # -> (SQL, {param: value after the type's bind processing}) as asyncpg would receive them
+    dialect = async_engine.dialect
+    compiled = stmt.compile(dialect=dialect)
+    params = compiled.construct_params()
+    for name, bind in compiled.binds.items():
+        processor = bind.type._cached_bind_processor(dialect)
+        if processor is not None and name in params:
+            params[name] = processor(params[name])
+    return str(compiled), params
+
+
+def test_number_columns_bind_as_integers():
+    for model, columns in NUMBER_COLUMNS.items():
+        key = model.__table__.primary_key.columns[0].name
+        for values in ({column: '0812' for column in columns}, {column: 812 for column in columns}):
+            for stmt in (insert(model).values({key: uuid.uuid4(), **values}), update(model).values(**values)):
+                sql, params = bound(stmt)
+                for column in columns:
+                    assert f"${list(params).index(column) + 1}::INTEGER" in sql, (model, column, sql)
+                    assert params[column] == 812
+
+
+def test_number_columns_keep_null():
+    sql, params = bound(insert(Patient).values(patient_id=uuid.uuid4(), national_id=None, relative_phone=None))
+    assert params['national_id'] is None and params['relative_phone'] is None
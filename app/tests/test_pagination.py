@@ -0,0 +1,58 @@
+from sqlalchemy import select, text
+import uuid
+
+import pytest
+
+from models import Patient
+from pagination import PageParams, paginate, paginate_rows
+
+
+SORTABLE = {'alias': Patient.alias}
+
+
+async def seed(db):
+    # 7 patients under their own insurer, every other one without an alias, two sharing one
+    insurance_id = str(uuid.uuid4())
+    await db.execute(text("INSERT INTO insurance (insurance_id, insurance_name) VALUES (CAST(:id AS uuid), 'test')"),
+                     {'id': insurance_id})
+    aliases = [None, 'b', None, 'a', None, 'b', None]
+    rows = [{'user_id': str(uuid.uuid4()), 'patient_id': str(uuid.uuid4()), 'alias': alias, 'insurance_id': insurance_id}
+            for alias in aliases]
+    await db.execute(text("""
+        INSERT INTO "user" (user_id, user_name, user_email, password, user_type)
+        VALUES (CAST(:user_id AS uuid), 'test', CAST(:user_id AS text) || '@test.invalid', '!', 4)
+    """), rows)
+    await db.execute(text("""
+        INSERT INTO patient (patient_id, user_id, name, dob, phone_num, alias, insurance_id)
+        VALUES (CAST(:patient_id AS uuid), CAST(:user_id AS uuid), 'Test', date '1980-01-01', 800000000,
+                CAST(:alias AS text), CAST(:insurance_id AS uuid))
+    """), rows)
+    return insurance_id
+
+async def walk(db, stmt, order, limit):
+    # Every page in turn, -> patient ids in the order they were served
+    served, cursor = [], None
+    while True:
+        page = PageParams(cursor=cursor, limit=limit, sort='alias', order=order)
+        result = await paginate(db, stmt, page, Patient.patient_id, SORTABLE)
+        served += [patient.patient_id for patient in result['items']]
+        cursor = result['next_cursor']
+        if cursor is None:
+            return served
+
+
+@pytest.mark.parametrize('order', ['asc', 'desc'])
+@pytest.mark.parametrize('limit', [1, 2, 3])
+def test_keyset_pages_keep_null_sort_values(rollback_session, order, limit):
+    async def scenario(db, connection):
+        insurance_id = await seed(db)
+        stmt = select(Patient).where(Patient.insurance_id == insurance_id)
+        rows = [{'patient_id': patient.patient_id, 'alias': patient.alias} for patient in (await db.scalars(stmt)).all()]
+
+        served = await walk(db, stmt, order, limit)
+        page = PageParams(cursor=None, limit=len(rows), sort='alias', order=order)
+        expected = [row['patient_id'] for row in paginate_rows(rows, page, Patient.patient_id, SORTABLE)['items']]
+        assert served == expected
+        assert len(set(served)) == len(rows)
+
+    rollback_session(scenario)
@@ -0,0 +1,72 @@
+from sqlalchemy import event, text
+from starlette.requests import Request
+import math
+import uuid
+
+import pytest
+
+from dependencies import Principal
+from pagination import PageParams
+from routers import admin
+
+
+ADMIN = Principal(user_id=uuid.uuid4(), user_email='admin@test.invalid', user_type=1)
+SELECTIN_BATCH = 500
+
+
+async def seed(db, patients, records):
+    # Patients under their own insurer, so the listing can be scoped to them
+    insurance_id = str(uuid.uuid4())
+    await db.execute(text("INSERT INTO insurance (insurance_id, insurance_name) VALUES (CAST(:id AS uuid), 'test')"),
+                     {'id': insurance_id})
+    rows = [{'user_id': str(uuid.uuid4()), 'patient_id': str(uuid.uuid4()), 'n': n} for n in range(patients)]
+    await db.execute(text("""
+        INSERT INTO "user" (user_id, user_name, user_email, password, user_type)
+        VALUES (CAST(:user_id AS uuid), 'test', CAST(:user_id AS text) || '@test.invalid', '!', 4)
+    """), rows)
+    await db.execute(text("""
+        INSERT INTO patient (patient_id, user_id, name, dob, phone_num, insurance_id)
+        VALUES (CAST(:patient_id AS uuid), CAST(:user_id AS uuid), 'Test', date '1980-01-01',
+                800000000 + CAST(:n AS int), CAST(:insurance_id AS uuid))
+    """), [{**row, 'insurance_id': insurance_id} for row in rows])
+    await db.execute(text("""
+        INSERT INTO medical_record (record_id, patient_id, created_date, last_editted)
+        SELECT gen_random_uuid(), CAST(:patient_id AS uuid), current_time, current_time
+        FROM generate_series(1, CAST(:records AS int))
+    """), [{'patient_id': row['patient_id'], 'records': records} for row in rows])
+    return insurance_id
+
+async def count_statements(db, connection, insurance_id, limit):
+    statements = []
+    listener = lambda *args: statements.append(args[2])
+    event.listen(connection.sync_connection, 'before_cursor_execute', listener)
+    try:
+        request = Request({'type': 'http', 'headers': []})
+        page = PageParams(cursor=None, limit=limit, sort=None, order='asc')
+        result = await admin.view_patient(request, insurance_id, False, page, ADMIN, db)
+    finally:
+        event.remove(connection.sync_connection, 'before_cursor_execute', listener)
+    return len(statements), result
+
+
+@pytest.mark.parametrize('patients, records', [(2, 1), (50, 4), (120, 2)])
+def test_patient_list_query_count_does_not_grow_with_data(rollback_session, patients, records):
+    async def scenario(db, connection):
+        insurance_id = await seed(db, patients, records)
+        count, result = await count_statements(db, connection, insurance_id, 50)
+        assert len(result['items']) == min(patients, 50)
+        assert all(len(patient.medical_record) == records for patient in result['items'])
+        # patients, records, clinical entries, medical notes
+        assert count == 4
+
+    rollback_session(scenario)
+
+
+def test_patient_list_query_count_per_records_on_page(rollback_session):
+    # More than 500 records on one page split the entry and note IN lists
+    async def scenario(db, connection):
+        insurance_id = await seed(db, 300, 3)
+        count, result = await count_statements(db, connection, insurance_id, 300)
+        assert count == 2 + 2 * math.ceil(300 * 3 / SELECTIN_BATCH)
+
+    rollback_session(scenario)
@@ -0,0 +1,9 @@
+from config import settings
+import startup_profile
+
+
+def test_app_import_fits_startup_budget():
+    # Fastest of three fresh interpreters, like `python startup_profile.py --check --runs 3`
+    total_ms, packages = startup_profile.fastest_import('main', runs=3)
+    slowest = sorted(packages.items(), key=lambda item: item[1], reverse=True)[:5]
+    assert total_ms <= settings.startup_import_budget_ms, f"{total_ms:.0f} ms, slowest packages {slowest}"
@@ -0,0 +1,50 @@
+from sqlalchemy import select
+import hashlib
+import io
+import os
+
+import pytest
+
+from models import AttachmentBlob
+import storage
+
+
+@pytest.fixture
+def blob_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(storage, 'BLOB_DIR', str(tmp_path / 'blobs'))
+    monkeypatch.setattr(storage, 'TMP_DIR', str(tmp_path / 'blobs' / 'tmp'))
+    monkeypatch.setattr(storage, 'ATTACHMENT_FSYNC', False)
+    return tmp_path / 'blobs'
+
+def put_file(content):
+    digest = hashlib.sha256(content).hexdigest()
+    os.makedirs(os.path.dirname(storage.blob_path(digest)), exist_ok=True)
+    with open(storage.blob_path(digest), 'wb') as blob:
+        blob.write(content)
+    return digest
+
+
+def test_blob_files_skips_temp_files(blob_dir):
+    digest = put_file(b'note')
+    os.makedirs(blob_dir / 'tmp')
+    (blob_dir / 'tmp' / 'upload123').write_bytes(b'partial')
+    assert storage._blob_files() == [(digest, 4)]
+
+
+def test_gc_removes_file_of_rolled_back_upload(rollback_session, blob_dir):
+    async def scenario(db, connection):
+        # An upload whose transaction rolled back: the file was placed, the row is gone
+        async with db.begin_nested() as upload:
+            orphan = await storage.store(db, io.BytesIO(b'rolled back upload'))
+            await upload.rollback()
+        kept = await storage.store(db, io.BytesIO(b'committed upload'))
+        await db.flush()
+        assert os.path.exists(storage.blob_path(orphan))
+
+        # Blobs already at zero references in the database are collected too
+        assert await storage.collect_garbage(db) >= 1
+        assert not os.path.exists(storage.blob_path(orphan))
+        assert os.path.exists(storage.blob_path(kept))
+        assert (await db.scalars(select(AttachmentBlob.digest).where(AttachmentBlob.digest == kept))).first() == kept
+
+    rollback_session(scenario)
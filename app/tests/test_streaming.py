@@ -0,0 +1,70 @@
+from sqlalchemy import Text, cast, func, select
+from datetime import date, datetime, timezone
+import asyncio
+import os
+import uuid
+
+import pytest
+
+from database import async_engine
+import streaming
+
+
+EXPORT_ROWS = 1_000_000
+# Allowed RSS growth over a whole export, the output itself is ~250MB
+RSS_CEILING = 64 * 1024 * 1024
+PAGE_SIZE = os.sysconf('SC_PAGE_SIZE')
+
+pytestmark = pytest.mark.skipif(not os.path.exists('/proc/self/statm'), reason="needs /proc to read RSS")
+
+
+async def generated_partitions(rows, size):
+    # Stands in for a server-side cursor: partitions are built on demand, never kept
+    for start in range(0, rows, size):
+        yield [
+            {
+                'patient_id': uuid.UUID(int=n), 'user_id': uuid.UUID(int=n + rows), 'name': f"Patient {n}",
+                'dob': date(1980, 1, 1), 'national_id': 100000000 + n, 'sex': n % 2 == 0,
+                'phone_num': 800000000 + n, 'address': 'Jl. Test 1', 'alias': None,
+                'created': datetime(2024, 6, 10, tzinfo=timezone.utc),
+            }
+            for n in range(start, min(rows, start + size))
+        ]
+
+def rss():
+    with open('/proc/self/statm') as statm:
+        return int(statm.read().split()[1]) * PAGE_SIZE
+
+async def drain(chunks):
+    # -> (lines, bytes written, highest RSS growth seen between chunks)
+    lines = written = growth = 0
+    start = rss()
+    async for chunk in chunks:
+        lines += chunk.count(b"\n")
+        written += len(chunk)
+        growth = max(growth, rss() - start)
+    return lines, written, growth
+
+
+def test_export_memory_is_bounded():
+    async def export():
+        return await drain(streaming._ndjson_lines(generated_partitions(EXPORT_ROWS, streaming.STREAM_BATCH_SIZE)))
+
+    lines, written, growth = asyncio.run(export())
+    assert lines == EXPORT_ROWS
+    assert growth < RSS_CEILING < written
+
+
+def test_export_from_server_side_cursor_is_bounded(engine):
+    series = func.generate_series(1, EXPORT_ROWS).table_valued('n').alias('g')
+    stmt = select(series.c.n, func.md5(cast(series.c.n, Text)).label('digest'), func.now().label('exported_at'))
+
+    async def export():
+        try:
+            return await drain(streaming._ndjson_rows(stmt))
+        finally:
+            await async_engine.dispose()
+
+    lines, written, growth = asyncio.run(export())
+    assert lines == EXPORT_ROWS
+    assert growth < RSS_CEILING < written
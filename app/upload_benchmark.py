@@ -0,0 +1,86 @@
+import aiohttp
+import argparse
+import asyncio
+import os
+import statistics
+import time
+
+
+## UPLOAD BENCHMARK
+# Uploads N large attachments concurrently through PUT /emr/medical-note/{note_id}/attachment
+# while probing GET /emr/{record_id}, and reports probe latency before and during the uploads.
+#   python upload_benchmark.py --token <doctor token> --note-id <id> --record-id <id>
+
+BLOCK = os.urandom(1024 * 1024)
+
+
+async def _body(index, size_mb):
+    # Distinct content per upload (so the store cannot dedupe it) without holding it in memory
+    yield index.to_bytes(8, 'big')
+    for _ in range(size_mb):
+        yield BLOCK
+
+async def upload(session, base_url, note_id, index, size_mb):
+    started = time.perf_counter()
+    async with session.put(f"{base_url}/emr/medical-note/{note_id}/attachment", data=_body(index, size_mb)) as response:
+        await response.read()
+        return response.status, time.perf_counter() - started
+
+async def probe(session, base_url, record_id, stop, latencies):
+    while not stop.is_set():
+        started = time.perf_counter()
+        async with session.get(f"{base_url}/emr/{record_id}") as response:
+            await response.read()
+        latencies.append((time.perf_counter() - started) * 1000)
+        await asyncio.sleep(0.05)
+
+def report(label, latencies):
+    if not latencies:
+        print(f"{label}: no samples")
+        return
+    ordered = sorted(latencies)
+    pick = lambda q: ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+    print(f"{label}: n={len(ordered)} p50={statistics.median(ordered):.1f}ms "
+          f"p95={pick(0.95):.1f}ms p99={pick(0.99):.1f}ms max={ordered[-1]:.1f}ms")
+
+async def main(args):
+    headers = {'Authorization': f"Bearer {args.token}"}
+    timeout = aiohttp.ClientTimeout(total=None)
+    async with aiohttp.ClientSession(headers=headers, timeout=timeout) as session:
+        baseline = []
+        stop = asyncio.Event()
+        prober = asyncio.create_task(probe(session, args.base_url, args.record_id, stop, baseline))
+        await asyncio.sleep(args.baseline_seconds)
+        stop.set()
+        await prober
+
+        loaded = []
+        stop = asyncio.Event()
+        prober = asyncio.create_task(probe(session, args.base_url, args.record_id, stop, loaded))
+        started = time.perf_counter()
+        results = await asyncio.gather(*(
+            upload(session, args.base_url, args.note_id, index, args.size_mb)
+            for index in range(args.concurrency)
+        ))
+        elapsed = time.perf_counter() - started
+        stop.set()
+        await prober
+
+    failed = [status for status, _ in results if status != 200]
+    total_mb = args.concurrency * args.size_mb
+    print(f"uploads: {args.concurrency} x {args.size_mb}MB in {elapsed:.1f}s "
+          f"({total_mb / elapsed:.0f} MB/s), {len(failed)} failed {failed[:5]}")
+    report("GET /emr/{record_id} idle", baseline)
+    report("GET /emr/{record_id} during uploads", loaded)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Concurrent attachment upload benchmark")
+    parser.add_argument('--base-url', default='http://localhost:8000')
+    parser.add_argument('--token', required=True)
+    parser.add_argument('--note-id', required=True)
+    parser.add_argument('--record-id', required=True)
+    parser.add_argument('--concurrency', type=int, default=50)
+    parser.add_argument('--size-mb', type=int, default=100)
+    parser.add_argument('--baseline-seconds', type=float, default=5)
+    asyncio.run(main(parser.parse_args()))
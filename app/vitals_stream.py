@@ -0,0 +1,184 @@
+from fastapi import HTTPException
+from pydantic import ValidationError
+from sqlalchemy import func, insert, select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from starlette.websockets import WebSocketState
+from database import AsyncSessionLocal
+from dependencies import get_current_user
+from config import settings
+from models import ClinicalEntry, IngestCursor, MedicalRecord, MedicalStaff
+import asyncio
+import change_log
+import orjson
+import patient_summary
+import schema
+import time
+import uuid
+
+
+## STREAMING VITALS INGEST
+# Bedside devices keep one WebSocket open and push readings (schema.VitalsReading: a clinical
+# entry plus a per-device, strictly increasing `seq`). All frames are JSON:
+#   connect  /emr/clinical-entries/stream?device_id=...   (Authorization header or ?token=)
+#   server   {"type": "hello", "last_seq": N}            resend everything after N
+#   device   {reading} or [{reading}, ...]
+#   server   {"type": "ack", "seq": M, "inserted": i, "rejected": [{"seq": s, "error": "..."}]}
+# An ack means every reading up to seq M is committed or rejected for good. Readings are flushed
+# with one insert per VITALS_BATCH_SIZE readings, or VITALS_FLUSH_MS after the first buffered one.
+# The insert and the device's ingest_cursor row go in the same transaction, so resuming from
+# last_seq neither loses nor duplicates readings. At most VITALS_MAX_PENDING readings wait for a
+# flush; past that the socket is not read and TCP flow control pushes back on the device.
+VITALS_BATCH_SIZE = settings.vitals_batch_size
+VITALS_FLUSH_SECONDS = settings.vitals_flush_ms / 1000
+VITALS_MAX_PENDING = settings.vitals_max_pending
+
+# Close codes: 1008 policy violation (auth, duplicate device), 1011 server error (resume later)
+CLOSE_POLICY = 1008
+CLOSE_ERROR = 1011
+
+_STOP = object()
+_FLUSH = object()
+
+# Devices connected to this worker, a second connection would interleave sequence numbers
+active_devices = set()
+
+
+async def authenticate(websocket):
+    # Browsers cannot set headers on a WebSocket, so the token may also come as ?token=
+    authorization = websocket.headers.get('authorization')
+    if authorization is None and 'token' in websocket.query_params:
+        authorization = f"Bearer {websocket.query_params['token']}"
+    try:
+        async with AsyncSessionLocal() as db:
+            return await get_current_user(authorization, db)
+    except HTTPException:
+        return None
+
+async def last_seq(device_id):
+    async with AsyncSessionLocal() as db:
+        return (await db.scalar(select(IngestCursor.last_seq).where(IngestCursor.device_id == device_id))) or 0
+
+def parse(reading, highest):
+    # -> (seq, row to insert, error); readings at or below `highest` were committed already
+    seq = reading.get('seq') if isinstance(reading, dict) else None
+    if not isinstance(seq, int):
+        seq = None
+    if seq is not None and seq <= highest:
+        return seq, None, None
+    try:
+        reading = schema.VitalsReading.model_validate(reading)
+    except ValidationError as e:
+        return seq, None, "; ".join(f"{'.'.join(map(str, err['loc'])) or 'reading'}: {err['msg']}" for err in e.errors())
+    return reading.seq, reading.model_dump(exclude={'seq'}), None
+
+async def _known(db, column, ids):
+    return set((await db.scalars(select(column).where(column.in_(ids)))).all())
+
+async def flush(device_id, batch):
+    rows = [(seq, row) for seq, row, _ in batch if row is not None]
+    rejected = [{"seq": seq, "error": error} for seq, _, error in batch if error is not None]
+    highest = max((seq for seq, _, _ in batch if seq is not None), default=None)
+    entries = []
+
+    async with AsyncSessionLocal() as db:
+        if rows:
+            known_records = await _known(db, MedicalRecord.record_id, {row['record_id'] for _, row in rows})
+            known_staff = await _known(db, MedicalStaff.staff_id, {row['staff_id'] for _, row in rows})
+            for seq, row in rows:
+                if row['record_id'] not in known_records:
+                    rejected.append({"seq": seq, "error": "Medical record not found"})
+                elif row['staff_id'] not in known_staff:
+                    rejected.append({"seq": seq, "error": "Staff not found"})
+                else:
+                    entries.append({"entry_id": uuid.uuid4(), **row})
+            if entries:
+                await db.execute(insert(ClinicalEntry).returning(ClinicalEntry.entry_id), entries)
+                await patient_summary.refresh_records(db, {entry['record_id'] for entry in entries})
+                await change_log.record_many(db, 'clinical_entry', 'insert', [
+                    {'entity_id': entry['entry_id'], 'record_id': entry['record_id']} for entry in entries
+                ])
+
+        if highest is not None:
+            stmt = pg_insert(IngestCursor).values(device_id=device_id, last_seq=highest)
+            stmt = stmt.on_conflict_do_update(
+                index_elements=[IngestCursor.device_id],
+                set_={'last_seq': stmt.excluded.last_seq, 'updated_at': func.now()},
+                where=IngestCursor.last_seq < stmt.excluded.last_seq,
+            )
+            await db.execute(stmt)
+        await db.commit()
+
+    return {"type": "ack", "seq": highest, "inserted": len(entries), "rejected": rejected}
+
+
+async def receive(websocket, pending, highest):
+    # Validates readings and queues them, `put` blocks while VITALS_MAX_PENDING are waiting
+    while True:
+        message = await websocket.receive()
+        if message['type'] == 'websocket.disconnect':
+            return
+        try:
+            readings = orjson.loads(message.get('text') or message.get('bytes') or b'')
+        except orjson.JSONDecodeError as e:
+            await pending.put((None, None, f"Invalid JSON: {e}"))
+            continue
+        for reading in readings if isinstance(readings, list) else [readings]:
+            item = parse(reading, highest)
+            if item[0] is not None:
+                highest = max(highest, item[0])
+            await pending.put(item)
+
+async def flush_loop(websocket, device_id, pending):
+    batch = []
+    deadline = None
+    while True:
+        timeout = None if not batch else max(0, deadline - time.monotonic())
+        try:
+            item = await asyncio.wait_for(pending.get(), timeout)
+        except asyncio.TimeoutError:
+            item = _FLUSH
+
+        if item is _STOP:
+            # The device is gone: commit what arrived, it resumes from the cursor next time
+            if batch:
+                await flush(device_id, batch)
+            return
+        if item is not _FLUSH:
+            if not batch:
+                deadline = time.monotonic() + VITALS_FLUSH_SECONDS
+            batch.append(item)
+        if batch and (item is _FLUSH or len(batch) >= VITALS_BATCH_SIZE):
+            ack = await flush(device_id, batch)
+            batch = []
+            if websocket.client_state == WebSocketState.CONNECTED:
+                await websocket.send_text(orjson.dumps(ack).decode())
+
+async def ingest(websocket, device_id):
+    # Call after authenticate(), before the connection is accepted
+    if device_id in active_devices:
+        await websocket.close(code=CLOSE_POLICY, reason="Device already connected")
+        return
+    active_devices.add(device_id)
+    try:
+        resume_after = await last_seq(device_id)
+        await websocket.accept()
+        await websocket.send_text(orjson.dumps({"type": "hello", "last_seq": resume_after}).decode())
+
+        pending = asyncio.Queue(maxsize=VITALS_MAX_PENDING)
+        receiver = asyncio.create_task(receive(websocket, pending, resume_after))
+        flusher = asyncio.create_task(flush_loop(websocket, device_id, pending))
+        await asyncio.wait({receiver, flusher}, return_when=asyncio.FIRST_COMPLETED)
+
+        if flusher.done():
+            # A flush failed. Nothing past the last ack is committed, the device reconnects and resends
+            receiver.cancel()
+            if websocket.client_state == WebSocketState.CONNECTED:
+                await websocket.close(code=CLOSE_ERROR, reason="Ingest failed, reconnect and resume")
+            flusher.result()
+        else:
+            # Device disconnected: the flusher commits what is queued and stops
+            await pending.put(_STOP)
+            await flusher
+            receiver.result()
+    finally:
+        active_devices.discard(device_id)